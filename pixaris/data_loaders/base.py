@@ -1,10 +1,227 @@
 from abc import abstractmethod
-from typing import Iterable
+import copy
+import hashlib
+import os
+from typing import Iterable, Iterator, List
+from pixaris.data_loaders.index import (
+    build_dataset_index,
+    check_image_names,
+    load_dataset_index,
+    refresh_dataset_index,
+    save_dataset_index,
+)
+from pixaris.data_loaders.utils import PrefetchIterator, load_item_images
 
 
 class DatasetLoader:
     """When implementing a new Dataset Loader, inherit from this one and implement all the abstract methods."""
 
+    # views selected with sample, take and shard, applied in order
+    _selection = ()
+
     @abstractmethod
     def load_dataset(self) -> Iterable[dict[str, any]]:
         pass
+
+    def iter_dataset(
+        self,
+        prefetch: int = 8,
+        workers: int = 1,
+        max_resolution: int = None,
+        pre_encode: bool = False,
+    ) -> Iterator[dict[str, any]]:
+        """
+        Yields the items of the dataset one by one, in the same order and format as load_dataset.
+        Override it to load items lazily, this default loads the whole dataset first.
+
+        :param prefetch: The maximum number of items loaded ahead of the consumer. Defaults to 8.
+        :type prefetch: int
+        :param workers: The number of threads decoding items in parallel. Defaults to 1.
+        :type workers: int
+        :param max_resolution: If set, images with a longer side are scaled down to it. Defaults to None.
+        :type max_resolution: int, optional
+        :param pre_encode: Whether to store the encoded bytes of every image under "encoded_image". Defaults to False.
+        :type pre_encode: bool
+        :return: An iterator over the items. len() of it is the number of items, if known.
+        :rtype: Iterator[dict[str, any]]
+        """
+        # loaders that know the image names select them before loading, this default only can afterwards
+        dataset = list(self.load_dataset())
+        if self._selection:
+            selected = set(
+                self._select_image_names([str(i) for i in range(len(dataset))])
+            )
+            dataset = [item for i, item in enumerate(dataset) if str(i) in selected]
+        return PrefetchIterator(
+            dataset,
+            prefetch,
+            total=len(dataset),
+            transform=lambda item: load_item_images(item, max_resolution, pre_encode),
+            workers=workers,
+        )
+
+    def _with_selection(self, selection: tuple) -> "DatasetLoader":
+        view = copy.copy(self)
+        view._selection = self._selection + (selection,)
+        return view
+
+    def sample(self, fraction: float, seed: int = 0) -> "DatasetLoader":
+        """
+        A view of a stable sample of the dataset. Whether an item is part of the sample only depends on its name and
+        the seed, so the sample does not change when other items are added and a smaller fraction is a subset of
+        a larger one.
+
+        :param fraction: The expected share of items in the sample, between 0 and 1.
+        :type fraction: float
+        :param seed: Selects a different sample of the same size. Defaults to 0.
+        :type seed: int
+        :raises ValueError: If fraction is not between 0 and 1.
+        :return: A copy of the loader that only loads the sampled items.
+        :rtype: DatasetLoader
+        """
+        if not 0 <= fraction <= 1:
+            raise ValueError("fraction has to be between 0 and 1.")
+        return self._with_selection(("sample", fraction, seed))
+
+    def take(self, n: int) -> "DatasetLoader":
+        """
+        A view of the first n items of the dataset, e.g. for a quick smoke run.
+
+        :param n: The number of items.
+        :type n: int
+        :raises ValueError: If n is negative.
+        :return: A copy of the loader that only loads the first n items.
+        :rtype: DatasetLoader
+        """
+        if n < 0:
+            raise ValueError("n has to be at least 0.")
+        return self._with_selection(("take", n))
+
+    def shard(self, index: int, count: int) -> "DatasetLoader":
+        """
+        A view of every count-th item of the dataset, starting at index. The shards 0 to count - 1 are disjoint and
+        together contain every item, so they can be processed by count workers. The shards of a sharded run, see
+        pixaris.orchestration.base.generate_images_for_shard, load their items through views like these.
+
+        :param index: The index of the shard, from 0 to count - 1.
+        :type index: int
+        :param count: The number of shards.
+        :type count: int
+        :raises ValueError: If index is not between 0 and count - 1.
+        :return: A copy of the loader that only loads the items of the shard.
+        :rtype: DatasetLoader
+        """
+        if not 0 <= index < count:
+            raise ValueError("index has to be between 0 and count - 1.")
+        return self._with_selection(("shard", index, count))
+
+    def _shards(self, indices: List[int], count: int) -> "DatasetLoader":
+        """
+        A view of the shards with the given indices, like the union of their shard views but loaded at once.
+
+        :param indices: The indices of the shards, from 0 to count - 1.
+        :type indices: List[int]
+        :param count: The number of shards.
+        :type count: int
+        :return: A copy of the loader that only loads the items of the shards.
+        :rtype: DatasetLoader
+        """
+        return self._with_selection(("shards", frozenset(indices), count))
+
+    def _select_image_names(self, image_names: List[str]) -> List[str]:
+        """
+        Applies the views of this loader to the sorted image names of the whole dataset.
+
+        :param image_names: The image names of the whole dataset.
+        :type image_names: List[str]
+        :return: The selected image names, in the same order.
+        :rtype: List[str]
+        """
+        for selection in self._selection:
+            if selection[0] == "sample":
+                _, fraction, seed = selection
+                image_names = [
+                    name
+                    for name in image_names
+                    if int.from_bytes(
+                        hashlib.sha256(f"{seed}:{name}".encode("utf-8")).digest()[:8],
+                        "big",
+                    )
+                    < fraction * 2**64
+                ]
+            elif selection[0] == "take":
+                image_names = image_names[: selection[1]]
+            elif selection[0] == "shard":
+                image_names = image_names[selection[1] :: selection[2]]
+            elif selection[0] == "shards":
+                _, indices, count = selection
+                image_names = [
+                    name
+                    for position, name in enumerate(image_names)
+                    if position % count in indices
+                ]
+        return image_names
+
+    def _check_dataset_image_names(
+        self, dataset_dir: str, image_dirs: List[str], index_path: str = None
+    ) -> List[str]:
+        """
+        Retrieves the names of the images in a dataset in the directory layout and checks that they are the same in
+        each image directory. With an index_path, the result is read from a persisted index as long as no image
+        directory changed, otherwise the index is rebuilt. Images whose size or modification time changed are
+        hashed again. The index is kept in self.dataset_index.
+
+        :param dataset_dir: The directory of the dataset.
+        :type dataset_dir: str
+        :param image_dirs: The image directories of the dataset.
+        :type image_dirs: List[str]
+        :param index_path: Where to persist the index of the dataset. Defaults to None, no index.
+        :type index_path: str, optional
+        :raises ValueError: If the names of the images in each image directory are not the same.
+        :return: The sorted names of the images.
+        :rtype: List[str]
+        """
+        if index_path is None:
+            return check_image_names(
+                {
+                    image_dir: [
+                        name
+                        for name in os.listdir(os.path.join(dataset_dir, image_dir))
+                        if name != ".DS_Store"
+                    ]
+                    for image_dir in image_dirs
+                }
+            )
+        index = load_dataset_index(index_path, dataset_dir, image_dirs)
+        if index is None:
+            index = build_dataset_index(dataset_dir, image_dirs)
+            save_dataset_index(index_path, index)
+        elif refresh_dataset_index(index, dataset_dir):
+            save_dataset_index(index_path, index)
+        self.dataset_index = index
+        return [item["name"] for item in index["items"]]
+
+    def _indexed_content_hash(self, image_dir: str, image_name: str) -> str | None:
+        """
+        The sha256 of an image from the dataset index, if the loader keeps one.
+
+        :param image_dir: The image directory.
+        :type image_dir: str
+        :param image_name: The name of the image.
+        :type image_name: str
+        :return: The hex digest or None.
+        :rtype: str | None
+        """
+        index = getattr(self, "dataset_index", None)
+        if index is None:
+            return None
+        if getattr(self, "_content_hashes", (None,))[0] is not index:
+            self._content_hashes = (
+                index,
+                {
+                    (image_dir, item["name"]): image["sha256"]
+                    for item in index["items"]
+                    for image_dir, image in item["images"].items()
+                },
+            )
+        return self._content_hashes[1].get((image_dir, image_name))
@@ -1,16 +1,84 @@
+import base64
+from collections import deque
+from concurrent.futures import ProcessPoolExecutor, ThreadPoolExecutor
+import google_crc32c
+import json
 import os
 from pathlib import Path
 import shutil
+import time
 from google.cloud import storage
 from google.cloud.storage import transfer_manager
 from pixaris.data_loaders.base import DatasetLoader
-from typing import List
+from pixaris.data_loaders.packed import PackedDataset, is_packed_dataset
+from pixaris.data_loaders.thumbnails import ThumbnailCache
+from pixaris.data_loaders.utils import PrefetchIterator, load_item_images
+from typing import Iterable, Iterator, List, Tuple
 from PIL import Image
 
+# files larger than this are transferred in parallel chunks
+CHUNKED_TRANSFER_THRESHOLD = 128 * 1024 * 1024
+CHUNK_SIZE = 32 * 1024 * 1024
+MAX_UPLOAD_WORKERS = 32
+
+
+def _file_crc32c(path: str) -> str:
+    """
+    The crc32c of a file, base64 encoded like the crc32c of a blob.
+
+    :param path: The path of the file.
+    :type path: str
+    :return: The encoded checksum.
+    :rtype: str
+    """
+    checksum = google_crc32c.Checksum()
+    with open(path, "rb") as f:
+        for chunk in iter(lambda: f.read(1024 * 1024), b""):
+            checksum.update(chunk)
+    return base64.b64encode(checksum.digest()).decode("utf-8")
+
+
+def _download_blob(bucket, blob_name: str, size: int, path: str):
+    """
+    Downloads a blob to a file, in parallel chunks if it is large.
+
+    :param bucket: The bucket of the blob.
+    :type bucket: google.cloud.storage.Bucket
+    :param blob_name: The name of the blob.
+    :type blob_name: str
+    :param size: The size of the blob in bytes, as listed.
+    :type size: int
+    :param path: The local path to download to.
+    :type path: str
+    """
+    os.makedirs(os.path.dirname(path), exist_ok=True)
+    blob = bucket.blob(blob_name)
+    if size is not None and size > CHUNKED_TRANSFER_THRESHOLD:
+        transfer_manager.download_chunks_concurrently(
+            blob, path, chunk_size=CHUNK_SIZE, worker_type=transfer_manager.THREAD
+        )
+    else:
+        blob.download_to_filename(path)
+
+
+# one bucket per worker process, the client is not picklable
+_process_buckets = {}
+
+
+def _download_blob_in_process(
+    gcp_project_id: str, bucket_name: str, blob_name: str, size: int, path: str
+):
+    if bucket_name not in _process_buckets:
+        _process_buckets[bucket_name] = storage.Client(project=gcp_project_id).bucket(
+            bucket_name
+        )
+    _download_blob(_process_buckets[bucket_name], blob_name, size, path)
+
 
 class GCPDatasetLoader(DatasetLoader):
     """
     GCPDatasetLoader is a class for loading datasets from a Google Cloud Storage bucket. Upon initialisation, the dataset is downloaded to a local directory.
+    Packed datasets created with pixaris.data_loaders.packed.pack_dataset are downloaded as a few shards and read directly.
 
     :param gcp_project_id: The Google Cloud Platform project ID.
     :type gcp_project_id: str
@@ -22,8 +90,27 @@ class GCPDatasetLoader(DatasetLoader):
     :type dataset: str
     :param eval_dir_local: The local directory where evaluation images will be saved. Defaults to "local_experiment_inputs".
     :type eval_dir_local: str
-    :param force_download: Whether to force download the images even if they already exist locally. Defaults to True.
+    :param force_download: Whether to force download the images even if they already exist locally. Views (see sample,
+      take and shard) share the local copy, they download their images again instead of deleting it. Defaults to True.
     :type force_download: bool
+    :param sync: Whether to sync the local copy with the bucket instead. Only new or changed blobs are downloaded and
+      local files that are not in the bucket anymore are deleted, based on a manifest next to the dataset.
+      Overrides force_download. Defaults to False.
+    :type sync: bool
+    :param use_index: Whether to persist an index of the dataset with the sizes and content hashes of its images next
+      to it, so large datasets are checked without listing every image directory. The index is rebuilt when an image
+      directory changes, e.g. after a download, and images whose size or modification time changed are hashed
+      again. Defaults to False.
+    :type use_index: bool
+    :param thumbnail_sizes: If set, e.g. to (256, 512, 1024), iter_dataset with a max_resolution reads cached
+      downscaled variants of the images instead of decoding the originals. The variants are built on first use and
+      stored by content hash next to the dataset. Defaults to None.
+    :type thumbnail_sizes: Tuple[int], optional
+    :param download_workers: The number of parallel downloads. Defaults to 8.
+    :type download_workers: int
+    :param download_worker_type: "thread" or "process". Processes avoid the GIL when downloading many small files
+      with checksums. Defaults to "thread".
+    :type download_worker_type: str
     """
 
     def __init__(
@@ -34,6 +121,11 @@ class GCPDatasetLoader(DatasetLoader):
         dataset: str,
         eval_dir_local: str = "local_experiment_inputs",
         force_download: bool = True,
+        sync: bool = False,
+        use_index: bool = False,
+        thumbnail_sizes: Tuple[int] = None,
+        download_workers: int = 8,
+        download_worker_type: str = transfer_manager.THREAD,
     ):
         self.gcp_project_id = gcp_project_id
         self.bucket_name = gcp_pixaris_bucket_name
@@ -42,8 +134,16 @@ class GCPDatasetLoader(DatasetLoader):
         self.eval_dir_local = eval_dir_local
         os.makedirs(self.eval_dir_local, exist_ok=True)
         self.force_download = force_download
+        self.sync = sync
+        self.use_index = use_index
+        self.dataset_index = None
+        self.thumbnail_sizes = thumbnail_sizes
+        self.download_workers = download_workers
+        self.download_worker_type = download_worker_type
         self.bucket = None
         self.image_dirs = None
+        self.packed = None
+        self.remote_image_names = None
 
     def _download_dataset(self):
         """
@@ -51,22 +151,32 @@ class GCPDatasetLoader(DatasetLoader):
         """
         storage_client = storage.Client(project=self.gcp_project_id)
         self.bucket = storage_client.get_bucket(self.bucket_name)
-        if self.force_download:
-            self._verify_bucket_folder_exists()
-
-        # only download if the local directory does not exist or is empty
-        if self._decide_if_download_needed():
+        if self.sync:
+            self._sync_bucket_dir()
+        elif self._selection:
+            # views share the local copy with other views and the whole dataset, so the bucket is always listed to
+            # apply the views to every image and to download the selected blobs that are missing
             self._download_bucket_dir()
-
-        self.image_dirs = [
-            name
-            for name in os.listdir(
-                os.path.join(self.eval_dir_local, self.project, self.dataset)
-            )
-            if os.path.isdir(
-                os.path.join(self.eval_dir_local, self.project, self.dataset, name)
-            )
-        ]
+        else:
+            if self.force_download:
+                self._verify_bucket_folder_exists()
+
+            # only download if the local directory does not exist or is empty
+            if self._decide_if_download_needed():
+                self._download_bucket_dir()
+
+        dataset_dir = os.path.join(self.eval_dir_local, self.project, self.dataset)
+        # packed datasets list their image directories in the index
+        self.packed = None
+        if is_packed_dataset(dataset_dir):
+            self.packed = PackedDataset(dataset_dir)
+            self.image_dirs = self.packed.image_dirs
+        else:
+            self.image_dirs = [
+                name
+                for name in os.listdir(dataset_dir)
+                if os.path.isdir(os.path.join(dataset_dir, name))
+            ]
 
     def _verify_bucket_folder_exists(self):
         """
@@ -74,10 +184,11 @@ class GCPDatasetLoader(DatasetLoader):
 
         :raises: ValueError: If no files are found in the specified directory in the bucket.
         """
-        # List the blobs in the bucket. If no blobs are found, raise an error.
+        # one blob is enough, the pipelined download lists the folder while it downloads
         blobs = list(
             self.bucket.list_blobs(
-                prefix=f"experiment_inputs/{self.project}/{self.dataset}/"
+                prefix=f"experiment_inputs/{self.project}/{self.dataset}/",
+                max_results=1,
             )
         )
         if not blobs:
@@ -88,6 +199,7 @@ class GCPDatasetLoader(DatasetLoader):
     def _decide_if_download_needed(self):
         """
         Decides if the download is necessary based on the force_download attribute and existence of the local directory.
+        A local directory that views only downloaded some items of is downloaded completely.
         """
         # delete the local directory if force_download is True
         if self.force_download:
@@ -97,10 +209,16 @@ class GCPDatasetLoader(DatasetLoader):
                 shutil.rmtree(
                     os.path.join(self.eval_dir_local, self.project, self.dataset)
                 )
+            if os.path.exists(self._partial_marker_path()):
+                os.remove(self._partial_marker_path())
 
         # Create the local directory if it does not exist
         local_dir = os.path.join(self.eval_dir_local, self.project, self.dataset)
-        if os.path.exists(local_dir) and len(os.listdir(local_dir)) > 0:
+        if (
+            os.path.exists(local_dir)
+            and len(os.listdir(local_dir)) > 0
+            and not os.path.exists(self._partial_marker_path())
+        ):
             return False
         else:
             os.makedirs(local_dir, exist_ok=True)
@@ -109,36 +227,290 @@ class GCPDatasetLoader(DatasetLoader):
     def _download_bucket_dir(self):
         """
         Downloads all files from a specified directory in a Google Cloud Storage bucket to a local directory.
+        The listing is consumed page by page, so downloads start while the rest of the directory is listed.
+        Views only download the blobs of their items, and only those missing locally unless force_download is set.
+        The local directory is then marked as partial, so it is completed when the whole dataset is loaded.
+
+        :raises: ValueError: If a view finds no files in the specified directory in the bucket.
         """
-        # Download the blobs to the local directory
-        blobs = self.bucket.list_blobs(
-            prefix=f"experiment_inputs/{self.project}/{self.dataset}/"
-        )
-        blob_names = [
-            blob.name for blob in blobs if not blob.name.endswith("/")
-        ]  # exclude directories
-
-        # remove experiment_inputs/ from the blob names
-        blob_names = [name.replace("experiment_inputs/", "") for name in blob_names]
-
-        results = transfer_manager.download_many_to_path(
-            self.bucket,
-            blob_names,
-            blob_name_prefix="experiment_inputs/",
-            destination_directory=os.path.join(self.eval_dir_local),
-            worker_type=transfer_manager.THREAD,
+        prefix = f"experiment_inputs/{self.project}/{self.dataset}/"
+        local_dir = os.path.join(self.eval_dir_local, self.project, self.dataset)
+        blobs = (
+            (blob.name, blob.size)
+            for blob in self.bucket.list_blobs(prefix=prefix)
+            if not blob.name.endswith("/")  # exclude directories
         )
-        # The results list is either `None` or an exception for each blob.
-        for name, result in zip(blob_names, results):
-            if isinstance(result, Exception):
-                print("Failed to download {} due to exception: {}".format(name, result))
+        if self._selection:
+            # the views need the names of the whole dataset
+            blobs = list(blobs)
+            if not blobs:
+                raise ValueError(
+                    f"No images found in bucket or bucket does not exist. Please double-check gs://{self.bucket_name}/{prefix}."
+                )
+            if not (
+                os.path.isdir(local_dir)
+                and os.listdir(local_dir)
+                and not os.path.exists(self._partial_marker_path())
+            ):
+                os.makedirs(local_dir, exist_ok=True)
+                with open(self._partial_marker_path(), "w"):
+                    pass
+            selected = set(self._select_blob_names([name for name, _ in blobs], prefix))
+            blobs = [
+                (name, size)
+                for name, size in blobs
+                if name in selected
+                and (
+                    self.force_download
+                    or not os.path.isfile(
+                        os.path.join(local_dir, *name[len(prefix) :].split("/"))
+                    )
+                )
+            ]
+        else:
+            self.remote_image_names = None
+        failed = self._download_blobs(blobs, prefix, local_dir)
+        if not self._selection and not failed:
+            # the whole dataset is local now
+            if os.path.exists(self._partial_marker_path()):
+                os.remove(self._partial_marker_path())
+
+    def _download_blobs(
+        self, blobs: Iterable[tuple[str, int]], prefix: str, local_dir: str
+    ) -> set[str]:
+        """
+        Downloads blobs on download_workers workers while they are consumed from blobs. At most twice as many
+        downloads as workers are pending, so a listing of any length is downloaded with bounded memory.
+        Prints a progress summary every 10 seconds and failed downloads.
+
+        :param blobs: The names and sizes of the blobs.
+        :type blobs: Iterable[tuple[str, int]]
+        :param prefix: The prefix of the blob names that is replaced by local_dir.
+        :type prefix: str
+        :param local_dir: The directory to download to.
+        :type local_dir: str
+        :return: The names of the blobs that failed, relative to prefix.
+        :rtype: set[str]
+        """
+        if self.download_worker_type == transfer_manager.PROCESS:
+            executor = ProcessPoolExecutor(max_workers=self.download_workers)
+
+            def submit(blob_name, size, path):
+                return executor.submit(
+                    _download_blob_in_process,
+                    self.gcp_project_id,
+                    self.bucket_name,
+                    blob_name,
+                    size,
+                    path,
+                )
+        else:
+            executor = ThreadPoolExecutor(max_workers=self.download_workers)
+
+            def submit(blob_name, size, path):
+                return executor.submit(
+                    _download_blob, self.bucket, blob_name, size, path
+                )
+
+        start = time.monotonic()
+        last_report = start
+        pending = deque()
+        failed = set()
+        downloaded = {"files": 0, "bytes": 0}
+
+        def collect():
+            nonlocal last_report
+            name, size, future = pending.popleft()
+            try:
+                future.result()
+            except Exception as e:
+                print(f"Failed to download {name} due to exception: {e}")
+                failed.add(name)
             else:
+                downloaded["files"] += 1
+                downloaded["bytes"] += size or 0
+            if time.monotonic() - last_report >= 10:
+                last_report = time.monotonic()
                 print(
-                    "Downloaded {} to {}.".format(
-                        name, os.path.join(self.eval_dir_local, *name.split("/"))
-                    )
+                    f"Downloaded {downloaded['files']} files ({downloaded['bytes'] / 1e6:.1f} MB) so far."
                 )
 
+        with executor:
+            for blob_name, size in blobs:
+                name = blob_name[len(prefix) :]
+                path = os.path.join(local_dir, *name.split("/"))
+                pending.append((name, size, submit(blob_name, size, path)))
+                while len(pending) >= 2 * self.download_workers:
+                    collect()
+            while pending:
+                collect()
+
+        print(
+            f"Downloaded {downloaded['files']} files ({downloaded['bytes'] / 1e6:.1f} MB) from "
+            f"gs://{self.bucket_name}/{prefix} to {local_dir} in {time.monotonic() - start:.1f} s, "
+            f"{len(failed)} failed."
+        )
+        return failed
+
+    def _select_blob_names(self, blob_names: List[str], prefix: str = "") -> List[str]:
+        """
+        Applies the views of the loader (see sample, take and shard) to the blobs of the dataset, so only the images
+        of selected items are downloaded. Other blobs, e.g. of a packed dataset, are always kept. Remembers the image
+        names of the whole dataset in the bucket, the views are applied to those.
+
+        :param blob_names: The names of the blobs of the dataset.
+        :type blob_names: List[str]
+        :param prefix: The prefix of the dataset in the blob names. Defaults to "".
+        :type prefix: str
+        :return: The blob names to download.
+        :rtype: List[str]
+        """
+        image_name_of = {
+            blob_name: blob_name[len(prefix) :].split("/")[1]
+            for blob_name in blob_names
+            if blob_name[len(prefix) :].count("/") == 1
+        }
+        self.remote_image_names = sorted(set(image_name_of.values()) - {".DS_Store"})
+        if not self._selection:
+            return blob_names
+        selected = set(self._select_image_names(self.remote_image_names))
+        return [
+            blob_name
+            for blob_name in blob_names
+            if blob_name not in image_name_of or image_name_of[blob_name] in selected
+        ]
+
+    def _selected_image_names(self) -> List[str]:
+        """
+        The image names of the selected items. The views are applied to the image names in the bucket if they were
+        listed, a partial local copy would give different shards.
+
+        :return: The selected image names that are available locally.
+        :rtype: List[str]
+        """
+        image_names = self._retrieve_and_check_dataset_image_names()
+        if not self._selection:
+            return image_names
+        available = set(image_names)
+        return [
+            name
+            for name in self._select_image_names(self.remote_image_names or image_names)
+            if name in available
+        ]
+
+    def _partial_marker_path(self) -> str:
+        """
+        Path of the marker of a local copy that views only downloaded some items of, next to the dataset.
+        """
+        return os.path.join(
+            self.eval_dir_local, self.project, f".{self.dataset}.partial"
+        )
+
+    def _manifest_path(self) -> str:
+        """
+        Path of the manifest of the synced blobs, next to the dataset so it is not mistaken for an image directory.
+        """
+        return os.path.join(
+            self.eval_dir_local, self.project, f".{self.dataset}.manifest.json"
+        )
+
+    def _load_manifest(self) -> dict[str, dict]:
+        """
+        Loads the manifest of the last sync.
+
+        :return: The synced blobs by name relative to the dataset, empty if there is no manifest for this bucket.
+        :rtype: dict[str, dict]
+        """
+        try:
+            with open(self._manifest_path(), "r") as f:
+                manifest = json.load(f)
+        except (FileNotFoundError, json.JSONDecodeError):
+            return {}
+        if manifest.get("bucket") != self.bucket_name:
+            return {}
+        return manifest["blobs"]
+
+    def _save_manifest(self, blobs: dict[str, dict]):
+        """
+        Writes the manifest atomically, an interrupted sync leaves the previous one.
+        """
+        manifest_path = self._manifest_path()
+        with open(f"{manifest_path}.tmp", "w") as f:
+            json.dump({"bucket": self.bucket_name, "blobs": blobs}, f, indent=1)
+        os.replace(f"{manifest_path}.tmp", manifest_path)
+
+    def _sync_bucket_dir(self):
+        """
+        Syncs the local dataset directory with the bucket. Blobs whose checksum or size differs from the manifest, or
+        whose local file is missing, are downloaded. Local files that are not in the bucket are deleted.
+
+        :raises: ValueError: If no files are found in the specified directory in the bucket.
+        """
+        prefix = f"experiment_inputs/{self.project}/{self.dataset}/"
+        remote_blobs = {
+            blob.name[len(prefix) :]: {
+                "generation": blob.generation,
+                "size": blob.size,
+                "md5_hash": blob.md5_hash,
+                "crc32c": blob.crc32c,
+            }
+            for blob in self.bucket.list_blobs(prefix=prefix)
+            if not blob.name.endswith("/")
+        }
+        if not remote_blobs:
+            raise ValueError(
+                f"No images found in bucket or bucket does not exist. Please double-check gs://{self.bucket_name}/{prefix}."
+            )
+
+        local_dir = os.path.join(self.eval_dir_local, self.project, self.dataset)
+        os.makedirs(local_dir, exist_ok=True)
+        manifest = self._load_manifest()
+
+        def is_current(name: str) -> bool:
+            local_path = os.path.join(local_dir, *name.split("/"))
+            known = manifest.get(name)
+            # a new generation with the same content, e.g. a re-upload, does not need a download
+            return (
+                known is not None
+                and os.path.isfile(local_path)
+                and os.path.getsize(local_path) == remote_blobs[name]["size"]
+                and known["crc32c"] == remote_blobs[name]["crc32c"]
+                and known["md5_hash"] == remote_blobs[name]["md5_hash"]
+            )
+
+        changed = [
+            name
+            for name in self._select_blob_names(list(remote_blobs))
+            if not is_current(name)
+        ]
+
+        removed = 0
+        for root, _, files in os.walk(local_dir, topdown=False):
+            for file in files:
+                name = os.path.relpath(os.path.join(root, file), local_dir)
+                if name.replace(os.sep, "/") not in remote_blobs:
+                    os.remove(os.path.join(root, file))
+                    removed += 1
+            if root != local_dir and not os.listdir(root):
+                os.rmdir(root)
+
+        failed = set()
+        if changed:
+            failed = self._download_blobs(
+                ((prefix + name, remote_blobs[name]["size"]) for name in changed),
+                prefix,
+                local_dir,
+            )
+
+        # failed blobs are left out of the manifest, so the next sync tries them again
+        self._save_manifest(
+            {name: blob for name, blob in remote_blobs.items() if name not in failed}
+        )
+        print(
+            f"Synced gs://{self.bucket_name}/{prefix}: {len(changed) - len(failed)} downloaded, "
+            f"{len(remote_blobs) - len(changed)} unchanged, {removed} removed, {len(failed)} failed."
+        )
+
     def _retrieve_and_check_dataset_image_names(self):
         """
         Retrieves the names of the images in the evaluation set and checks if they are the same in each image directory.
@@ -147,32 +519,70 @@ class GCPDatasetLoader(DatasetLoader):
         :rtype: List[str]
         :raises: ValueError: If the names of the images in each image directory are not the same.
         """
+        dataset_dir = os.path.join(self.eval_dir_local, self.project, self.dataset)
+        if is_packed_dataset(dataset_dir):
+            self.packed = PackedDataset(dataset_dir)
+            self.image_dirs = self.packed.image_dirs
+            return self.packed.image_names()
+        self.packed = None
         self.image_dirs = [
-            file
-            for file in os.listdir(
-                os.path.join(self.eval_dir_local, self.project, self.dataset)
-            )
-            if file != ".DS_Store"
+            file for file in os.listdir(dataset_dir) if file != ".DS_Store"
         ]
-        basis_names = os.listdir(
+        index_path = (
             os.path.join(
-                self.eval_dir_local, self.project, self.dataset, self.image_dirs[0]
+                self.eval_dir_local, self.project, f".{self.dataset}.index.json"
             )
+            if self.use_index
+            else None
         )
-        basis_names = [name for name in basis_names if name != ".DS_Store"]
+        return self._check_dataset_image_names(dataset_dir, self.image_dirs, index_path)
+
+    def _load_item(
+        self, image_name: str, max_resolution: int = None
+    ) -> dict[str, List[dict[str, Image.Image]]]:
+        """
+        Opens the images with the given name in every image directory.
+
+        :param image_name: The name of the image.
+        :type image_name: str
+        :param max_resolution: The maximum side length needed. Opens cached downscaled variants of the images if
+          thumbnail_sizes is set. Defaults to None.
+        :type max_resolution: int, optional
+        :return: A dict with the key "pillow_images", see load_dataset.
+        :rtype: dict[str, List[dict[str, Image.Image]]]
+        """
+        if self.packed is not None:
+            return self.packed.load_item(image_name)
+        pillow_images = []
         for image_dir in self.image_dirs:
-            image_names = os.listdir(
-                os.path.join(self.eval_dir_local, self.project, self.dataset, image_dir)
+            image_path = os.path.join(
+                self.eval_dir_local,
+                self.project,
+                self.dataset,
+                image_dir,
+                image_name,
             )
-            image_names = [name for name in image_names if name != ".DS_Store"]
-
-            if basis_names != image_names:
-                raise ValueError(
-                    "The names of the images in each image directory should be the same. {} does not match {}.".format(
-                        self.image_dirs[0], image_dir
-                    )
+            # Load the image using PIL
+            if self.thumbnail_sizes and max_resolution is not None:
+                pillow_image = ThumbnailCache(
+                    os.path.join(
+                        self.eval_dir_local, self.project, f".{self.dataset}.thumbnails"
+                    ),
+                    self.thumbnail_sizes,
+                ).open(
+                    image_path,
+                    max_resolution,
+                    self._indexed_content_hash(image_dir, image_name),
                 )
-        return basis_names
+            else:
+                pillow_image = Image.open(image_path)
+            pillow_images.append(
+                {
+                    "node_name": f"Load {image_dir.capitalize()} Image",
+                    "pillow_image": pillow_image,
+                }
+            )
+        return {"pillow_images": pillow_images}
 
     def load_dataset(
         self,
@@ -187,38 +597,58 @@ class GCPDatasetLoader(DatasetLoader):
         :rtype: List[dict[str, List[dict[str, Image.Image]]]]:
         """
         self._download_dataset()
-        image_names = self._retrieve_and_check_dataset_image_names()
+        image_names = self._selected_image_names()
+        return [self._load_item(image_name) for image_name in image_names]
 
-        dataset = []
-        for image_name in image_names:
-            pillow_images = []
-            for image_dir in self.image_dirs:
-                image_path = os.path.join(
-                    self.eval_dir_local,
-                    self.project,
-                    self.dataset,
-                    image_dir,
-                    image_name,
-                )
-                # Load the image using PIL
-                pillow_image = Image.open(image_path)
-                pillow_images.append(
-                    {
-                        "node_name": f"Load {image_dir.capitalize()} Image",
-                        "pillow_image": pillow_image,
-                    }
-                )
-            dataset.append({"pillow_images": pillow_images})
-        return dataset
+    def iter_dataset(
+        self,
+        prefetch: int = 8,
+        workers: int = 1,
+        max_resolution: int = None,
+        pre_encode: bool = False,
+    ) -> Iterator[dict[str, List[dict[str, Image.Image]]]]:
+        """
+        Downloads the evaluation set and yields its items one by one, like load_dataset. A background thread decodes
+        at most prefetch items ahead, their files are closed once decoded, so only a few files are open at a time.
+        With more workers, items are opened, decoded, resized and encoded in parallel.
+
+        :param prefetch: The maximum number of items loaded ahead of the consumer. Defaults to 8.
+        :type prefetch: int
+        :param workers: The number of threads decoding items in parallel. Defaults to 1.
+        :type workers: int
+        :param max_resolution: If set, images with a longer side are scaled down to it, keeping the aspect ratio.
+          Defaults to None.
+        :type max_resolution: int, optional
+        :param pre_encode: Whether to store the encoded bytes of every image under "encoded_image" next to
+          "pillow_image", so generators do not encode it on the critical path. Defaults to False.
+        :type pre_encode: bool
+        :return: An iterator over the items. len() of it is the number of items.
+        :rtype: Iterator[dict[str, List[dict[str, Image.Image]]]]
+        """
+        self._download_dataset()
+        image_names = self._selected_image_names()
+        return PrefetchIterator(
+            image_names,
+            prefetch,
+            total=len(image_names),
+            transform=lambda name: load_item_images(
+                self._load_item(name, max_resolution), max_resolution, pre_encode
+            ),
+            workers=workers,
+        )
 
-    def _upload_dir_to_bucket(self, bucket_prefix: str, workers=8):
+    def _upload_dir_to_bucket(self, bucket_prefix: str, workers: int = None):
         """takes a project and uploads its contents to a GCP bucket.
-        project and bucket are set in the constructor.
+        project and bucket are set in the constructor. Files whose blob already has the same crc32c are skipped,
+        large files are uploaded in parallel chunks.
 
         :param bucket_prefix: The prefix under which the files will be uploaded in the bucket.
         :type bucket_prefix: str
-        :param workers: The number of worker threads to use for the upload. Defaults to 8.
+        :param workers: The number of worker threads to use for the upload. Defaults to None, one per file up to
+          MAX_UPLOAD_WORKERS.
         :type workers: int, optional
+        :return: The relative paths of the files that failed to upload.
+        :rtype: list[str]
         """
         storage_client = storage.Client(project=self.gcp_project_id)
         bucket = storage_client.get_bucket(self.bucket_name)
@@ -237,30 +667,65 @@ class GCPDatasetLoader(DatasetLoader):
             path for path in file_paths if not str(path).endswith(".DS_Store")
         ]
 
-        # These paths are relative to the current working directory. Next, make them
-        # relative to `directory`
-        relative_paths = [path.relative_to(source_dir) for path in file_paths]
+        # Blob names use forward slashes, independent of the platform
+        string_paths = [path.relative_to(source_dir).as_posix() for path in file_paths]
 
-        # Finally, convert them all to strings.
-        string_paths = [str(path) for path in relative_paths]
-
-        # Start the upload.
-        results = transfer_manager.upload_many_from_filenames(
-            bucket,
-            string_paths,
-            source_directory=source_dir,
-            blob_name_prefix=bucket_prefix,
-            max_workers=workers,
-        )
-
-        for name, result in zip(string_paths, results):
+        # skip files that are unchanged in the bucket
+        remote_crc32c = {
+            blob.name[len(bucket_prefix) :]: blob.crc32c
+            for blob in bucket.list_blobs(prefix=bucket_prefix)
+        }
+        changed = [
+            name
+            for name in string_paths
+            if remote_crc32c.get(name) is None
+            or remote_crc32c[name]
+            != _file_crc32c(os.path.join(source_dir, *name.split("/")))
+        ]
+        large = {
+            name
+            for name in changed
+            if os.path.getsize(os.path.join(source_dir, *name.split("/")))
+            > CHUNKED_TRANSFER_THRESHOLD
+        }
+        small = [name for name in changed if name not in large]
+
+        failed = []
+        if small:
+            results = transfer_manager.upload_many_from_filenames(
+                bucket,
+                small,
+                source_directory=source_dir,
+                blob_name_prefix=bucket_prefix,
+                max_workers=workers or min(MAX_UPLOAD_WORKERS, len(small)),
+                worker_type=transfer_manager.THREAD,
+            )
             # The results list is either `None` or an exception for each filename in
             # the input list, in order.
-
-            if isinstance(result, Exception):
-                print("Failed to upload {} due to exception: {}".format(name, result))
-            else:
-                print("Uploaded {} to {}.".format(name, bucket.name))
+            failed = [
+                (name, result)
+                for name, result in zip(small, results)
+                if isinstance(result, Exception)
+            ]
+        for name in sorted(large):
+            try:
+                transfer_manager.upload_chunks_concurrently(
+                    os.path.join(source_dir, *name.split("/")),
+                    bucket.blob(bucket_prefix + name),
+                    chunk_size=CHUNK_SIZE,
+                    worker_type=transfer_manager.THREAD,
+                    max_workers=workers or 8,
+                )
+            except Exception as e:
+                failed.append((name, e))
+
+        for name, exception in failed:
+            print("Failed to upload {} due to exception: {}".format(name, exception))
+        print(
+            f"Uploaded {len(changed) - len(failed)} files to gs://{bucket.name}/{bucket_prefix}, "
+            f"{len(string_paths) - len(changed)} unchanged, {len(failed)} failed."
+        )
+        return [name for name, _ in failed]
 
     def create_dataset(
         self,
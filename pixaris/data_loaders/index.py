@@ -0,0 +1,151 @@
+import json
+import os
+from typing import List
+from pixaris.data_loaders.utils import file_sha256
+
+DATASET_INDEX_VERSION = 1
+
+
+def check_image_names(names_by_dir: dict[str, List[str]]) -> List[str]:
+    """
+    Checks that every image directory contains the same image names, independent of their order.
+
+    :param names_by_dir: The image names by image directory, the first directory is the basis of the comparison.
+    :type names_by_dir: dict[str, List[str]]
+    :raises ValueError: If the names of the images in each image directory are not the same.
+    :return: The sorted image names.
+    :rtype: List[str]
+    """
+    image_dirs = list(names_by_dir)
+    basis_names = set(names_by_dir[image_dirs[0]])
+    for image_dir in image_dirs:
+        if set(names_by_dir[image_dir]) != basis_names:
+            raise ValueError(
+                "The names of the images in each image directory should be the same. {} does not match {}.".format(
+                    image_dirs[0], image_dir
+                )
+            )
+    return sorted(basis_names)
+
+
+def _directory_mtimes(dataset_dir: str, image_dirs: List[str]) -> dict[str, int]:
+    """
+    The modification times of the dataset directory and its image directories. They change when a file is added,
+    removed or renamed, but not when a file is overwritten in place.
+    """
+    return {
+        image_dir: os.stat(os.path.join(dataset_dir, image_dir)).st_mtime_ns
+        for image_dir in ["."] + list(image_dirs)
+    }
+
+
+def build_dataset_index(dataset_dir: str, image_dirs: List[str]) -> dict:
+    """
+    Lists and checks the images of a dataset in the directory layout and records their sizes, modification times
+    and content hashes.
+
+    :param dataset_dir: The directory of the dataset.
+    :type dataset_dir: str
+    :param image_dirs: The image directories of the dataset.
+    :type image_dirs: List[str]
+    :raises ValueError: If the names of the images in each image directory are not the same.
+    :return: The index of the dataset.
+    :rtype: dict
+    """
+    mtimes = _directory_mtimes(dataset_dir, image_dirs)
+    entries = {}
+    for image_dir in image_dirs:
+        with os.scandir(os.path.join(dataset_dir, image_dir)) as it:
+            entries[image_dir] = {
+                entry.name: entry.stat() for entry in it if entry.name != ".DS_Store"
+            }
+    image_names = check_image_names(entries)
+
+    items = []
+    for image_name in image_names:
+        images = {}
+        for image_dir in image_dirs:
+            stat = entries[image_dir][image_name]
+            images[image_dir] = {
+                "path": f"{image_dir}/{image_name}",
+                "size": stat.st_size,
+                "mtime_ns": stat.st_mtime_ns,
+                "sha256": file_sha256(os.path.join(dataset_dir, image_dir, image_name)),
+            }
+        items.append({"name": image_name, "images": images})
+    return {
+        "version": DATASET_INDEX_VERSION,
+        "image_dirs": list(image_dirs),
+        "directory_mtimes": mtimes,
+        "items": items,
+    }
+
+
+def load_dataset_index(
+    index_path: str, dataset_dir: str, image_dirs: List[str]
+) -> dict | None:
+    """
+    Loads a persisted index if it still lists the images of the dataset, i.e. no image directory changed since it
+    was built. This needs one stat call per image directory, independent of the number of images. Images that were
+    overwritten in place do not change their directory, call refresh_dataset_index before trusting the hashes.
+
+    :param index_path: The path of the index file.
+    :type index_path: str
+    :param dataset_dir: The directory of the dataset.
+    :type dataset_dir: str
+    :param image_dirs: The image directories of the dataset.
+    :type image_dirs: List[str]
+    :return: The index, or None if there is none or it is outdated.
+    :rtype: dict | None
+    """
+    try:
+        with open(index_path, "r") as f:
+            index = json.load(f)
+    except (FileNotFoundError, json.JSONDecodeError):
+        return None
+    if (
+        index.get("version") != DATASET_INDEX_VERSION
+        or sorted(index["image_dirs"]) != sorted(image_dirs)
+        or index["directory_mtimes"] != _directory_mtimes(dataset_dir, image_dirs)
+    ):
+        return None
+    return index
+
+
+def refresh_dataset_index(index: dict, dataset_dir: str) -> bool:
+    """
+    Checks the size and modification time of every indexed image and hashes the images that changed again, e.g.
+    after they were overwritten in place or downloaded again.
+
+    :param index: The index as returned by load_dataset_index, updated in place.
+    :type index: dict
+    :param dataset_dir: The directory of the dataset.
+    :type dataset_dir: str
+    :return: Whether an image changed, i.e. the index should be saved again.
+    :rtype: bool
+    """
+    changed = False
+    for item in index["items"]:
+        for image in item["images"].values():
+            path = os.path.join(dataset_dir, *image["path"].split("/"))
+            stat = os.stat(path)
+            if (stat.st_size, stat.st_mtime_ns) != (image["size"], image["mtime_ns"]):
+                image["size"] = stat.st_size
+                image["mtime_ns"] = stat.st_mtime_ns
+                image["sha256"] = file_sha256(path)
+                changed = True
+    return changed
+
+
+def save_dataset_index(index_path: str, index: dict):
+    """
+    Writes the index atomically, so concurrent loaders never read a partial index.
+
+    :param index_path: The path of the index file.
+    :type index_path: str
+    :param index: The index as returned by build_dataset_index.
+    :type index: dict
+    """
+    with open(f"{index_path}.tmp", "w") as f:
+        json.dump(index, f)
+    os.replace(f"{index_path}.tmp", index_path)
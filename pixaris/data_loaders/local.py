@@ -1,6 +1,9 @@
 import os
-from typing import List
+from typing import Iterator, List, Tuple
 from pixaris.data_loaders.base import DatasetLoader
+from pixaris.data_loaders.packed import PackedDataset, is_packed_dataset
+from pixaris.data_loaders.thumbnails import ThumbnailCache
+from pixaris.data_loaders.utils import PrefetchIterator, load_item_images
 from PIL import Image
 
 
@@ -8,6 +11,7 @@ class LocalDatasetLoader(DatasetLoader):
     """
     LocalDatasetLoader is a class for loading datasets from a local directory.
         Upon initialisation, the dataset is loaded from the local directory.
+        The directory can also hold a packed dataset created with pixaris.data_loaders.packed.pack_dataset.
 
     :param project: The name of the project containing the evaluation set.
     :type project: str
@@ -15,6 +19,14 @@ class LocalDatasetLoader(DatasetLoader):
     :type dataset: str
     :param eval_dir_local: The local directory where evaluation images are saved. Defaults to "local_experiment_inputs".
     :type eval_dir_local: str
+    :param use_index: Whether to persist an index of the dataset with the sizes and content hashes of its images next
+      to it, so large datasets are checked without listing every image directory. The index is rebuilt when an image
+      directory changes, and images whose size or modification time changed are hashed again. Defaults to False.
+    :type use_index: bool
+    :param thumbnail_sizes: If set, e.g. to (256, 512, 1024), iter_dataset with a max_resolution reads cached
+      downscaled variants of the images instead of decoding the originals. The variants are built on first use and
+      stored by content hash next to the dataset. Defaults to None.
+    :type thumbnail_sizes: Tuple[int], optional
     """
 
     def __init__(
@@ -22,10 +34,15 @@ class LocalDatasetLoader(DatasetLoader):
         project: str,
         dataset: str,
         eval_dir_local: str = "local_experiment_inputs",
+        use_index: bool = False,
+        thumbnail_sizes: Tuple[int] = None,
     ):
         self.dataset = dataset
         self.project = project
         self.eval_dir_local = eval_dir_local
+        self.use_index = use_index
+        self.dataset_index = None
+        self.thumbnail_sizes = thumbnail_sizes
 
         # Check if the dataset directory exists
         dataset_path = os.path.join(self.eval_dir_local, self.project, self.dataset)
@@ -35,11 +52,17 @@ class LocalDatasetLoader(DatasetLoader):
                 f"Please create the directory structure or check your project and dataset names."
             )
 
-        self.image_dirs = [
-            name
-            for name in os.listdir(dataset_path)
-            if os.path.isdir(os.path.join(dataset_path, name))
-        ]
+        # packed datasets list their image directories in the index
+        self.packed = None
+        if is_packed_dataset(dataset_path):
+            self.packed = PackedDataset(dataset_path)
+            self.image_dirs = self.packed.image_dirs
+        else:
+            self.image_dirs = [
+                name
+                for name in os.listdir(dataset_path)
+                if os.path.isdir(os.path.join(dataset_path, name))
+            ]
 
         if not self.image_dirs:
             raise ValueError(
@@ -55,25 +78,67 @@ class LocalDatasetLoader(DatasetLoader):
         :return: The names of the images in the evaluation set.
         :rtype: list[str]
         """
-        basis_names = os.listdir(
+        if self.packed is not None:
+            return self.packed.image_names()
+        index_path = (
             os.path.join(
-                self.eval_dir_local, self.project, self.dataset, self.image_dirs[0]
+                self.eval_dir_local, self.project, f".{self.dataset}.index.json"
             )
+            if self.use_index
+            else None
         )
-        basis_names = [name for name in basis_names if name != ".DS_Store"]
+        return self._check_dataset_image_names(
+            os.path.join(self.eval_dir_local, self.project, self.dataset),
+            self.image_dirs,
+            index_path,
+        )
+
+    def _load_item(
+        self, image_name: str, max_resolution: int = None
+    ) -> dict[str, List[dict[str, Image.Image]]]:
+        """
+        Opens the images with the given name in every image directory.
+
+        :param image_name: The name of the image.
+        :type image_name: str
+        :param max_resolution: The maximum side length needed. Opens cached downscaled variants of the images if
+          thumbnail_sizes is set. Defaults to None.
+        :type max_resolution: int, optional
+        :return: A dict with the key "pillow_images", see load_dataset.
+        :rtype: dict[str, List[dict[str, Image.Image]]]
+        """
+        if self.packed is not None:
+            return self.packed.load_item(image_name)
+        pillow_images = []
         for image_dir in self.image_dirs:
-            image_names = os.listdir(
-                os.path.join(self.eval_dir_local, self.project, self.dataset, image_dir)
+            image_path = os.path.join(
+                self.eval_dir_local,
+                self.project,
+                self.dataset,
+                image_dir,
+                image_name,
             )
-            image_names = [name for name in image_names if name != ".DS_Store"]
-
-            if basis_names != image_names:
-                raise ValueError(
-                    "The names of the images in each image directory should be the same. {} does not match {}.".format(
-                        self.image_dirs[0], image_dir
-                    )
+            # Load the image using PIL
+            if self.thumbnail_sizes and max_resolution is not None:
+                pillow_image = ThumbnailCache(
+                    os.path.join(
+                        self.eval_dir_local, self.project, f".{self.dataset}.thumbnails"
+                    ),
+                    self.thumbnail_sizes,
+                ).open(
+                    image_path,
+                    max_resolution,
+                    self._indexed_content_hash(image_dir, image_name),
                 )
-        return basis_names
+            else:
+                pillow_image = Image.open(image_path)
+            pillow_images.append(
+                {
+                    "node_name": f"Load {image_dir.capitalize()} Image",
+                    "pillow_image": pillow_image,
+                }
+            )
+        return {"pillow_images": pillow_images}
 
     def load_dataset(
         self,
@@ -87,26 +152,45 @@ class LocalDatasetLoader(DatasetLoader):
             This dict has a key for each directory in the image_dirs list representing a Node Name.
         :rtype: List[dict[str, List[dict[str, Image.Image]]]]:
         """
-        image_names = self._retrieve_and_check_dataset_image_names()
+        image_names = self._select_image_names(
+            self._retrieve_and_check_dataset_image_names()
+        )
+        return [self._load_item(image_name) for image_name in image_names]
+
+    def iter_dataset(
+        self,
+        prefetch: int = 8,
+        workers: int = 1,
+        max_resolution: int = None,
+        pre_encode: bool = False,
+    ) -> Iterator[dict[str, List[dict[str, Image.Image]]]]:
+        """
+        Yields the items of the evaluation set one by one, like load_dataset. A background thread decodes at most
+        prefetch items ahead, their files are closed once decoded, so only a few files are open at a time.
+        With more workers, items are opened, decoded, resized and encoded in parallel.
 
-        dataset = []
-        for image_name in image_names:
-            pillow_images = []
-            for image_dir in self.image_dirs:
-                image_path = os.path.join(
-                    self.eval_dir_local,
-                    self.project,
-                    self.dataset,
-                    image_dir,
-                    image_name,
-                )
-                # Load the image using PIL
-                pillow_image = Image.open(image_path)
-                pillow_images.append(
-                    {
-                        "node_name": f"Load {image_dir.capitalize()} Image",
-                        "pillow_image": pillow_image,
-                    }
-                )
-            dataset.append({"pillow_images": pillow_images})
-        return dataset
+        :param prefetch: The maximum number of items loaded ahead of the consumer. Defaults to 8.
+        :type prefetch: int
+        :param workers: The number of threads decoding items in parallel. Defaults to 1.
+        :type workers: int
+        :param max_resolution: If set, images with a longer side are scaled down to it, keeping the aspect ratio.
+          Defaults to None.
+        :type max_resolution: int, optional
+        :param pre_encode: Whether to store the encoded bytes of every image under "encoded_image" next to
+          "pillow_image", so generators do not encode it on the critical path. Defaults to False.
+        :type pre_encode: bool
+        :return: An iterator over the items. len() of it is the number of items.
+        :rtype: Iterator[dict[str, List[dict[str, Image.Image]]]]
+        """
+        image_names = self._select_image_names(
+            self._retrieve_and_check_dataset_image_names()
+        )
+        return PrefetchIterator(
+            image_names,
+            prefetch,
+            total=len(image_names),
+            transform=lambda name: load_item_images(
+                self._load_item(name, max_resolution), max_resolution, pre_encode
+            ),
+            workers=workers,
+        )
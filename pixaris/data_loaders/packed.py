@@ -0,0 +1,172 @@
+import io
+import json
+import os
+import tarfile
+from typing import List
+from PIL import Image
+
+PACKED_INDEX_NAME = "index.json"
+PACKED_FORMAT = "pixaris-packed-dataset"
+PACKED_VERSION = 1
+
+
+def is_packed_dataset(dataset_dir: str) -> bool:
+    """
+    Checks if a dataset directory holds a packed dataset.
+
+    :param dataset_dir: The directory of the dataset.
+    :type dataset_dir: str
+    :return: Whether the directory contains the index of a packed dataset.
+    :rtype: bool
+    """
+    return os.path.isfile(os.path.join(dataset_dir, PACKED_INDEX_NAME))
+
+
+def pack_dataset(
+    source_dir: str, target_dir: str, shard_size: int = 256 * 1024 * 1024
+) -> dict:
+    """
+    Converts a dataset in the directory layout (one directory per node, the same image names in each of them) into a
+    packed dataset: a few uncompressed tar shards and an index.json that maps every item and node to the offset and
+    size of its image in a shard. The images of an item are stored next to each other, so an item is read with one
+    read. Upload the target directory like any other dataset, both dataset loaders read it directly.
+
+    :param source_dir: The dataset directory to convert, e.g. "local_experiment_inputs/my_project/my_dataset".
+    :type source_dir: str
+    :param target_dir: The directory to write the packed dataset to. Must not contain a dataset yet.
+    :type target_dir: str
+    :param shard_size: The size in bytes after which a new shard is started. Defaults to 256 MiB.
+    :type shard_size: int
+    :raises ValueError: If the image names differ between the node directories or the target is not empty.
+    :return: The index of the packed dataset.
+    :rtype: dict
+    """
+    image_dirs = sorted(
+        name
+        for name in os.listdir(source_dir)
+        if os.path.isdir(os.path.join(source_dir, name))
+    )
+    if not image_dirs:
+        raise ValueError(f"No image directories found in {source_dir}.")
+    names = {
+        image_dir: sorted(
+            name
+            for name in os.listdir(os.path.join(source_dir, image_dir))
+            if name != ".DS_Store"
+        )
+        for image_dir in image_dirs
+    }
+    for image_dir in image_dirs:
+        if names[image_dir] != names[image_dirs[0]]:
+            raise ValueError(
+                "The names of the images in each image directory should be the same. {} does not match {}.".format(
+                    image_dirs[0], image_dir
+                )
+            )
+    os.makedirs(target_dir, exist_ok=True)
+    if os.listdir(target_dir):
+        raise ValueError(f"The target directory {target_dir} is not empty.")
+
+    shards = []
+    items = []
+    tar = None
+    for image_name in names[image_dirs[0]]:
+        if tar is None or tar.offset >= shard_size:
+            if tar is not None:
+                tar.close()
+            shards.append(f"shard-{len(shards):05d}.tar")
+            tar = tarfile.open(os.path.join(target_dir, shards[-1]), mode="w")
+        images = {}
+        for image_dir in image_dirs:
+            path = os.path.join(source_dir, image_dir, image_name)
+            tarinfo = tar.gettarinfo(path, arcname=f"{image_dir}/{image_name}")
+            with open(path, "rb") as f:
+                tar.addfile(tarinfo, f)
+            # the data is followed by padding to the next block, the header precedes it
+            padded_size = -(-tarinfo.size // tarfile.BLOCKSIZE) * tarfile.BLOCKSIZE
+            images[image_dir] = {
+                "shard": len(shards) - 1,
+                "offset": tar.offset - padded_size,
+                "size": tarinfo.size,
+            }
+        items.append({"name": image_name, "images": images})
+    if tar is not None:
+        tar.close()
+
+    index = {
+        "format": PACKED_FORMAT,
+        "version": PACKED_VERSION,
+        "image_dirs": image_dirs,
+        "shards": shards,
+        "items": items,
+    }
+    with open(os.path.join(target_dir, PACKED_INDEX_NAME), "w") as f:
+        json.dump(index, f)
+    print(f"Packed {len(items)} items into {len(shards)} shards in {target_dir}.")
+    return index
+
+
+class PackedDataset:
+    """
+    Reads the items of a packed dataset created with pack_dataset.
+
+    :param dataset_dir: The directory of the packed dataset.
+    :type dataset_dir: str
+    :raises ValueError: If the index is not a supported packed dataset index.
+    """
+
+    def __init__(self, dataset_dir: str):
+        self.dataset_dir = dataset_dir
+        with open(os.path.join(dataset_dir, PACKED_INDEX_NAME), "r") as f:
+            index = json.load(f)
+        if index.get("format") != PACKED_FORMAT:
+            raise ValueError(f"{dataset_dir} does not contain a packed dataset.")
+        if index["version"] != PACKED_VERSION:
+            raise ValueError(f"Unsupported packed dataset version {index['version']}.")
+        self.image_dirs = index["image_dirs"]
+        self.shards = index["shards"]
+        self.items = {item["name"]: item for item in index["items"]}
+
+    def image_names(self) -> List[str]:
+        """
+        The names of the items in the order they are stored.
+
+        :return: The image names.
+        :rtype: List[str]
+        """
+        return list(self.items)
+
+    def load_item(self, image_name: str) -> dict[str, List[dict[str, Image.Image]]]:
+        """
+        Reads the images of an item with a single read from its shard.
+
+        :param image_name: The name of the item.
+        :type image_name: str
+        :return: A dict with the key "pillow_images" in the format of the dataset loaders. Every image has the
+          filename it would have in the directory layout, since generators derive names from it.
+        :rtype: dict[str, List[dict[str, Image.Image]]]
+        """
+        images = self.items[image_name]["images"]
+        # the images of an item are adjacent in one shard
+        start = min(image["offset"] for image in images.values())
+        end = max(image["offset"] + image["size"] for image in images.values())
+        shard = self.shards[next(iter(images.values()))["shard"]]
+        with open(os.path.join(self.dataset_dir, shard), "rb") as f:
+            f.seek(start)
+            data = f.read(end - start)
+
+        pillow_images = []
+        for image_dir in self.image_dirs:
+            image = images[image_dir]
+            offset = image["offset"] - start
+            pillow_image = Image.open(io.BytesIO(data[offset : offset + image["size"]]))
+            pillow_image.filename = os.path.join(
+                self.dataset_dir, image_dir, image_name
+            )
+            pillow_images.append(
+                {
+                    "node_name": f"Load {image_dir.capitalize()} Image",
+                    "pillow_image": pillow_image,
+                }
+            )
+        return {"pillow_images": pillow_images}
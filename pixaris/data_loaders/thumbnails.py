@@ -0,0 +1,77 @@
+import os
+import threading
+from typing import Tuple
+from PIL import Image
+from pixaris.data_loaders.utils import file_sha256
+
+DEFAULT_THUMBNAIL_SIZES = (256, 512, 1024)
+# variants are evaluation inputs, keep JPEG artefacts well below those of the default quality of 75
+JPEG_VARIANT_QUALITY = 95
+
+
+class ThumbnailCache:
+    """
+    Builds and caches downscaled variants of dataset images. A variant is stored per size and content hash of the
+    source, so it is shared between identical images and rebuilt when an image changes.
+
+    :param cache_dir: The directory to store the variants in.
+    :type cache_dir: str
+    :param sizes: The maximum side lengths of the variants. Defaults to (256, 512, 1024).
+    :type sizes: Tuple[int]
+    """
+
+    def __init__(self, cache_dir: str, sizes: Tuple[int] = DEFAULT_THUMBNAIL_SIZES):
+        self.cache_dir = cache_dir
+        self.sizes = tuple(sorted(sizes))
+
+    def _variant_size(self, max_resolution: int) -> int | None:
+        """
+        The smallest variant that is at least max_resolution large, None if there is none.
+        """
+        return next((size for size in self.sizes if size >= max_resolution), None)
+
+    def open(
+        self, path: str, max_resolution: int, content_hash: str = None
+    ) -> Image.Image:
+        """
+        Opens the smallest cached variant of an image that is at least max_resolution large, building it on first
+        use. The source is only decoded to build a variant, JPEGs are decoded at a reduced scale and their variants
+        saved at JPEG_VARIANT_QUALITY. Returns the source
+        itself if it is not larger than max_resolution or larger than every variant.
+
+        :param path: The path of the source image.
+        :type path: str
+        :param max_resolution: The maximum side length the consumer needs.
+        :type max_resolution: int
+        :param content_hash: The sha256 of the source, e.g. from the dataset index. Computed if not given.
+        :type content_hash: str, optional
+        :return: The opened image. Its filename is the path of the source, since generators derive names from it.
+        :rtype: Image.Image
+        """
+        source = Image.open(path)
+        size = self._variant_size(max_resolution)
+        if max(source.size) <= max_resolution or size is None:
+            return source
+
+        extension = os.path.splitext(path)[1]
+        variant_path = os.path.join(
+            self.cache_dir, str(size), f"{content_hash or file_sha256(path)}{extension}"
+        )
+        if not os.path.isfile(variant_path):
+            if source.format == "JPEG":
+                # decode at the smallest scale that is still larger than the variant
+                source.draft(source.mode, (size, size))
+            source.thumbnail((size, size))
+            os.makedirs(os.path.dirname(variant_path), exist_ok=True)
+            # concurrent loaders may build the same variant, the last one wins
+            tmp_path = f"{variant_path}.{os.getpid()}-{threading.get_ident()}.tmp"
+            if source.format == "JPEG":
+                source.save(tmp_path, format="JPEG", quality=JPEG_VARIANT_QUALITY)
+            else:
+                source.save(tmp_path, format=source.format or "PNG")
+            os.replace(tmp_path, variant_path)
+        source.close()
+
+        variant = Image.open(variant_path)
+        variant.filename = path
+        return variant
@@ -0,0 +1,190 @@
+from concurrent.futures import Future, ThreadPoolExecutor
+import hashlib
+from io import BytesIO
+import os
+from queue import Empty, Full, Queue
+from threading import Event, Thread
+from typing import Callable, Iterable, Iterator
+from PIL import Image
+
+
+def file_sha256(path: str) -> str:
+    """
+    The sha256 hex digest of the contents of a file, read in chunks.
+
+    :param path: The path of the file.
+    :type path: str
+    :return: The hex digest.
+    :rtype: str
+    """
+    sha256 = hashlib.sha256()
+    with open(path, "rb") as f:
+        for chunk in iter(lambda: f.read(1024 * 1024), b""):
+            sha256.update(chunk)
+    return sha256.hexdigest()
+
+
+def _source_file_bytes(image: Image.Image) -> bytes | None:
+    """
+    The bytes of the file an image was opened from, if the file still holds an image of its size and format. Cached
+    variants keep the path of their source as filename, so the size has to match as well.
+    """
+    filename = getattr(image, "filename", None)
+    if not filename or not os.path.isfile(filename):
+        return None
+    with open(filename, "rb") as f:
+        data = f.read()
+    try:
+        with Image.open(BytesIO(data)) as source:
+            if (source.format, source.size) != (image.format, image.size):
+                return None
+    except OSError:
+        return None
+    return data
+
+
+def load_item_images(
+    item: dict[str, any], max_resolution: int = None, pre_encode: bool = False
+) -> dict[str, any]:
+    """
+    Decode the images of a dataset item. Pillow closes the file of an image opened from a path once it is decoded,
+    so decoded items do not hold file handles.
+
+    :param item: A dataset item with the key "pillow_images".
+    :type item: dict[str, any]
+    :param max_resolution: If set, images with a longer side are scaled down to it, keeping the aspect ratio.
+      Defaults to None.
+    :type max_resolution: int, optional
+    :param pre_encode: Whether to store the encoded bytes of every image under "encoded_image" next to
+      "pillow_image", so generators do not have to encode it again. Images that were not scaled down keep the bytes
+      of their file, others are encoded as lossless PNG. Defaults to False.
+    :type pre_encode: bool
+    :return: The same item.
+    :rtype: dict[str, any]
+    """
+    for image_info in item["pillow_images"]:
+        image = image_info["pillow_image"]
+        image.load()
+        resized = max_resolution is not None and max(image.size) > max_resolution
+        if resized:
+            # in place, so the image keeps its filename and format
+            image.thumbnail((max_resolution, max_resolution))
+        if pre_encode:
+            # encoding again would lose quality for lossy formats like JPEG
+            encoded = None if resized else _source_file_bytes(image)
+            if encoded is None:
+                buffer = BytesIO()
+                image.save(buffer, format="PNG")
+                encoded = buffer.getvalue()
+            image_info["encoded_image"] = encoded
+    return item
+
+
+# marks the end of the source iterable in the prefetch queue
+_END = object()
+
+
+class PrefetchIterator:
+    """
+    Iterates over an iterable while a daemon thread prepares the next items. At most prefetch items are waiting in
+    the queue, so memory and open file handles stay bounded no matter how large the dataset is. Exceptions of the
+    source are raised when the consumer reaches the item that failed.
+
+    :param iterable: The source of the items. It is consumed in the background thread.
+    :type iterable: Iterable
+    :param prefetch: The maximum number of items prepared ahead of the consumer. Defaults to 8.
+    :type prefetch: int
+    :param total: The number of items, if known up front. Returned by len(). Defaults to None.
+    :type total: int, optional
+    :param transform: Applied to every item before it is handed out, e.g. to decode it. Defaults to None.
+    :type transform: Callable, optional
+    :param workers: The number of threads applying transform in parallel. The order of the items is kept and
+      the items being transformed count towards prefetch. Defaults to 1.
+    :type workers: int
+    """
+
+    def __init__(
+        self,
+        iterable: Iterable,
+        prefetch: int = 8,
+        total: int = None,
+        transform: Callable = None,
+        workers: int = 1,
+    ):
+        if prefetch < 1:
+            raise ValueError("prefetch has to be at least 1.")
+        self.total = total
+        self._transform = transform
+        self._pool = (
+            ThreadPoolExecutor(max_workers=workers)
+            if transform is not None and workers > 1
+            else None
+        )
+        self._queue = Queue(maxsize=prefetch)
+        self._stop_event = Event()
+        self._thread = Thread(target=self._fill, args=(iterable,), daemon=True)
+        self._thread.start()
+
+    def _put(self, item) -> bool:
+        """
+        Put an item into the queue unless the consumer stopped. Returns whether the item was queued.
+        """
+        while not self._stop_event.is_set():
+            try:
+                self._queue.put(item, timeout=0.1)
+                return True
+            except Full:
+                continue
+        return False
+
+    def _fill(self, iterable: Iterable):
+        try:
+            for item in iterable:
+                if self._pool is not None:
+                    item = self._pool.submit(self._transform, item)
+                elif self._transform is not None:
+                    item = self._transform(item)
+                if not self._put((item, None)):
+                    return
+        except Exception as e:
+            self._put((_END, e))
+            return
+        finally:
+            if self._pool is not None:
+                # the queued items still finish
+                self._pool.shutdown(wait=False)
+        self._put((_END, None))
+
+    def __len__(self) -> int:
+        if self.total is None:
+            raise TypeError("The number of items is not known.")
+        return self.total
+
+    def __iter__(self) -> Iterator:
+        return self
+
+    def __next__(self):
+        if self._stop_event.is_set():
+            raise StopIteration
+        item, error = self._queue.get()
+        if item is _END:
+            self._stop_event.set()
+            if error is not None:
+                raise error
+            raise StopIteration
+        if isinstance(item, Future):
+            return item.result()
+        return item
+
+    def close(self):
+        """
+        Stop prefetching. Items that are already prepared are dropped.
+        """
+        self._stop_event.set()
+        try:
+            while True:
+                item, _ = self._queue.get_nowait()
+                if isinstance(item, Future):
+                    item.cancel()
+        except Empty:
+            pass
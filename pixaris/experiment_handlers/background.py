@@ -0,0 +1,291 @@
+import atexit
+from io import BytesIO
+import os
+import pickle
+import queue
+import threading
+import time
+import uuid
+from typing import Iterable
+from PIL import Image
+from pixaris.experiment_handlers.base import ExperimentHandler
+from pixaris.experiment_handlers.tracking import load_experiment_results
+from pixaris.generation.utils import open_encoded_image
+from pixaris.utils.encoding import get_encoded_bytes
+
+
+def _process_is_alive(pid: int) -> bool:
+    """
+    Whether a process with the pid is running on this machine.
+    """
+    if os.name == "nt":
+        # os.kill terminates the process on Windows, never replay entries of other processes there
+        return True
+    try:
+        os.kill(pid, 0)
+    except ProcessLookupError:
+        return False
+    except PermissionError:
+        return True
+    return True
+
+
+def _spool_entry_owner(file_name: str) -> int | None:
+    """
+    The pid of the process that owns a spool entry named <id>.<pid>.pkl or <id>.<pid>.pkl.tmp.
+    """
+    try:
+        return int(file_name.split(".")[1])
+    except (IndexError, ValueError):
+        return None
+
+
+def _encode_for_spool(image: Image.Image) -> tuple[bytes, bool]:
+    """
+    The bytes a generator returned an image in, or a fast lossless PNG of it, and whether they are the former.
+    """
+    encoded = getattr(image, "_pixaris_encoded", None)
+    if isinstance(encoded, tuple):
+        data = get_encoded_bytes(image, encoded[1])
+        if data is not None:
+            return data, True
+    buffer = BytesIO()
+    image.save(buffer, format="PNG", compress_level=1)
+    return buffer.getvalue(), False
+
+
+def _decode_from_spool(data: bytes, from_generator: bool) -> Image.Image:
+    """
+    Opens an image written by _encode_for_spool. Only the bytes of a generator are kept for the handler to store
+    as they are, the spool PNG is encoded with the profile of the handler.
+    """
+    if from_generator:
+        return open_encoded_image(data)
+    return Image.open(BytesIO(data))
+
+
+class BackgroundExperimentHandler(ExperimentHandler):
+    """
+    BackgroundExperimentHandler wraps another experiment handler and stores results on a background thread, so
+    generation can continue while the images of finished runs are written or uploaded. Every handed off run is
+    first written to a spool directory, its images encoded, and only removed once the wrapped handler stored all of
+    it. The run name is fixed when the run is handed off, so storing a run again after a failure overwrites it
+    instead of adding a second run. The names of the runs in the spool are reserved, so a run handed off while
+    another one of the same name waits gets a different name.
+
+    Entries are owned by the process that wrote them. Entries of processes that are not running anymore, e.g. after
+    a crash, are claimed and stored again when a handler is created on the same spool directory, an entry is only
+    claimed by one process.
+
+    Call flush() before relying on the stored results, e.g. at the end of a script. Errors of the wrapped handler
+    are raised by flush(), their runs stay in the spool.
+
+    :param experiment_handler: The handler that stores the results, e.g. a GCPExperimentHandler.
+    :type experiment_handler: ExperimentHandler
+    :param spool_dir: The directory for runs that are not stored yet. Defaults to '.pixaris_spool'.
+    :type spool_dir: str, optional
+    :param replay: Whether to store runs left in the spool directory by processes that stopped. Defaults to True.
+    :type replay: bool, optional
+    """
+
+    def __init__(
+        self,
+        experiment_handler: ExperimentHandler,
+        spool_dir: str = ".pixaris_spool",
+        replay: bool = True,
+    ):
+        self.experiment_handler = experiment_handler
+        self.spool_dir = spool_dir
+        os.makedirs(spool_dir, exist_ok=True)
+
+        self._queue = queue.Queue()
+        self._pending = 0
+        self._condition = threading.Condition()
+        self._errors = []
+        # the project, dataset and run name of every entry in the spool that is not stored yet, by spool path
+        self._reserved_names = {}
+        self._names_lock = threading.Lock()
+
+        pid = os.getpid()
+        for file_name in sorted(os.listdir(spool_dir)):
+            owner = _spool_entry_owner(file_name)
+            if owner is None or owner == pid or _process_is_alive(owner):
+                continue
+            path = os.path.join(spool_dir, file_name)
+            if file_name.endswith(".tmp"):
+                # a partial write, the run was never handed off
+                os.remove(path)
+            elif file_name.endswith(".pkl") and replay:
+                entry_id = file_name.split(".")[0]
+                claimed_path = os.path.join(spool_dir, f"{entry_id}.{pid}.pkl")
+                try:
+                    # renaming is atomic, only one process claims the entry
+                    os.rename(path, claimed_path)
+                except FileNotFoundError:
+                    continue
+                print(f"Replaying {entry_id} from {spool_dir}.")
+                try:
+                    with open(claimed_path, "rb") as f:
+                        header = pickle.load(f)
+                    self._reserved_names[claimed_path] = (
+                        header["project"],
+                        header["dataset"],
+                        header["experiment_run_name"],
+                    )
+                except Exception as e:
+                    print(f"Failed to read {claimed_path} due to exception: {e}")
+                self._enqueue(claimed_path)
+
+        self._worker = threading.Thread(target=self._work, daemon=True)
+        self._worker.start()
+        # the worker is a daemon thread, do not exit before the handed off runs are stored
+        atexit.register(self.wait)
+
+    def _enqueue(self, spool_path: str):
+        with self._condition:
+            self._pending += 1
+        self._queue.put(spool_path)
+
+    def _work(self):
+        while True:
+            spool_path = self._queue.get()
+            try:
+                with open(spool_path, "rb") as f:
+                    entry = pickle.load(f)
+                    entry["image_name_pairs"] = [
+                        (_decode_from_spool(data, from_generator), name)
+                        for data, from_generator, name in pickle.load(f)
+                    ]
+                start = time.monotonic()
+                self.experiment_handler._store_resolved_results(**entry)
+                os.remove(spool_path)
+                with self._names_lock:
+                    self._reserved_names.pop(spool_path, None)
+                print(
+                    f"Stored {entry['experiment_run_name']} in the background in {time.monotonic() - start:.1f} s."
+                )
+            except Exception as e:
+                print(f"Failed to store {spool_path} due to exception: {e}")
+                with self._condition:
+                    self._errors.append((spool_path, e))
+            finally:
+                with self._condition:
+                    self._pending -= 1
+                    self._condition.notify_all()
+
+    def store_results(
+        self,
+        project: str,
+        dataset: str,
+        experiment_run_name: str,
+        image_name_pairs: Iterable[tuple[Image.Image, str]],
+        metric_values: dict[str, float],
+        args: dict[str, any] = {},
+    ):
+        """
+        Writes the results to the spool directory and hands them off to the background thread. Images a generator
+        returned encoded are written as they are, others as fast PNGs. Returns as soon as they are written, the
+        wrapped handler stores them later.
+
+        :param project: The name of the project.
+        :type project: str
+        :param dataset: The name of the dataset.
+        :type dataset: str
+        :param experiment_run_name: The name of the experiment run.
+        :type experiment_run_name: str
+        :param image_name_pairs: An iterable of tuples containing images and their names.
+        :type image_name_pairs: Iterable[tuple[Image.Image, str]]
+        :param metric_values: A dictionary of metric names and their values.
+        :type metric_values: dict[str, float]
+        :param args: The arguments of the experiment.
+        :type args: dict[str, any]
+        """
+        spool_path = os.path.join(
+            self.spool_dir, f"{time.time_ns()}-{uuid.uuid4().hex[:8]}.{os.getpid()}.pkl"
+        )
+        with self._names_lock:
+            reserved_names = {
+                name
+                for reserved_project, reserved_dataset, name in self._reserved_names.values()
+                if (reserved_project, reserved_dataset) == (project, dataset)
+            }
+            experiment_run_name = self.experiment_handler._resolve_experiment_run_name(
+                project, dataset, experiment_run_name, reserved_names
+            )
+            self._reserved_names[spool_path] = (project, dataset, experiment_run_name)
+        # the header is read on its own when the entry is replayed, to reserve its name
+        header = {
+            "project": project,
+            "dataset": dataset,
+            "experiment_run_name": experiment_run_name,
+            "metric_values": metric_values,
+            "args": args,
+        }
+        images = [(*_encode_for_spool(image), name) for image, name in image_name_pairs]
+        # write atomically, a partial entry must never be replayed
+        with open(f"{spool_path}.tmp", "wb") as f:
+            pickle.dump(header, f, protocol=pickle.HIGHEST_PROTOCOL)
+            pickle.dump(images, f, protocol=pickle.HIGHEST_PROTOCOL)
+        os.replace(f"{spool_path}.tmp", spool_path)
+        self._enqueue(spool_path)
+
+    def wait(self, timeout: float = None) -> bool:
+        """
+        Waits until every handed off run was processed by the wrapped handler, successfully or not.
+
+        :param timeout: The maximum number of seconds to wait. Defaults to None, waiting indefinitely.
+        :type timeout: float, optional
+        :return: Whether all runs were processed before the timeout.
+        :rtype: bool
+        """
+        with self._condition:
+            return self._condition.wait_for(lambda: self._pending == 0, timeout)
+
+    def flush(self):
+        """
+        Waits until every handed off run was processed and raises if the wrapped handler failed to store any of
+        them. The failed runs stay in the spool directory and are replayed by the next process with a handler on it.
+
+        :raises RuntimeError: If runs could not be stored.
+        """
+        self.wait()
+        with self._condition:
+            errors, self._errors = self._errors, []
+        if errors:
+            raise RuntimeError(
+                f"Failed to store {len(errors)} experiment runs, they stay in {self.spool_dir}: "
+                + "; ".join(f"{path}: {error}" for path, error in errors)
+            ) from errors[0][1]
+
+    def _validate_experiment_run_name(
+        self,
+        experiment_run_name: str,
+    ):
+        self.experiment_handler._validate_experiment_run_name(experiment_run_name)
+
+    def load_projects_and_datasets(
+        self,
+    ):
+        return self.experiment_handler.load_projects_and_datasets()
+
+    def load_experiment_results_for_dataset(
+        self,
+        project: str,
+        dataset: str,
+        columns: list[str] = None,
+        filters: dict[str, any] = None,
+    ):
+        return load_experiment_results(
+            self.experiment_handler, project, dataset, columns, filters
+        )
+
+    def load_images_for_experiment(
+        self,
+        project: str,
+        dataset: str,
+        experiment_run_name: str,
+        local_results_directory: str,
+    ):
+        return self.experiment_handler.load_images_for_experiment(
+            project, dataset, experiment_run_name, local_results_directory
+        )
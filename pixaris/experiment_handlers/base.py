@@ -1,8 +1,18 @@
 from abc import abstractmethod
-from typing import Iterable
+from typing import Collection, Iterable
 from PIL import Image
 
 
+def _unreserved_name(experiment_run_name: str, reserved_names: Collection[str]) -> str:
+    """
+    The experiment run name, with a counter appended if it is one of the reserved names.
+    """
+    name, counter = experiment_run_name, 2
+    while name in reserved_names:
+        name, counter = f"{experiment_run_name}-{counter}", counter + 1
+    return name
+
+
 class ExperimentHandler:
     """When implementing a new Experiment Handler, inherit from this one and implement all the abstract methods."""
 
@@ -18,6 +28,42 @@ class ExperimentHandler:
     ) -> None:
         pass
 
+    def _resolve_experiment_run_name(
+        self,
+        project: str,
+        dataset: str,
+        experiment_run_name: str,
+        reserved_names: Collection[str] = (),
+    ) -> str:
+        """
+        The name store_results would store a run under, e.g. with a timestamp. Handlers that change the name
+        implement this together with _store_resolved_results. reserved_names are taken by runs that are not stored
+        yet, e.g. the runs waiting in a BackgroundExperimentHandler.
+        """
+        return _unreserved_name(experiment_run_name, reserved_names)
+
+    def _store_resolved_results(
+        self,
+        project: str,
+        dataset: str,
+        experiment_run_name: str,
+        image_name_pairs: Iterable[tuple[Image.Image, str]],
+        metric_values: dict[str, float],
+        args: dict[str, any],
+    ) -> None:
+        """
+        Stores results under a name from _resolve_experiment_run_name as it is. Storing the same run again
+        overwrites it instead of adding a second run, so an interrupted store can be repeated.
+        """
+        self.store_results(
+            project=project,
+            dataset=dataset,
+            experiment_run_name=experiment_run_name,
+            image_name_pairs=image_name_pairs,
+            metric_values=metric_values,
+            args=args,
+        )
+
     def _validate_experiment_run_name(
         self,
         experiment_run_name: str,
@@ -35,6 +81,8 @@ class ExperimentHandler:
         self,
         project: str,
         dataset: str,
+        columns: list[str] = None,
+        filters: dict[str, any] = None,
     ):
         pass
 
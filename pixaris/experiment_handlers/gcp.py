@@ -1,7 +1,9 @@
-from typing import Iterable
+from concurrent.futures import ThreadPoolExecutor
+from io import BytesIO
+from typing import Collection, Iterable
 from PIL import Image
 from PIL.PngImagePlugin import PngInfo
-from pixaris.experiment_handlers.base import ExperimentHandler
+from pixaris.experiment_handlers.base import ExperimentHandler, _unreserved_name
 import json
 import pandas as pd
 from google.cloud import bigquery, storage
@@ -9,7 +11,13 @@ import os
 import time
 from datetime import datetime
 import gradio as gr
-from pixaris.utils.bigquery import ensure_table_exists
+from pixaris.utils.bigquery import ensure_table_exists, python_type_to_bq_type
+from pixaris.utils.retry import retry
+from pixaris.utils.encoding import (
+    convert_for_format,
+    get_encoded_bytes,
+    resolve_encoding_profile,
+)
 
 
 class GCPExperimentHandler(ExperimentHandler):
@@ -23,6 +31,12 @@ class GCPExperimentHandler(ExperimentHandler):
     :type gcp_bq_experiment_dataset: str
     :param gcp_pixaris_bucket_name: The name of the Google Cloud Storage bucket for storing images.
     :type gcp_pixaris_bucket_name: str
+    :param encoding_profile: How the generated images are encoded, the name of a profile in
+      pixaris.utils.encoding.ENCODING_PROFILES, e.g. "png-fast" or "webp-lossless", or a custom profile dict.
+      It is recorded in the BigQuery row. Defaults to "png".
+    :type encoding_profile: str | dict, optional
+    :param upload_workers: The number of images encoded and uploaded in parallel. Defaults to 16.
+    :type upload_workers: int, optional
     :type ExperimentHandler: _type_
     """
 
@@ -31,10 +45,14 @@ class GCPExperimentHandler(ExperimentHandler):
         gcp_project_id: str,
         gcp_bq_experiment_dataset: str,
         gcp_pixaris_bucket_name: str,
+        encoding_profile: str | dict = "png",
+        upload_workers: int = 16,
     ):
         self.gcp_project_id = gcp_project_id
         self.gcp_bq_experiment_dataset = gcp_bq_experiment_dataset
         self.gcp_pixaris_bucket_name = gcp_pixaris_bucket_name
+        self.encoding_profile = resolve_encoding_profile(encoding_profile)
+        self.upload_workers = upload_workers
 
         self.storage_client = None
         self.bigquery_client = None
@@ -44,23 +62,44 @@ class GCPExperimentHandler(ExperimentHandler):
         self.dataset = None
         self.experiment_run_name = None
 
-    def _ensure_unique_experiment_run_name(self) -> str:
+    def _resolve_experiment_run_name(
+        self,
+        project: str,
+        dataset: str,
+        experiment_run_name: str,
+        reserved_names: Collection[str] = (),
+    ) -> str:
         """
-        Ensures that the experiment run name is unique by appending a timestamp and random number if necessary.
+        Makes the experiment run name unique by prefixing the date and, if a run of that name exists already or is
+        reserved, appending the time and, if that is reserved as well, a counter. Does not change the state of the
+        handler, so it can be called while another run is stored.
 
+        :param project: The name of the project.
+        :type project: str
+        :param dataset: The name of the dataset.
+        :type dataset: str
+        :param experiment_run_name: The name of the experiment run.
+        :type experiment_run_name: str
+        :param reserved_names: The names of runs that are not stored yet. Defaults to ().
+        :type reserved_names: Collection[str], optional
         :return: A unique experiment run name.
         :rtype: str
         """
+        if self.pixaris_bucket is None:
+            self.pixaris_bucket = storage.Client(project=self.gcp_project_id).bucket(
+                self.gcp_pixaris_bucket_name
+            )
         timestamp = datetime.now().strftime("%y%m%d")
-        self.experiment_run_name = f"{timestamp}-{self.experiment_run_name}"
+        experiment_run_name = f"{timestamp}-{experiment_run_name}"
 
+        # only the run directory itself matters, list at most one of its objects
         blobs = self.pixaris_bucket.list_blobs(
-            prefix=f"results/{self.project}/{self.dataset}"
+            prefix=f"results/{project}/{dataset}/{experiment_run_name}/",
+            max_results=1,
         )
-        for blob in blobs:
-            if self.experiment_run_name in blob.name:
-                return self.experiment_run_name + datetime.now().strftime("%H%M")
-        return self.experiment_run_name
+        if list(blobs) or experiment_run_name in reserved_names:
+            experiment_run_name += datetime.now().strftime("%H%M")
+        return _unreserved_name(experiment_run_name, reserved_names)
 
     def _validate_args(self, args: dict[str, any]):
         """
@@ -87,6 +126,21 @@ class GCPExperimentHandler(ExperimentHandler):
                 for item in pillow_images
             ), "Each dictionary must contain the keys 'node_name' and 'pillow_image'."
 
+    @retry(tries=3, delay=1, max_delay=10, backoff=2)
+    def _upload_bytes(self, gcs_path: str, data: bytes, content_type: str):
+        """
+        Uploads bytes from memory to a blob, retrying failed attempts.
+
+        :param gcs_path: The name of the blob.
+        :type gcs_path: str
+        :param data: The content of the blob.
+        :type data: bytes
+        :param content_type: The content type of the blob.
+        :type content_type: str
+        """
+        blob = self.pixaris_bucket.blob(gcs_path)
+        blob.upload_from_string(data, content_type=content_type)
+
     def _upload_to_gcs(self, key: str, value: any) -> str:
         """
         Uploads a file (image or JSON) to Google Cloud Storage and returns its GCS path.
@@ -100,26 +154,24 @@ class GCPExperimentHandler(ExperimentHandler):
         """
 
         if isinstance(value, Image.Image):
-            tmp_path = f"{key}.png"
+            file_name = f"{key}.png"
             metadata = PngInfo()
             for metadata_key, metadata_value in value.info.items():
                 metadata.add_text(metadata_key, str(metadata_value))
-            value.save(tmp_path, pnginfo=metadata)
+            buffer = BytesIO()
+            value.save(buffer, format="PNG", pnginfo=metadata)
+            data, content_type = buffer.getvalue(), "image/png"
         elif isinstance(value, dict):
-            tmp_path = f"{key}.json"
-            with open(tmp_path, "w") as f:
-                json.dump(value, f)
+            file_name = f"{key}.json"
+            data, content_type = json.dumps(value).encode("utf-8"), "application/json"
         else:
             raise ValueError("Unsupported value type for upload.")
 
         # upload to bucket
-        gcs_path = f"results/{self.project}/{self.dataset}/{self.experiment_run_name}/{tmp_path}"
-        blob = self.pixaris_bucket.blob(gcs_path)
-        blob.upload_from_filename(tmp_path)
+        gcs_path = f"results/{self.project}/{self.dataset}/{self.experiment_run_name}/{file_name}"
+        self._upload_bytes(gcs_path, data, content_type)
         # put together the clickable link
         clickable_link = f"https://console.cloud.google.com/storage/browser/_details/{self.gcp_pixaris_bucket_name}/{gcs_path}?project={self.gcp_project_id}"
-        # cleanup temporary file
-        os.remove(tmp_path)
         return clickable_link
 
     def _add_default_metrics(self, bigquery_input: dict):
@@ -213,6 +265,8 @@ class GCPExperimentHandler(ExperimentHandler):
 
         # Ensure default metrics are present
         self._add_default_metrics(bigquery_input)
+        # readers need to know how the generated images are encoded
+        bigquery_input["encoding_profile"] = self.encoding_profile["name"]
 
         # Define table reference
         table_ref = f"{self.gcp_bq_experiment_dataset}.{self.project}_{self.dataset}_experiment_results"
@@ -225,7 +279,10 @@ class GCPExperimentHandler(ExperimentHandler):
         )
 
         # Insert the row into BigQuery
-        errors = self.bigquery_client.insert_rows_json(table_ref, [bigquery_input])
+        # the row id lets BigQuery drop a row that is inserted again when a run is stored again
+        errors = self.bigquery_client.insert_rows_json(
+            table_ref, [bigquery_input], row_ids=[self.experiment_run_name]
+        )
 
         # Check for errors and display warnings to UI
         if errors == []:
@@ -233,26 +290,72 @@ class GCPExperimentHandler(ExperimentHandler):
         else:
             raise RuntimeError(f"Failed to insert row into table {table_ref}: {errors}")
 
+    def _encode_generated_image(self, pillow_image: Image.Image) -> bytes:
+        """
+        Encodes a generated image with the encoding profile of the handler.
+
+        :param pillow_image: The generated image.
+        :type pillow_image: Image.Image
+        :return: The encoded image.
+        :rtype: bytes
+        """
+        profile = self.encoding_profile
+        if profile["pass_through"]:
+            encoded = get_encoded_bytes(pillow_image, profile["format"])
+            if encoded is not None:
+                # the generator returned it encoded already
+                return encoded
+        buffer = BytesIO()
+        convert_for_format(pillow_image, profile["format"]).save(
+            buffer, format=profile["format"], **profile["save_kwargs"]
+        )
+        return buffer.getvalue()
+
     def _store_generated_images(
         self,
         image_name_pairs: Iterable[tuple[Image.Image, str]],
     ):
         """
-        Store generated images in the Google Cloud Storage bucket.
+        Store generated images in the Google Cloud Storage bucket. The images are encoded in memory and uploaded on
+        upload_workers threads, failed uploads are retried.
 
         :param image_name_pairs: An iterable of tuples containing PIL Image objects and their corresponding names.
         :type image_name_pairs: Iterable[tuple[Image.Image, str]]
+        :raises RuntimeError: If images could not be uploaded after retrying.
         """
-
-        # Upload each image to the GCS bucket
-        for pillow_image, name in image_name_pairs:
-            image_path = f"{name}"
-            gcp_image_path = f"results/{self.project}/{self.dataset}/{self.experiment_run_name}/generated_images/{name}"
-            pillow_image.save(image_path)
-            blob = self.pixaris_bucket.blob(gcp_image_path)
-            blob.upload_from_filename(image_path)
-            print(f"Uploaded {name} to {gcp_image_path}")
-            os.remove(image_path)
+        profile = self.encoding_profile
+        gcs_dir = f"results/{self.project}/{self.dataset}/{self.experiment_run_name}/generated_images"
+        content_type = Image.MIME.get(profile["format"], "application/octet-stream")
+
+        def encode_and_upload(pillow_image: Image.Image, name: str) -> int:
+            data = self._encode_generated_image(pillow_image)
+            self._upload_bytes(f"{gcs_dir}/{name}", data, content_type)
+            return len(data)
+
+        start = time.monotonic()
+        uploaded_bytes = 0
+        failed = []
+        with ThreadPoolExecutor(max_workers=self.upload_workers) as executor:
+            # a list, images with the same name are all uploaded and accounted for
+            futures = []
+            for pillow_image, name in image_name_pairs:
+                name = os.path.splitext(name)[0] + profile["extension"]
+                futures.append(
+                    (name, executor.submit(encode_and_upload, pillow_image, name))
+                )
+            for name, future in futures:
+                try:
+                    uploaded_bytes += future.result()
+                except Exception as e:
+                    print(f"Failed to upload {name} due to exception: {e}")
+                    failed.append(name)
+
+        print(
+            f"Uploaded {len(futures) - len(failed)} images ({uploaded_bytes / 1e6:.1f} MB) to "
+            f"gs://{self.gcp_pixaris_bucket_name}/{gcs_dir} in {time.monotonic() - start:.1f} s, {len(failed)} failed."
+        )
+        if failed:
+            raise RuntimeError(f"Failed to upload {', '.join(failed)}.")
 
     def store_results(
         self,
@@ -279,32 +382,90 @@ class GCPExperimentHandler(ExperimentHandler):
         :param args: Additional arguments, such as images or JSON data.
         :type args: dict[str, any]
         """
+        self.storage_client = storage.Client(project=self.gcp_project_id)
+        self.pixaris_bucket = self.storage_client.bucket(self.gcp_pixaris_bucket_name)
 
+        # set and adjust experiment_run_name with timestamp
+        self._store_resolved_results(
+            project=project,
+            dataset=dataset,
+            experiment_run_name=self._resolve_experiment_run_name(
+                project, dataset, experiment_run_name
+            ),
+            image_name_pairs=image_name_pairs,
+            metric_values=metric_values,
+            args=args,
+        )
+
+    def _store_resolved_results(
+        self,
+        project: str,
+        dataset: str,
+        experiment_run_name: str,
+        image_name_pairs: Iterable[tuple[Image.Image, str]],
+        metric_values: dict[str, float],
+        args: dict[str, any],
+    ):
+        """
+        Stores the results of an experiment under a name from _resolve_experiment_run_name. The files are
+        overwritten if the run is stored again, and the BigQuery row is inserted last, so a run whose store failed
+        can be stored again without adding a second run.
+
+        :param project: The name of the project.
+        :type project: str
+        :param dataset: The name of the dataset.
+        :type dataset: str
+        :param experiment_run_name: The unique name of the experiment run.
+        :type experiment_run_name: str
+        :param image_name_pairs: An iterable of tuples containing images and their names.
+        :type image_name_pairs: Iterable[tuple[Image.Image, str]]
+        :param metric_values: A dictionary of metric names and their values.
+        :type metric_values: dict[str, float]
+        :param args: Additional arguments, such as images or JSON data.
+        :type args: dict[str, any]
+        """
         self.project = project
         self.dataset = dataset
+        self.experiment_run_name = experiment_run_name
         self.storage_client = storage.Client(project=self.gcp_project_id)
         self.bigquery_client = bigquery.Client(project=self.gcp_project_id)
         self.pixaris_bucket = self.storage_client.bucket(self.gcp_pixaris_bucket_name)
-
-        # set and adjust experiment_run_name with timestamp
-        self.experiment_run_name = experiment_run_name
-        self.experiment_run_name = self._ensure_unique_experiment_run_name()
         # prevent that args["experiment_run_name"] will overwrite unique experiment_run_name
         args["experiment_run_name"] = self.experiment_run_name
 
         self._validate_args(args=args)
 
         # store images that were generated by the generator AND additional input images from args
+        image_name_pairs = list(image_name_pairs)
         self._prepare_additional_pillow_images_upload(
             args=args, image_name_pairs=image_name_pairs
         )
 
-        # upload all content of metric_values and args to bigquery and bucket if applicable
+        self._store_generated_images(image_name_pairs=image_name_pairs)
+
+        # upload all content of metric_values and args to bigquery and bucket if applicable, the row marks the run
+        # as stored
         self._store_experiment_parameters_and_results(
             metric_values=metric_values, args=args
         )
 
-        self._store_generated_images(image_name_pairs=image_name_pairs)
+    def _list_subdirectories(self, prefix: str) -> list[str]:
+        """
+        Lists the names of the "directories" directly below a prefix, without listing the objects inside them.
+
+        :param prefix: The prefix, ending with "/".
+        :type prefix: str
+        :return: The sorted names of the subdirectories.
+        :rtype: list[str]
+        """
+        iterator = self.pixaris_bucket.list_blobs(prefix=prefix, delimiter="/")
+        # the prefixes are collected while the pages are fetched
+        for _ in iterator.pages:
+            pass
+        return sorted(
+            subdirectory[len(prefix) :].rstrip("/")
+            for subdirectory in iterator.prefixes
+        )
 
     def load_projects_and_datasets(self) -> dict:
         """
@@ -316,51 +477,77 @@ class GCPExperimentHandler(ExperimentHandler):
         self.storage_client = storage.Client(project=self.gcp_project_id)
         self.pixaris_bucket = self.storage_client.bucket(self.gcp_pixaris_bucket_name)
 
-        blobs = self.pixaris_bucket.list_blobs()
-
-        project_dict = {}
-        for blob in blobs:
-            name = blob.name
-            if name.startswith("results/") and name != "results/":
-                prefix_removed = name.split("results/")[1]
-                parts = prefix_removed.split("/")
-                if (
-                    len(parts) >= 2
-                ):  # Ensure there is at least a project and dataset level
-                    project, dataset = parts[0], parts[1]
-                    if project not in project_dict and project != "pickled_results":
-                        project_dict[project] = []
-                    if (
-                        dataset not in project_dict[project]
-                        and dataset != "feedback_iterations"
-                    ):
-                        project_dict[project].append(dataset)
-        return project_dict
+        projects = [
+            project
+            for project in self._list_subdirectories("results/")
+            if project != "pickled_results"
+        ]
+        # one listing per project, independent of the number of runs and images
+        with ThreadPoolExecutor(max_workers=8) as executor:
+            datasets = executor.map(
+                lambda project: self._list_subdirectories(f"results/{project}/"),
+                projects,
+            )
+            project_dict = {}
+            for project, project_datasets in zip(projects, datasets):
+                project_datasets = [
+                    dataset
+                    for dataset in project_datasets
+                    if dataset != "feedback_iterations"
+                ]
+                # projects without experiment results are not listed
+                if project_datasets:
+                    project_dict[project] = project_datasets
+            return project_dict
 
     def load_experiment_results_for_dataset(
         self,
         project: str,
         dataset: str,
+        columns: list[str] = None,
+        filters: dict[str, any] = None,
     ) -> pd.DataFrame:
         """
-        Loads the results of an experiment from a BigQuery dataset.
+        Loads the results of an experiment from a BigQuery dataset. The column and row selection is part of the query.
 
         :param project: The name of the project.
         :type project: str
         :param dataset: The name of the dataset.
         :type dataset: str
+        :param columns: The columns to load, e.g. ["experiment_run_name"]. Defaults to None, loading all columns.
+        :type columns: list[str], optional
+        :param filters: The accepted values, a single value or a list, by column, e.g.
+          {"experiment_run_name": ["run-1", "run-2"]}. Defaults to None, loading all rows.
+        :type filters: dict[str, any], optional
         :return: The results of the experiment as a pandas DataFrame.
         :rtype: pd.DataFrame
         """
+        conditions, query_parameters = [], []
+        for i, (column, values) in enumerate((filters or {}).items()):
+            values = (
+                list(values) if isinstance(values, (list, tuple, set)) else [values]
+            )
+            conditions.append(f"`{column}` IN UNNEST(@filter_{i})")
+            query_parameters.append(
+                bigquery.ArrayQueryParameter(
+                    f"filter_{i}",
+                    python_type_to_bq_type(type(values[0])) if values else "STRING",
+                    values,
+                )
+            )
         query = f"""
-        SELECT *
+        SELECT {", ".join(f"`{column}`" for column in columns) if columns else "*"}
         FROM `{self.gcp_bq_experiment_dataset}.{project}_{dataset}_experiment_results`
+        {"WHERE " + " AND ".join(conditions) if conditions else ""}
         """
 
         self.bigquery_client = bigquery.Client(project=self.gcp_project_id)
 
         try:
-            query_job = self.bigquery_client.query(query)
+            query_job = self.bigquery_client.query(
+                query,
+                job_config=bigquery.QueryJobConfig(query_parameters=query_parameters),
+            )
             results = query_job.result()
             return results.to_dataframe()
         except Exception as e:
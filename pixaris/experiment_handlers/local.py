@@ -1,10 +1,13 @@
 import json
 import os
 import time
-from typing import Iterable
+from typing import Collection, Iterable
 from PIL import Image
 from PIL.PngImagePlugin import PngInfo
-from pixaris.experiment_handlers.base import ExperimentHandler
+from pixaris.experiment_handlers.base import ExperimentHandler, _unreserved_name
+from pixaris.experiment_handlers.tracking import SQLiteTrackingStore, filter_results
+from pixaris.experiment_handlers.utils import save_images
+from pixaris.utils.encoding import IMAGE_EXTENSIONS, resolve_encoding_profile
 import pandas as pd
 
 
@@ -14,15 +17,68 @@ class LocalExperimentHandler(ExperimentHandler):
 
     :param local_results_folder: The root folder where the experiment subfolder is located. Defaults to 'local_results'.
     :type local_results_folder: str, optional
+    :param save_workers: The number of workers encoding and writing the generated images in parallel. Defaults to 1.
+    :type save_workers: int, optional
+    :param save_worker_type: "process" or "thread". Processes scale better for PNG encoding. Defaults to "process".
+    :type save_worker_type: str, optional
+    :param encoding_profile: How the generated images are encoded, the name of a profile in
+      pixaris.utils.encoding.ENCODING_PROFILES, e.g. "png-fast" or "webp-lossless", or a custom profile dict.
+      It is recorded in the tracking row. Defaults to "png".
+    :type encoding_profile: str | dict, optional
+    :param tracking_backend: Where the tracking rows of a dataset are stored, "jsonl" for experiment_tracking.jsonl or
+      "sqlite" for experiment_tracking.sqlite, which loads only the columns and rows the UI displays. An existing
+      JSONL file is imported when the SQLite file is created. Defaults to "jsonl".
+    :type tracking_backend: str, optional
     """
 
-    def __init__(self, local_results_folder: str = "local_results"):
+    def __init__(
+        self,
+        local_results_folder: str = "local_results",
+        save_workers: int = 1,
+        save_worker_type: str = "process",
+        encoding_profile: str | dict = "png",
+        tracking_backend: str = "jsonl",
+    ):
         """
         Initialize the LocalExperimentHandler.
         Args:
             local_results_folder (str, optional): The root folder where the experiment subfolder is located. Defaults to 'local_results'.
+            save_workers (int, optional): The number of workers saving the generated images in parallel. Defaults to 1.
+            save_worker_type (str, optional): "process" or "thread". Defaults to "process".
+            encoding_profile (str | dict, optional): How the generated images are encoded. Defaults to "png".
+            tracking_backend (str, optional): "jsonl" or "sqlite". Defaults to "jsonl".
         """
         self.local_results_folder = local_results_folder
+        self.save_workers = save_workers
+        self.save_worker_type = save_worker_type
+        self.encoding_profile = resolve_encoding_profile(encoding_profile)
+        if tracking_backend not in ("jsonl", "sqlite"):
+            raise ValueError(
+                f"Unsupported tracking backend {tracking_backend}. Choose jsonl or sqlite."
+            )
+        self.tracking_backend = tracking_backend
+
+    def get_tracking_store(self, project: str, dataset: str) -> SQLiteTrackingStore:
+        """
+        The SQLite tracking store of a dataset, e.g. to export it as JSONL or compact it. If it does not exist yet,
+        the rows of the dataset's experiment_tracking.jsonl are imported.
+
+        :param project: The name of the project.
+        :type project: str
+        :param dataset: The name of the evaluation set.
+        :type dataset: str
+        :return: The tracking store.
+        :rtype: SQLiteTrackingStore
+        """
+        dataset_dir = os.path.join(self.local_results_folder, project, dataset)
+        store = SQLiteTrackingStore(
+            os.path.join(dataset_dir, "experiment_tracking.sqlite")
+        )
+        jsonl_path = os.path.join(dataset_dir, "experiment_tracking.jsonl")
+        if not os.path.exists(store.path) and os.path.exists(jsonl_path):
+            print(f"Importing {jsonl_path} into {store.path}.")
+            store.import_jsonl(jsonl_path)
+        return store
 
     def store_results(
         self,
@@ -49,28 +105,87 @@ class LocalExperimentHandler(ExperimentHandler):
         :type metric_values: dict[str, float]
         :param args: The arguments of the experiment to be saved as a JSON file. If any argument is a PIL Image, it will be saved as an image file.
         :type args: dict[str, any]
-        :param dataset_tracking_file_name: The name of the tracking file. Defaults to 'experiment_tracking.jsonl'.
+        :param dataset_tracking_file_name: The name of the tracking file of the jsonl tracking backend. Defaults to
+          'experiment_tracking.jsonl'.
         :type dataset_tracking_file_name: str
         """
-        timestamp = time.strftime("%Y%m%d-%H%M%S")
+        self._store_resolved_results(
+            project=project,
+            dataset=dataset,
+            experiment_run_name=self._resolve_experiment_run_name(
+                project, dataset, experiment_run_name
+            ),
+            image_name_pairs=image_name_pairs,
+            metric_values=metric_values,
+            args=args,
+            dataset_tracking_file_name=dataset_tracking_file_name,
+        )
+
+    def _resolve_experiment_run_name(
+        self,
+        project: str,
+        dataset: str,
+        experiment_run_name: str,
+        reserved_names: Collection[str] = (),
+    ) -> str:
+        """
+        Prefixes the experiment run name with the current timestamp. A counter is appended if the name is reserved,
+        e.g. by a run of the same second that is not stored yet.
+
+        :return: The name of the experiment run directory.
+        :rtype: str
+        """
+        return _unreserved_name(
+            time.strftime("%Y%m%d-%H%M%S") + "_" + experiment_run_name, reserved_names
+        )
+
+    def _store_resolved_results(
+        self,
+        project: str,
+        dataset: str,
+        experiment_run_name: str,
+        image_name_pairs: Iterable[tuple[Image.Image, str]],
+        metric_values: dict[str, float],
+        args: dict[str, any],
+        dataset_tracking_file_name: str = "experiment_tracking.jsonl",
+    ):
+        """
+        Saves the results under a name from _resolve_experiment_run_name. The files are overwritten if the run is
+        stored again and the tracking row is written last, so a run whose store failed can be stored again without
+        adding a second run. See store_results for the parameters.
+        """
+        timestamp = experiment_run_name.split("_", 1)[0]
         save_dir = os.path.join(
             self.local_results_folder,
             project,
             dataset,
-            timestamp + "_" + experiment_run_name,
+            experiment_run_name,
         )
 
         os.makedirs(save_dir, exist_ok=True)
 
         # Save each image in the collection
+        image_name_pairs = list(image_name_pairs)
         if image_name_pairs:
             os.makedirs(os.path.join(save_dir, "generated_images"), exist_ok=True)
-        for image, name in image_name_pairs:
-            image.save(
-                os.path.join(save_dir, "generated_images", name.split(".")[0] + ".png"),
-                "PNG",
-                # if you switch to JPEG, use quality=95 as input! Otherwise, expect square artifacts
-            )
+        profile = self.encoding_profile
+        save_images(
+            [
+                (
+                    image,
+                    os.path.join(
+                        save_dir,
+                        "generated_images",
+                        name.split(".")[0] + profile["extension"],
+                    ),
+                )
+                for image, name in image_name_pairs
+            ],
+            {"format": profile["format"], **profile["save_kwargs"]},
+            workers=self.save_workers,
+            worker_type=self.save_worker_type,
+            pass_through=profile["pass_through"],
+        )
 
         args_with_files_as_paths = {}
         for key, value in args.items():
@@ -96,15 +211,20 @@ class LocalExperimentHandler(ExperimentHandler):
         }
         tracking_info.update(args_with_files_as_paths)
         tracking_info.update(metric_values)
+        # readers need to know how the generated images are encoded
+        tracking_info["encoding_profile"] = profile["name"]
 
-        # manually update experiment_run_name to include timestamp
-        tracking_info["experiment_run_name"] = timestamp + "_" + experiment_run_name
+        # the experiment_run_name includes the timestamp
+        tracking_info["experiment_run_name"] = experiment_run_name
 
         # Save the results as JSON files in the experiment subfolder
         with open(os.path.join(save_dir, "args.json"), "w") as f:
             json.dump(tracking_info, f)
 
         # Append the results to the global tracking file
+        if self.tracking_backend == "sqlite":
+            self.get_tracking_store(project, dataset).append([tracking_info])
+            return
         with open(
             os.path.join(
                 self.local_results_folder, project, dataset, dataset_tracking_file_name
@@ -143,20 +263,31 @@ class LocalExperimentHandler(ExperimentHandler):
         self,
         project: str,
         dataset: str,
+        columns: list[str] = None,
+        filters: dict[str, any] = None,
     ) -> pd.DataFrame:
         """
-        Load the results of an experiment.
+        Load the results of an experiment. With the sqlite tracking backend, only the selected columns and rows are
+        read.
 
         :param project: The name of the project.
         :type project: str
         :param dataset: The name of the evaluation set.
         :type dataset: str
+        :param columns: The columns to load, e.g. ["experiment_run_name"]. Defaults to None, loading all columns.
+        :type columns: list[str], optional
+        :param filters: The accepted values, a single value or a list, by column, e.g.
+          {"experiment_run_name": ["run-1", "run-2"]}. Defaults to None, loading all rows.
+        :type filters: dict[str, any], optional
         :return: The results of the experiment as a DataFrame.
         :rtype: pd.DataFrame
         """
         if not project or not dataset:  # can happen in UI, does not need action
             return pd.DataFrame()
 
+        if self.tracking_backend == "sqlite":
+            return self.get_tracking_store(project, dataset).load(columns, filters)
+
         results_file = os.path.join(
             self.local_results_folder,
             project,
@@ -166,7 +297,9 @@ class LocalExperimentHandler(ExperimentHandler):
 
         if os.path.exists(results_file) and os.stat(results_file).st_size > 0:
             try:
-                return pd.read_json(results_file, lines=True)
+                return filter_results(
+                    pd.read_json(results_file, lines=True), columns, filters
+                )
             except ValueError:
                 print(
                     f"Error reading {results_file}. File might be empty or corrupted."
@@ -197,7 +330,7 @@ class LocalExperimentHandler(ExperimentHandler):
         local_image_paths = [
             os.path.join(results_dir, image_name)
             for image_name in os.listdir(results_dir)
-            if image_name.endswith((".png", ".jpg", ".jpeg"))
+            if image_name.endswith(IMAGE_EXTENSIONS)
         ]
         local_image_paths.sort()
         return local_image_paths
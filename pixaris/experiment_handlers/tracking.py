@@ -0,0 +1,281 @@
+import contextlib
+import inspect
+import json
+import os
+import sqlite3
+from typing import Iterable, List
+import pandas as pd
+
+TRACKING_TABLE = "experiment_results"
+
+
+def _quote(name: str) -> str:
+    """Quotes a column name for SQL, tracking rows can have arbitrary argument names as keys."""
+    return '"' + name.replace('"', '""') + '"'
+
+
+def _filter_values(values: any) -> list:
+    """A single filter value or a list of accepted values, as a list."""
+    return list(values) if isinstance(values, (list, tuple, set)) else [values]
+
+
+def _encode_value(value: any) -> any:
+    """
+    Converts a tracking value to a type SQLite stores. Lists and dicts are stored as JSON in a BLOB, so the
+    storage class of each value tells whether it has to be decoded, and strings are never mistaken for JSON.
+    """
+    if isinstance(value, (list, dict)):
+        return json.dumps(value).encode("utf-8")
+    if not isinstance(value, (str, int, float, bool, type(None))):
+        return str(value)
+    return value
+
+
+def _decode_value(value: any) -> any:
+    """Decodes a value loaded from SQLite, see _encode_value."""
+    return json.loads(value) if isinstance(value, bytes) else value
+
+
+def filter_results(
+    results: pd.DataFrame,
+    columns: List[str] = None,
+    filters: dict[str, any] = None,
+) -> pd.DataFrame:
+    """
+    Applies the column and row selection of load_experiment_results_for_dataset to results that were loaded
+    completely, e.g. from a JSONL tracking file.
+
+    :param results: The experiment results.
+    :type results: pd.DataFrame
+    :param columns: The columns to keep, missing columns are ignored. Defaults to None, keeping all columns.
+    :type columns: List[str], optional
+    :param filters: The accepted values, a single value or a list, by column. Defaults to None, keeping all rows.
+    :type filters: dict[str, any], optional
+    :return: The selected results.
+    :rtype: pd.DataFrame
+    """
+    for column, values in (filters or {}).items():
+        if column not in results.columns:
+            results = results.iloc[0:0]
+        else:
+            results = results[results[column].isin(_filter_values(values))]
+    if columns is not None:
+        results = results[[column for column in columns if column in results.columns]]
+    return results.reset_index(drop=True)
+
+
+def _accepts_selection(load_results) -> bool:
+    """Whether a load_experiment_results_for_dataset implementation takes the columns and filters arguments."""
+    try:
+        parameters = inspect.signature(load_results).parameters
+    except (TypeError, ValueError):
+        return False
+    if any(p.kind is inspect.Parameter.VAR_KEYWORD for p in parameters.values()):
+        return True
+    return "columns" in parameters and "filters" in parameters
+
+
+def load_experiment_results(
+    experiment_handler,
+    project: str,
+    dataset: str,
+    columns: List[str] = None,
+    filters: dict[str, any] = None,
+) -> pd.DataFrame:
+    """
+    Loads the selected experiment results of a dataset from an experiment handler. Handlers that do not take
+    columns and filters yet load all results, which are selected afterwards.
+
+    :param experiment_handler: The experiment handler.
+    :type experiment_handler: ExperimentHandler
+    :param project: The name of the project.
+    :type project: str
+    :param dataset: The name of the dataset.
+    :type dataset: str
+    :param columns: The columns to load. Defaults to None, loading all columns.
+    :type columns: List[str], optional
+    :param filters: The accepted values, a single value or a list, by column. Defaults to None, loading all rows.
+    :type filters: dict[str, any], optional
+    :return: The selected results.
+    :rtype: pd.DataFrame
+    """
+    load_results = experiment_handler.load_experiment_results_for_dataset
+    if _accepts_selection(load_results):
+        return load_results(project, dataset, columns=columns, filters=filters)
+    return filter_results(load_results(project, dataset), columns, filters)
+
+
+class SQLiteTrackingStore:
+    """
+    Stores the experiment tracking rows of a dataset in a SQLite file. Appending a row does not rewrite the file,
+    and loading reads only the selected columns and rows, using an index on experiment_run_name. Columns are added
+    when rows bring new keys, lists and dicts are stored as JSON and decoded when loading. SQLite has no
+    boolean type, booleans are stored and loaded as 1 and 0. Column names are case-insensitive in SQLite, a key
+    that differs from an existing column only in case is stored in and loaded as that column.
+
+    :param path: The path of the SQLite file, created on first append.
+    :type path: str
+    """
+
+    def __init__(self, path: str):
+        self.path = path
+
+    @contextlib.contextmanager
+    def _connect(self):
+        # other processes may append at the same time, wait for their locks
+        connection = sqlite3.connect(self.path, timeout=30)
+        try:
+            with connection:
+                yield connection
+        finally:
+            connection.close()
+
+    @staticmethod
+    def _columns(connection: sqlite3.Connection) -> List[str]:
+        return [
+            row[1] for row in connection.execute(f"PRAGMA table_info({TRACKING_TABLE})")
+        ]
+
+    def append(self, rows: Iterable[dict]):
+        """
+        Appends tracking rows in one transaction, adding the columns that do not exist yet.
+
+        :param rows: The tracking rows.
+        :type rows: Iterable[dict]
+        :raises ValueError: If keys of a row differ only in case.
+        """
+        rows = list(rows)
+        if not rows:
+            return
+        os.makedirs(os.path.dirname(self.path) or ".", exist_ok=True)
+        with self._connect() as connection:
+            # the existing column of each case-folded key
+            columns = {column.lower(): column for column in self._columns(connection)}
+            column_rows = []
+            for row in rows:
+                column_row = {}
+                for key, value in row.items():
+                    column = columns.get(key.lower())
+                    if column is None:
+                        if not columns:
+                            connection.execute(
+                                f"CREATE TABLE {TRACKING_TABLE} ({_quote(key)})"
+                            )
+                        else:
+                            connection.execute(
+                                f"ALTER TABLE {TRACKING_TABLE} ADD COLUMN {_quote(key)}"
+                            )
+                        column = columns[key.lower()] = key
+                    if column in column_row:
+                        raise ValueError(
+                            f"The tracking row has keys that differ only in case: {column_row[column][0]}, {key}."
+                        )
+                    column_row[column] = (key, _encode_value(value))
+                column_rows.append(column_row)
+            if "experiment_run_name" in columns:
+                # the UI loads the rows of selected experiment runs
+                connection.execute(
+                    f"CREATE INDEX IF NOT EXISTS {TRACKING_TABLE}_experiment_run_name "
+                    f"ON {TRACKING_TABLE} (experiment_run_name)"
+                )
+
+            for column_row in column_rows:
+                connection.execute(
+                    f"INSERT INTO {TRACKING_TABLE} ({', '.join(_quote(column) for column in column_row)}) "
+                    f"VALUES ({', '.join('?' * len(column_row))})",
+                    [value for _, value in column_row.values()],
+                )
+
+    def load(
+        self,
+        columns: List[str] = None,
+        filters: dict[str, any] = None,
+    ) -> pd.DataFrame:
+        """
+        Loads tracking rows in the order they were appended. The selection is done by SQLite, so only the
+        selected columns and rows are read.
+
+        :param columns: The columns to load, missing columns are ignored. Defaults to None, loading all columns.
+        :type columns: List[str], optional
+        :param filters: The accepted values, a single value or a list, by column. Defaults to None, loading all rows.
+        :type filters: dict[str, any], optional
+        :return: The tracking rows.
+        :rtype: pd.DataFrame
+        """
+        if not os.path.exists(self.path):
+            return pd.DataFrame(columns=columns)
+        with self._connect() as connection:
+            existing_columns = {
+                column.lower(): column for column in self._columns(connection)
+            }
+            if not existing_columns:
+                return pd.DataFrame(columns=columns)
+            if columns is not None:
+                columns = list(
+                    dict.fromkeys(
+                        existing_columns[column.lower()]
+                        for column in columns
+                        if column.lower() in existing_columns
+                    )
+                )
+                if not columns:
+                    return pd.DataFrame()
+            else:
+                columns = list(existing_columns.values())
+            conditions, params = [], []
+            for column, values in (filters or {}).items():
+                if column.lower() not in existing_columns:
+                    return pd.DataFrame(columns=columns)
+                values = _filter_values(values)
+                conditions.append(
+                    f"{_quote(column)} IN ({', '.join('?' * len(values))})"
+                )
+                params.extend(values)
+            query = f"SELECT {', '.join(_quote(column) for column in columns)} FROM {TRACKING_TABLE}"
+            if conditions:
+                query += " WHERE " + " AND ".join(conditions)
+            results = pd.read_sql_query(
+                query + " ORDER BY rowid", connection, params=params
+            )
+            for column in results.columns:
+                if results[column].dtype == object:
+                    results[column] = results[column].map(_decode_value)
+        return results
+
+    def import_jsonl(self, jsonl_path: str):
+        """
+        Appends the rows of a JSONL tracking file, e.g. one written by the jsonl tracking backend.
+
+        :param jsonl_path: The path of the JSONL file.
+        :type jsonl_path: str
+        """
+        with open(jsonl_path, "r") as f:
+            self.append(json.loads(line) for line in f if line.strip())
+
+    def export_jsonl(self, jsonl_path: str):
+        """
+        Writes all rows to a JSONL tracking file, leaving out the columns a row has no value for.
+
+        :param jsonl_path: The path of the JSONL file.
+        :type jsonl_path: str
+        """
+        results = self.load()
+        with open(jsonl_path, "w") as f:
+            for row in results.to_dict(orient="records"):
+                row = {
+                    key: value
+                    for key, value in row.items()
+                    if isinstance(value, (list, dict)) or not pd.isna(value)
+                }
+                f.write(json.dumps(row) + "\n")
+
+    def compact(self):
+        """
+        Rebuilds the file to reclaim unused pages, e.g. after many small appends or schema changes.
+        """
+        connection = sqlite3.connect(self.path, timeout=30)
+        try:
+            # VACUUM cannot run inside a transaction
+            connection.execute("VACUUM")
+        finally:
+            connection.close()
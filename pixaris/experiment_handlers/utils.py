@@ -0,0 +1,83 @@
+from concurrent.futures import ProcessPoolExecutor, ThreadPoolExecutor
+import time
+from typing import List
+from PIL import Image
+from pixaris.utils.encoding import convert_for_format, get_encoded_bytes
+
+
+def _save_image(image: Image.Image, path: str, save_kwargs: dict) -> str:
+    convert_for_format(image, save_kwargs.get("format")).save(path, **save_kwargs)
+    return path
+
+
+def save_images(
+    images: List[tuple[Image.Image, str]],
+    save_kwargs: dict = None,
+    workers: int = 1,
+    worker_type: str = "process",
+    pass_through: bool = False,
+) -> List[str]:
+    """
+    Encodes and writes images, in parallel if more than one worker is given. Encoding PNGs is CPU bound and zlib
+    only releases the GIL for parts of it, so processes scale better than threads. Reports the progress in the
+    order of the images and re-raises the first error after all images were attempted.
+
+    :param images: The images and the paths to save them to.
+    :type images: List[tuple[Image.Image, str]]
+    :param save_kwargs: Passed on to Image.save, e.g. {"format": "PNG"}. Defaults to None.
+    :type save_kwargs: dict, optional
+    :param workers: The number of parallel workers. Defaults to 1, saving on the calling thread.
+    :type workers: int
+    :param worker_type: "process" or "thread". Defaults to "process".
+    :type worker_type: str
+    :param pass_through: Whether to write the original bytes of images a generator returned already encoded in the
+      format, instead of encoding them again. Defaults to False.
+    :type pass_through: bool
+    :raises ValueError: If worker_type is not supported.
+    :return: The paths of the saved images, in order.
+    :rtype: List[str]
+    """
+    save_kwargs = save_kwargs or {}
+    if pass_through:
+        # writing is cheap, the attached bytes would not survive pickling to a worker process anyway
+        to_encode = []
+        for image, path in images:
+            encoded = get_encoded_bytes(image, save_kwargs.get("format"))
+            if encoded is None:
+                to_encode.append((image, path))
+            else:
+                with open(path, "wb") as f:
+                    f.write(encoded)
+        save_images(to_encode, save_kwargs, workers, worker_type)
+        return [path for _, path in images]
+    if workers <= 1 or len(images) <= 1:
+        return [_save_image(image, path, save_kwargs) for image, path in images]
+    if worker_type == "process":
+        executor = ProcessPoolExecutor(max_workers=workers)
+    elif worker_type == "thread":
+        executor = ThreadPoolExecutor(max_workers=workers)
+    else:
+        raise ValueError(f"Unsupported worker type {worker_type}.")
+
+    start = time.monotonic()
+    errors = []
+    with executor:
+        futures = [
+            executor.submit(_save_image, image, path, save_kwargs)
+            for image, path in images
+        ]
+        report_every = max(1, len(futures) // 10)
+        for i, (future, (_, path)) in enumerate(zip(futures, images), start=1):
+            try:
+                future.result()
+            except Exception as e:
+                print(f"Failed to save {path} due to exception: {e}")
+                errors.append(e)
+            if i % report_every == 0 or i == len(futures):
+                print(f"Saved {i - len(errors)}/{len(futures)} images.")
+    if errors:
+        raise errors[0]
+    print(
+        f"Saved {len(images)} images on {workers} {worker_type} workers in {time.monotonic() - start:.1f} s."
+    )
+    return [path for _, path in images]
@@ -4,6 +4,7 @@ import gradio as gr
 from datetime import datetime
 import os
 from PIL import Image
+from pixaris.utils.encoding import IMAGE_EXTENSIONS
 
 from pixaris.utils.bigquery import ensure_table_exists
 
@@ -182,7 +183,7 @@ class GCPFeedbackHandler(FeedbackHandler):
         image_names = [
             filename
             for filename in os.listdir(local_image_directory)
-            if filename.endswith((".jpg", ".jpeg", ".png"))
+            if filename.endswith(IMAGE_EXTENSIONS)
         ]
 
         # add date for versioning if not provided
@@ -1,5 +1,6 @@
 import gradio as gr
 from pixaris.experiment_handlers.base import ExperimentHandler
+from pixaris.experiment_handlers.tracking import load_experiment_results
 import pandas as pd
 
 PROJECTS = []
@@ -55,11 +56,12 @@ def render_experiment_tracking_tab(
                 project_name, dataset, experiments, dataset_experiment_tracking_results
             ):
                 """Update choices of feedback iterations for selected project and display reload button."""
-                dataset_experiment_tracking_results = (
-                    experiment_handler.load_experiment_results_for_dataset(
-                        project=project_name,
-                        dataset=dataset,
-                    )
+                # only the run names, the rows are loaded for the selected experiments
+                dataset_experiment_tracking_results = load_experiment_results(
+                    experiment_handler,
+                    project=project_name,
+                    dataset=dataset,
+                    columns=["experiment_run_name"],
                 )
                 experiment_choices = list(
                     dataset_experiment_tracking_results["experiment_run_name"]
@@ -163,20 +165,18 @@ def render_experiment_tracking_tab(
             with gr.Tab("Table"):
                 # Display experiment results in a table
 
-                @gr.render(inputs=[experiments, dataset_experiment_tracking_results])
-                def render_experiment_results_table(
-                    experiments, dataset_experiment_tracking_results
-                ):
+                @gr.render(inputs=[project_name, dataset, experiments])
+                def render_experiment_results_table(project_name, dataset, experiments):
                     if not experiments:
                         gr.Markdown("No experiment selected.")
                         return
 
-                    table_data = dataset_experiment_tracking_results.copy()
-                    table_data = table_data.loc[
-                        dataset_experiment_tracking_results["experiment_run_name"].isin(
-                            experiments
-                        )
-                    ]
+                    table_data = load_experiment_results(
+                        experiment_handler,
+                        project=project_name,
+                        dataset=dataset,
+                        filters={"experiment_run_name": experiments},
+                    )
                     gr.DataFrame(
                         table_data,
                         label="Experiment Results",
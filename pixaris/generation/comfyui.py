@@ -123,7 +123,11 @@ class ComfyGenerator(ImageGenerator):
         # Load and set images from pillow_images
         for image_info in pillow_images:
             input_image = image_info["pillow_image"]
-            self.workflow.set_image(image_info["node_name"], input_image)
+            self.workflow.set_image(
+                image_info["node_name"],
+                input_image,
+                image_info.get("encoded_image"),
+            )
 
         # set seed or warn if it is not being set.
         if self.workflow.check_if_node_exists(
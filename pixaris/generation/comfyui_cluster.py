@@ -1,34 +1,159 @@
+from collections import deque
+from concurrent.futures import Future, TimeoutError as FutureTimeoutError
+import copy
 from typing import List
 from pixaris.generation.base import ImageGenerator
 from pixaris.generation.comfyui import ComfyGenerator
+from pixaris.generation.comfyui_utils.cluster_metrics import (
+    ComfyClusterMetrics,
+    start_metrics_server,
+)
+from pixaris.generation.comfyui_utils.workflow import ComfyWorkflow
 from PIL import Image
 import os
 
 
 from kubernetes import client, config
-from threading import Lock, Thread
+from threading import Condition, Lock, Thread
 import requests
 import time
 
 DEV_MODE = os.getenv("DEV_MODE", "false") == "true"
 mutex = Lock()
+# signalled whenever a job is queued, a host changes state or the cluster is closed
+host_condition = Condition(mutex)
+
+
+class ComfyClusterJob:
+    """
+    A single image generation request waiting for or running on a Comfy host.
+
+    :param args: The arguments that will be handed to ComfyGenerator.generate_single_image.
+    :type args: dict[str, any]
+    """
+
+    def __init__(self, args: dict[str, any]):
+        self.args = args
+        self.future = Future()
+        self.retries = 0
+        self.submitted_at = time.time()
+        self.started_at = None
+        self.cancelled = False
+
+
+class ComfyHostWorker:
+    """
+    Persistent worker for one Comfy host. It keeps a small local queue of pending jobs and runs up to
+    pipeline_depth of them at the same time, so the next prompt is already queued in ComfyUI when the
+    current one finishes. Every pipeline slot owns one ComfyGenerator that is reused for all of its jobs.
+    When its own queue is empty, a slot takes work from the cluster backlog or steals from the busiest other host.
+
+    :param cluster: The cluster this worker belongs to.
+    :type cluster: ComfyClusterGenerator
+    :param host: The host address, e.g. "10.0.0.1:8188".
+    :type host: str
+    :param pipeline_depth: The number of jobs that are sent to the host at the same time.
+    :type pipeline_depth: int
+    """
+
+    def __init__(
+        self, cluster: "ComfyClusterGenerator", host: str, pipeline_depth: int
+    ):
+        self.cluster = cluster
+        self.host = host
+        self.pipeline_depth = pipeline_depth
+        self.queue = deque()
+        self.in_flight = 0
+        self.unresponsive = False
+        self.threads = []
+
+    def load(self) -> int:
+        """
+        Number of jobs queued for or running on this host. Call while holding the mutex.
+
+        :return: The number of queued and running jobs.
+        :rtype: int
+        """
+        return len(self.queue) + self.in_flight
+
+    def start(self):
+        """
+        Start one thread per pipeline slot.
+        """
+        for _ in range(self.pipeline_depth):
+            thread = Thread(target=self._run, daemon=True)
+            thread.start()
+            self.threads.append(thread)
+
+    def _run(self):
+        """
+        Take jobs from the cluster until it is closed and run them with a reused ComfyGenerator.
+        """
+        comfy_generator = ComfyGenerator(
+            workflow_apiformat_json=copy.deepcopy(self.cluster.workflow_template),
+            api_host=self.host,
+        )
+        while True:
+            job = self.cluster._next_job(self)
+            if job is None:
+                return
+            # start every job from the cleaned template so no values leak from the previous job
+            comfy_generator.workflow.workflow_apiformat_json = copy.deepcopy(
+                self.cluster.workflow_template
+            )
+            try:
+                result = comfy_generator.generate_single_image(job.args)
+                self.cluster.metrics.record_job_finished(
+                    self.host, time.time() - job.started_at
+                )
+                job.future.set_result(result)
+            except Exception as e:
+                self.cluster._handle_failed_job(self, job, e)
+            finally:
+                with host_condition:
+                    self.in_flight -= 1
+                    host_condition.notify_all()
 
 
 class ComfyClusterGenerator(ImageGenerator):
     """
-    Cluster to run Comfy workflows. It will automatically fetch available hosts, initiate a new ComfyGenerator for each and distribute the workflows to them.
+    Cluster to run Comfy workflows. It will automatically fetch available hosts, start a persistent ComfyHostWorker
+    for each and distribute the workflows to them. Idle workers steal queued jobs from busy ones.
     If the environment variable DEV_MODE is set to true, it will run the workflows locally and it uses localhost:8188.
 
-    :param workflow_apiformat_json: The path to the workflow file in API format. (ABSOLUTE PATH)!
-    :type workflow_apiformat_json: str
+    :param workflow_apiformat_json: The workflow file in API format.
+    :type workflow_apiformat_json: dict
+    :param pipeline_depth: The number of prompts that are queued on each host at the same time. Defaults to 2.
+    :type pipeline_depth: int
+    :param max_retries: How often a job is tried on different hosts before it fails. Defaults to 3.
+    :type max_retries: int
+    :param host_timeout: Seconds a job waits for any responsive host before it fails. Defaults to 1200.
+    :type host_timeout: int
+    :param metrics_port: If set, serve the cluster metrics in the Prometheus text format on this port. Defaults to None.
+    :type metrics_port: int, optional
     """
 
     def __init__(
         self,
-        workflow_apiformat_json: str,
+        workflow_apiformat_json: dict,
+        pipeline_depth: int = 2,
+        max_retries: int = 3,
+        host_timeout: int = 1200,
+        metrics_port: int = None,
     ):
         self.workflow_apiformat_json = workflow_apiformat_json
+        self.pipeline_depth = pipeline_depth
+        self.max_retries = max_retries
+        self.host_timeout = host_timeout
+        self.metrics_port = metrics_port
+        self.metrics = ComfyClusterMetrics()
+        # clean the workflow once, every job starts from a copy of this template
+        self.workflow_template = ComfyWorkflow(
+            api_host="",
+            workflow_apiformat_json=copy.deepcopy(workflow_apiformat_json),
+        ).workflow_apiformat_json
         self.hosts = {}
+        self.backlog = deque()
         self.run_background_task = False
 
     def _fetch_pod_ips(self) -> list[str]:
@@ -71,56 +196,202 @@ class ComfyClusterGenerator(ImageGenerator):
     def update_available_hosts(self):
         """
         Update the available hosts by fetching the IPs of the pods and checking if the Comfy UI is running on them.
+        A worker is started for every new host, known hosts are marked as responsive again.
         Use mutex to avoid conflicts.
         """
         available_hosts = self._fetch_available_hosts()
-        global mutex
-        with mutex:
+        with host_condition:
             for host in available_hosts:
                 if host not in self.hosts:
-                    self.hosts[host] = {"in_use": False, "unresponsive": False}
+                    worker = ComfyHostWorker(self, host, self.pipeline_depth)
+                    self.hosts[host] = worker
+                    if self.run_background_task:
+                        worker.start()
                 else:
-                    self.hosts[host]["unresponsive"] = False
-        print(f"Available hosts: {self.hosts}")
+                    self.hosts[host].unresponsive = False
+            host_condition.notify_all()
+            print(f"Available hosts: {list(self.hosts)}")
 
-    def _get_host(self) -> str:
+    def _mark_host_as_unresponsive(self, host: str):
         """
-        Get an available host. If no host is available, it will wait with a exponential backoff and try again, after the 15th retry, it will raise an exception. Use mutex to avoid conflicts.
+        Mark a host as unresponsive. Its queued jobs will be stolen by the other workers. Use mutex to avoid conflicts.
 
-        :return: The host to use
-        :rtype: str
+        :param host: The host to mark as unresponsive
+        :type host: str
         """
-        global mutex
-        for i in range(1, 15 + 1):
-            with mutex:
-                for host, info in self.hosts.items():
-                    if not info["in_use"] and not info["unresponsive"]:
-                        self.hosts[host]["in_use"] = True
-                        return host
-            time.sleep(i * i)
-        raise Exception("Timeout for getting host")
+        with host_condition:
+            self.hosts[host].unresponsive = True
+            host_condition.notify_all()
 
-    def _release_host(self, host: str):
+    def _submit_job(self, job: ComfyClusterJob):
         """
-        Release a host. Use mutex to avoid conflicts.
+        Queue a job on the least loaded responsive host. If every local queue is full, the job goes to the
+        cluster backlog, from where the next idle worker picks it up.
 
-        :param host: The host to release
-        :type host: str
+        :param job: The job to queue.
+        :type job: ComfyClusterJob
+        """
+        with host_condition:
+            responsive_workers = [
+                worker for worker in self.hosts.values() if not worker.unresponsive
+            ]
+            worker = min(responsive_workers, key=lambda w: w.load(), default=None)
+            if worker is not None and len(worker.queue) < worker.pipeline_depth:
+                worker.queue.append(job)
+            else:
+                self.backlog.append(job)
+            host_condition.notify_all()
+
+    def _take_job(self, worker: ComfyHostWorker) -> ComfyClusterJob | None:
         """
-        global mutex
-        with mutex:
-            self.hosts[host]["in_use"] = False
+        Take the next job for a worker: first from its own queue, then from the backlog and finally steal
+        the newest job of the host with the longest queue. Call while holding the mutex.
 
-    def _mark_host_as_unresponsive(self, host: str):
+        :param worker: The worker asking for a job.
+        :type worker: ComfyHostWorker
+        :return: The job to run or None if there is nothing to do.
+        :rtype: ComfyClusterJob | None
+        """
+        victims = sorted(
+            (other for other in self.hosts.values() if other is not worker),
+            key=lambda other: len(other.queue),
+            reverse=True,
+        )
+        sources = [worker.queue.popleft, self.backlog.popleft] + [
+            victim.queue.pop for victim in victims
+        ]
+        for take in sources:
+            while True:
+                try:
+                    job = take()
+                except IndexError:
+                    break
+                if not job.cancelled:
+                    return job
+        return None
+
+    def _next_job(self, worker: ComfyHostWorker) -> ComfyClusterJob | None:
         """
-        Mark a host as unresponsive. Use mutex to avoid conflicts.
+        Block until there is a job for the worker or the cluster is closed.
 
-        :param host: The host to mark as unresponsive
-        :type host: str
+        :param worker: The worker asking for a job.
+        :type worker: ComfyHostWorker
+        :return: The job to run or None if the cluster was closed.
+        :rtype: ComfyClusterJob | None
+        """
+        with host_condition:
+            while self.run_background_task:
+                if not worker.unresponsive:
+                    job = self._take_job(worker)
+                    if job is not None:
+                        job.started_at = time.time()
+                        self.metrics.record_job_started(
+                            worker.host, job.started_at - job.submitted_at
+                        )
+                        worker.in_flight += 1
+                        return job
+                host_condition.wait(timeout=1)
+        return None
+
+    def _handle_failed_job(
+        self, worker: ComfyHostWorker, job: ComfyClusterJob, error: Exception
+    ):
+        """
+        Mark the host of a failed job as unresponsive and queue the job again, until it ran out of retries.
+
+        :param worker: The worker the job failed on.
+        :type worker: ComfyHostWorker
+        :param job: The failed job.
+        :type job: ComfyClusterJob
+        :param error: The exception raised by the ComfyGenerator.
+        :type error: Exception
+        """
+        print(f"Error in ComfyGenerator on {worker.host}: {error}")
+        self._mark_host_as_unresponsive(worker.host)
+        job.retries += 1
+        self.metrics.record_job_failed(
+            worker.host, retried=job.retries < self.max_retries
+        )
+        if job.retries >= self.max_retries:
+            job.future.set_exception(error)
+            return
+        time.sleep(job.retries**2)
+        job.started_at = None
+        self._submit_job(job)
+
+    def _has_responsive_hosts(self) -> bool:
+        """
+        Check if at least one host is able to take jobs.
+
+        :return: True if there is a responsive host.
+        :rtype: bool
+        """
+        with host_condition:
+            return any(not worker.unresponsive for worker in self.hosts.values())
+
+    def get_metrics(self) -> dict:
+        """
+        Get the live utilisation of the cluster: job counters, acquisition wait and generation latency per host,
+        together with the current state of every host and the backlog.
+
+        :return: The metrics snapshot.
+        :rtype: dict
+        """
+        snapshot = self.metrics.snapshot()
+        with host_condition:
+            snapshot["backlog"] = len(self.backlog)
+            snapshot["total_hosts"] = len(self.hosts)
+            snapshot["busy_hosts"] = sum(
+                1 for worker in self.hosts.values() if worker.in_flight > 0
+            )
+            snapshot["unresponsive_hosts"] = sum(
+                1 for worker in self.hosts.values() if worker.unresponsive
+            )
+            for host, worker in self.hosts.items():
+                host_metrics = snapshot["hosts"].setdefault(host, {})
+                host_metrics["queued"] = len(worker.queue)
+                host_metrics["in_flight"] = worker.in_flight
+                host_metrics["unresponsive"] = worker.unresponsive
+        return snapshot
+
+    def metrics_as_prometheus_text(self) -> str:
         """
-        global mutex
-        with mutex:
-            self.hosts[host]["unresponsive"] = True
+        Render the cluster metrics in the Prometheus text format, e.g. for scraping or autoscaling.
+
+        :return: The metrics text.
+        :rtype: str
+        """
+        with host_condition:
+            busy = sum(1 for worker in self.hosts.values() if worker.in_flight > 0)
+            unresponsive = sum(
+                1 for worker in self.hosts.values() if worker.unresponsive
+            )
+            lines = [
+                "# HELP pixaris_comfy_hosts Known Comfy hosts by state.",
+                "# TYPE pixaris_comfy_hosts gauge",
+                f'pixaris_comfy_hosts{{state="busy"}} {busy}',
+                f'pixaris_comfy_hosts{{state="idle"}} {len(self.hosts) - busy - unresponsive}',
+                f'pixaris_comfy_hosts{{state="unresponsive"}} {unresponsive}',
+                "# HELP pixaris_comfy_backlog_jobs Jobs not yet assigned to a host.",
+                "# TYPE pixaris_comfy_backlog_jobs gauge",
+                f"pixaris_comfy_backlog_jobs {len(self.backlog)}",
+                "# HELP pixaris_comfy_queued_jobs Jobs waiting in the local queue of a host.",
+                "# TYPE pixaris_comfy_queued_jobs gauge",
+            ]
+            lines += [
+                f'pixaris_comfy_queued_jobs{{host="{host}"}} {len(worker.queue)}'
+                for host, worker in self.hosts.items()
+            ]
+            lines += [
+                "# HELP pixaris_comfy_in_flight_jobs Jobs currently running on a host.",
+                "# TYPE pixaris_comfy_in_flight_jobs gauge",
+            ]
+            lines += [
+                f'pixaris_comfy_in_flight_jobs{{host="{host}"}} {worker.in_flight}'
+                for host, worker in self.hosts.items()
+            ]
+        lines += self.metrics.to_prometheus_lines()
+        return "\n".join(lines) + "\n"
 
     def start_background_task(self):
         """
@@ -130,16 +401,27 @@ class ComfyClusterGenerator(ImageGenerator):
         def task():
             while self.run_background_task:
                 self.update_available_hosts()
-                time.sleep(60)
+                # close() wakes the task up, so it does not outlive the cluster
+                with host_condition:
+                    host_condition.wait_for(
+                        lambda: not self.run_background_task, timeout=60
+                    )
 
         self.background_task = Thread(target=task, daemon=True)
         self.background_task.start()
 
     def close(self):
         """
-        Close the cluster and release all hosts.
+        Close the cluster. Stops the background task, the metrics server and all host workers once their current jobs are done.
         """
-        self.run_background_task = False
+        if getattr(self, "metrics_server", None) is not None:
+            self.metrics_server.shutdown()
+            # release the port for the next cluster, e.g. of the next job of an orchestrator worker
+            self.metrics_server.server_close()
+            self.metrics_server = None
+        with host_condition:
+            self.run_background_task = False
+            host_condition.notify_all()
 
     def validate_inputs_and_parameters(
         self,
@@ -156,18 +438,17 @@ class ComfyClusterGenerator(ImageGenerator):
         :return: The path to the validated workflow file.
         :rtype: str
         """
-        dummy_generator = ComfyGenerator(self.workflow_apiformat_json)
-        generation_params = args.get("generation_params", [])
-        dummy_generator.validate_inputs_and_parameters(dataset, generation_params)
+        dummy_generator = ComfyGenerator(copy.deepcopy(self.workflow_template))
+        dummy_generator.validate_inputs_and_parameters(dataset, args)
 
     def generate_single_image(self, args: dict[str, any]) -> tuple[Image.Image, str]:
         # Todo: change the docstring format when this issue is closed: https://github.com/sphinx-doc/sphinx/issues/4220
         """
-        Generates a single image based on the provided arguments. For this it searches for a host, initialises a ComfyGenerator,
-        and lets it modify and execute the workflow to generate the image.
+        Generates a single image based on the provided arguments. For this it queues a job on the least loaded host
+        and waits until one of the host workers has modified and executed the workflow to generate the image.
 
         :param args: A dictionary containing the following keys:
-        * "workflow_apiformat_json" (str): The path to the workflow file in API format. (ABSOLUTE PATH)!
+        * "workflow_apiformat_json" (dict): The workflow file in API format.
         * "pillow_images" (list[dict]): A dict of [str, Image.Image].
           The keys should be Node names
           The values should be the PIL Image objects to be loaded.
@@ -189,36 +470,31 @@ class ComfyClusterGenerator(ImageGenerator):
         :rtype: tuple[Image.Image, str]
         """
         # on first execution, load config and start background task while ensuring only one worker will do it.
-        global mutex
-        with mutex:
+        with host_condition:
             if not self.run_background_task:
                 if DEV_MODE:
                     config.load_kube_config()
                 else:
                     config.load_incluster_config()
                 self.run_background_task = True
+                for worker in self.hosts.values():
+                    worker.start()
                 self.start_background_task()
-
-        for retry in range(3):
-            host = self._get_host()
-
-            # initialize comfy generator for this host
-            comfy_generator = ComfyGenerator(
-                workflow_apiformat_json=self.workflow_apiformat_json,
-                api_host=host,
-            )
+                if self.metrics_port is not None:
+                    self.metrics_server = start_metrics_server(
+                        self.metrics_as_prometheus_text, self.metrics_port
+                    )
+
+        job = ComfyClusterJob(args)
+        self._submit_job(job)
+        while True:
             try:
-                # generate image and release host
-                generated_image = comfy_generator.generate_single_image(args)
-                self._release_host(host)
-                return generated_image
-
-            except Exception as e:
-                print(f"Error in ComfyGenerator: {e}")
-                self._mark_host_as_unresponsive(host)
-                time.sleep((retry + 1) ** 2)
-                if retry == 2:
-                    raise e
-
-            finally:
-                self._release_host(host)
+                return job.future.result(timeout=5)
+            except FutureTimeoutError:
+                if (
+                    job.started_at is None
+                    and time.time() - job.submitted_at > self.host_timeout
+                    and not self._has_responsive_hosts()
+                ):
+                    job.cancelled = True
+                    raise Exception("Timeout for getting host")
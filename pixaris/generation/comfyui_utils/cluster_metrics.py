@@ -0,0 +1,249 @@
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from threading import Lock, Thread
+from typing import Callable
+import time
+
+# upper bounds in seconds, chosen to cover queue waits of a few ms up to long generations
+DEFAULT_BUCKETS = (0.1, 0.5, 1, 2.5, 5, 10, 30, 60, 120, 300, 600)
+
+
+class Histogram:
+    """
+    Cumulative histogram in the Prometheus style.
+
+    :param buckets: The upper bounds of the buckets in seconds.
+    :type buckets: tuple[float]
+    """
+
+    def __init__(self, buckets: tuple[float] = DEFAULT_BUCKETS):
+        self.buckets = buckets
+        self.bucket_counts = [0] * len(buckets)
+        self.count = 0
+        self.sum = 0.0
+
+    def observe(self, value: float):
+        """
+        Add a value to the histogram.
+
+        :param value: The observed value.
+        :type value: float
+        """
+        self.count += 1
+        self.sum += value
+        for i, upper_bound in enumerate(self.buckets):
+            if value <= upper_bound:
+                self.bucket_counts[i] += 1
+
+    def to_dict(self) -> dict:
+        """
+        Summarise the histogram.
+
+        :return: count, sum, mean and the cumulative bucket counts keyed by upper bound.
+        :rtype: dict
+        """
+        return {
+            "count": self.count,
+            "sum": self.sum,
+            "mean": self.sum / self.count if self.count else 0.0,
+            "buckets": dict(zip(self.buckets, self.bucket_counts)),
+        }
+
+    def to_prometheus_lines(self, name: str, labels: str = "") -> list[str]:
+        """
+        Render the histogram in the Prometheus text format.
+
+        :param name: The metric name.
+        :type name: str
+        :param labels: Labels to add to every sample, e.g. 'host="10.0.0.1:8188"'.
+        :type labels: str
+        :return: The sample lines.
+        :rtype: list[str]
+        """
+        separator = "," if labels else ""
+        lines = [
+            f'{name}_bucket{{{labels}{separator}le="{upper_bound}"}} {count}'
+            for upper_bound, count in zip(self.buckets, self.bucket_counts)
+        ]
+        lines.append(f'{name}_bucket{{{labels}{separator}le="+Inf"}} {self.count}')
+        label_block = f"{{{labels}}}" if labels else ""
+        lines.append(f"{name}_sum{label_block} {self.sum}")
+        lines.append(f"{name}_count{label_block} {self.count}")
+        return lines
+
+
+class ComfyClusterMetrics:
+    """
+    Live counters and histograms of a ComfyClusterGenerator. All methods are thread safe.
+    """
+
+    def __init__(self):
+        self._lock = Lock()
+        self.started_at = time.time()
+        self.hosts = {}
+        self.acquisition_wait = Histogram()
+
+    def __getstate__(self):
+        # the lock cannot be pickled, e.g. when the generator is sent to the cluster
+        state = self.__dict__.copy()
+        del state["_lock"]
+        return state
+
+    def __setstate__(self, state):
+        self.__dict__.update(state)
+        self._lock = Lock()
+
+    def _host(self, host: str) -> dict:
+        """
+        Get the counters of a host, creating them on first use. Call while holding the lock.
+        """
+        if host not in self.hosts:
+            self.hosts[host] = {
+                "jobs_started": 0,
+                "jobs_finished": 0,
+                "jobs_failed": 0,
+                "retries": 0,
+                "generation_latency": Histogram(),
+            }
+        return self.hosts[host]
+
+    def record_job_started(self, host: str, wait_seconds: float):
+        """
+        Record that a host picked up a job.
+
+        :param host: The host that runs the job.
+        :type host: str
+        :param wait_seconds: Time between queueing the job and a host picking it up.
+        :type wait_seconds: float
+        """
+        with self._lock:
+            self._host(host)["jobs_started"] += 1
+            self.acquisition_wait.observe(wait_seconds)
+
+    def record_job_finished(self, host: str, latency_seconds: float):
+        """
+        Record a successful generation.
+
+        :param host: The host that ran the job.
+        :type host: str
+        :param latency_seconds: Duration of the generation on the host.
+        :type latency_seconds: float
+        """
+        with self._lock:
+            counters = self._host(host)
+            counters["jobs_finished"] += 1
+            counters["generation_latency"].observe(latency_seconds)
+
+    def record_job_failed(self, host: str, retried: bool):
+        """
+        Record a failed generation.
+
+        :param host: The host the job failed on.
+        :type host: str
+        :param retried: Whether the job will be tried again on another host.
+        :type retried: bool
+        """
+        with self._lock:
+            counters = self._host(host)
+            counters["jobs_failed"] += 1
+            if retried:
+                counters["retries"] += 1
+
+    def snapshot(self) -> dict:
+        """
+        Get a consistent copy of all counters.
+
+        :return: uptime, acquisition wait histogram and per host counters including throughput per minute.
+        :rtype: dict
+        """
+        with self._lock:
+            uptime = time.time() - self.started_at
+            hosts = {}
+            for host, counters in self.hosts.items():
+                hosts[host] = {
+                    key: value.to_dict() if isinstance(value, Histogram) else value
+                    for key, value in counters.items()
+                }
+                hosts[host]["throughput_per_minute"] = (
+                    counters["jobs_finished"] / uptime * 60 if uptime > 0 else 0.0
+                )
+            return {
+                "uptime_seconds": uptime,
+                "acquisition_wait": self.acquisition_wait.to_dict(),
+                "hosts": hosts,
+            }
+
+    def to_prometheus_lines(self) -> list[str]:
+        """
+        Render counters and histograms in the Prometheus text format.
+
+        :return: The metric lines including HELP and TYPE comments.
+        :rtype: list[str]
+        """
+        counter_help = {
+            "jobs_started": "Jobs picked up by a host.",
+            "jobs_finished": "Jobs that generated an image.",
+            "jobs_failed": "Jobs that raised an error on a host.",
+            "retries": "Failed jobs that were queued again.",
+        }
+        with self._lock:
+            lines = []
+            for counter, help_text in counter_help.items():
+                name = f"pixaris_comfy_{counter}_total"
+                lines += [f"# HELP {name} {help_text}", f"# TYPE {name} counter"]
+                lines += [
+                    f'{name}{{host="{host}"}} {counters[counter]}'
+                    for host, counters in self.hosts.items()
+                ]
+
+            name = "pixaris_comfy_acquisition_wait_seconds"
+            lines += [
+                f"# HELP {name} Time a job waited for a host.",
+                f"# TYPE {name} histogram",
+            ]
+            lines += self.acquisition_wait.to_prometheus_lines(name)
+
+            name = "pixaris_comfy_generation_latency_seconds"
+            lines += [
+                f"# HELP {name} Duration of a generation on a host.",
+                f"# TYPE {name} histogram",
+            ]
+            for host, counters in self.hosts.items():
+                lines += counters["generation_latency"].to_prometheus_lines(
+                    name, f'host="{host}"'
+                )
+            return lines
+
+
+def start_metrics_server(
+    render_metrics: Callable[[], str], port: int = 9100
+) -> ThreadingHTTPServer:
+    """
+    Serve metrics in the Prometheus text format on http://0.0.0.0:<port>/metrics in a daemon thread.
+
+    :param render_metrics: Function returning the current metrics text.
+    :type render_metrics: Callable[[], str]
+    :param port: The port to listen on. Use 0 to pick a free port. Defaults to 9100.
+    :type port: int
+    :return: The running server. Call shutdown() on it to stop serving.
+    :rtype: ThreadingHTTPServer
+    """
+
+    class MetricsHandler(BaseHTTPRequestHandler):
+        def do_GET(self):
+            if self.path.split("?")[0] != "/metrics":
+                self.send_error(404)
+                return
+            body = render_metrics().encode("utf-8")
+            self.send_response(200)
+            self.send_header("Content-Type", "text/plain; version=0.0.4")
+            self.send_header("Content-Length", str(len(body)))
+            self.end_headers()
+            self.wfile.write(body)
+
+        def log_message(self, format, *args):
+            pass  # scrapes every few seconds would flood the job logs
+
+    server = ThreadingHTTPServer(("0.0.0.0", port), MetricsHandler)
+    Thread(target=server.serve_forever, daemon=True).start()
+    print(f"Serving cluster metrics on port {server.server_address[1]}")
+    return server
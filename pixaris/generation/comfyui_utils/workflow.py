@@ -5,6 +5,7 @@ import urllib.request
 import urllib.parse
 import requests
 import time
+from pixaris.generation.utils import open_encoded_image
 from pixaris.utils.retry import retry
 
 
@@ -164,24 +165,35 @@ class ComfyWorkflow:
         node_id = self.node_id_for_name(node_name)
         return self.workflow_apiformat_json[node_id]["inputs"][parameter]
 
-    def set_image(self, node_name: str, image: Image.Image):
-        """Set the image input for a node."""
+    def set_image(
+        self, node_name: str, image: Image.Image, encoded_image: bytes = None
+    ):
+        """Set the image input for a node. Uploads encoded_image as is, if given."""
         node_id = self.node_id_for_name(node_name)
         if node_id is None:
             raise ValueError(f"Node '{node_name}' does not exist in the workflow.")
 
-        metadata = self.upload_image(image, "input")
+        metadata = self.upload_image(image, "input", encoded_image=encoded_image)
         self.workflow_apiformat_json[node_id]["inputs"]["image"] = (
             metadata["subfolder"] + "/" + metadata["name"]
         )
 
-    def upload_image(self, image: Image.Image, name: str) -> object:
-        """Upload an image to the server."""
-        img_byte_arr = io.BytesIO()
-        image.save(img_byte_arr, format="PNG")
-        img_byte_arr.seek(0)
+    def upload_image(
+        self, image: Image.Image, name: str, encoded_image: bytes = None
+    ) -> object:
+        """Upload an image to the server. Skips encoding it if encoded_image is given."""
+        if encoded_image is not None:
+            img_byte_arr = io.BytesIO(encoded_image)
+            # name the upload after its format, e.g. a JPEG passed through as is
+            extension = Image.open(img_byte_arr).format.lower()
+            img_byte_arr.seek(0)
+        else:
+            img_byte_arr = io.BytesIO()
+            image.save(img_byte_arr, format="PNG")
+            img_byte_arr.seek(0)
+            extension = "png"
         files = {
-            "image": (f"{name}.png", img_byte_arr),
+            "image": (f"{name}.{extension}", img_byte_arr),
         }
         data = {"overwrite": "false", "subfolder": "uploaded_images"}
         return requests.post(
@@ -250,7 +262,7 @@ class ComfyWorkflow:
         with urllib.request.urlopen(
             "http://{}/view?{}".format(self.api_host, url_values)
         ) as response:
-            return Image.open(io.BytesIO(response.read()))
+            return open_encoded_image(response.read())
 
     def get_image(self, node_name: str) -> list[Image.Image]:
         """Get the output image of a node."""
@@ -1,5 +1,6 @@
 from typing import List
 from pixaris.generation.base import ImageGenerator
+from pixaris.generation.utils import open_encoded_image
 from PIL import Image
 import os
 import requests
@@ -44,16 +45,22 @@ class FluxFillGenerator(ImageGenerator):
                 if not isinstance(param, dict):
                     raise ValueError("Each parameter must be a dictionary.")
 
-    def _encode_image_to_base64(self, pillow_image: Image.Image) -> str:
+    def _encode_image_to_base64(
+        self, pillow_image: Image.Image, encoded_image: bytes = None
+    ) -> str:
         """
         Encodes a PIL image to a base64 string.
 
         :param pillow_image: The PIL image.
         :type pillow_image: PIL.Image.Image
+        :param encoded_image: The already encoded image, e.g. pre-encoded by the data loader. Defaults to None.
+        :type encoded_image: bytes, optional
 
         :return: Base64 encoded string representation of the image.
         :rtype: str
         """
+        if encoded_image is not None:
+            return base64.b64encode(encoded_image).decode("utf-8")
         buffered = BytesIO()
         # assigning Image format or JPEG as default
         format = pillow_image.format or "JPEG"
@@ -86,8 +93,12 @@ class FluxFillGenerator(ImageGenerator):
 
         # Set up basis payload
         payload = {
-            "image": self._encode_image_to_base64(input_image),
-            "mask": self._encode_image_to_base64(mask_image),
+            "image": self._encode_image_to_base64(
+                input_image, pillow_images[1].get("encoded_image")
+            ),
+            "mask": self._encode_image_to_base64(
+                mask_image, pillow_images[0].get("encoded_image")
+            ),
             "prompt": "A beautiful landscape with a sunset",
             "steps": 50,
             "prompt_upsampling": False,
@@ -132,7 +143,7 @@ class FluxFillGenerator(ImageGenerator):
         image_response = requests.get(image_url)
         image_response.raise_for_status()
 
-        return Image.open(BytesIO(image_response.content))
+        return open_encoded_image(image_response.content)
 
     def generate_single_image(self, args: dict[str, any]) -> tuple[Image.Image, str]:
         """
@@ -1,15 +1,16 @@
+from io import BytesIO
 import time
 import traceback
 from typing import List, Optional
 from pixaris.generation.base import ImageGenerator
 from PIL import Image
-from io import BytesIO
 from google.genai import Client, types
 from vertexai.generative_models import Image as VertexImage
 
 from pixaris.generation.utils import (
     encode_image_to_bytes,
     extract_value_from_list_of_dicts,
+    open_encoded_image,
 )
 
 
@@ -99,10 +100,27 @@ class GeminiGenerator(ImageGenerator):
             return_key="pillow_image",
         )
 
+        # use the bytes pre-encoded by the data loader, if there are any
+        encoded_input_image = next(
+            (
+                image_info.get("encoded_image")
+                for image_info in pillow_images
+                if image_info["node_name"] == "Load Input Image"
+            ),
+            None,
+        )
+
         # turn prompt and image into vertex readable content
+        if encoded_input_image:
+            # pre-encoded images keep the bytes of their file or are PNG if they were scaled down
+            with Image.open(BytesIO(encoded_input_image)) as encoded:
+                mime_type = Image.MIME.get(encoded.format, "image/jpeg")
+        else:
+            encoded_input_image = encode_image_to_bytes(input_pillow_image)
+            mime_type = "image/jpeg"
         input_image = types.Part.from_bytes(
-            data=encode_image_to_bytes(input_pillow_image),
-            mime_type="image/jpeg",
+            data=encoded_input_image,
+            mime_type=mime_type,
         )
         msg1_text1 = types.Part.from_text(text=prompt)
         contents = [
@@ -158,7 +176,7 @@ class GeminiGenerator(ImageGenerator):
                             )
                         image_data = candidate.content.parts[0].inline_data.data
                         candidate_image = VertexImage.from_bytes(image_data)
-                        candidate_image = Image.open(BytesIO(candidate_image.data))
+                        candidate_image = open_encoded_image(candidate_image.data)
                     else:
                         print(
                             f"  Warning: No content or parts found for candidate (Finish Reason: {candidate.finish_reason})."
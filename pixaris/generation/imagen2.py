@@ -8,6 +8,7 @@ from vertexai.preview.vision_models import ImageGenerationModel
 from pixaris.generation.utils import (
     encode_image_to_bytes,
     extract_value_from_list_of_dicts,
+    open_encoded_image,
 )
 
 
@@ -97,7 +98,7 @@ class Imagen2Generator(ImageGenerator):
             edit_mode="inpainting-insert",
         )
 
-        return images[0]._pil_image
+        return open_encoded_image(images[0]._image_bytes)
 
     def generate_single_image(self, args: dict[str, any]) -> tuple[Image.Image, str]:
         """
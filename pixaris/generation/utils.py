@@ -1,5 +1,6 @@
 from io import BytesIO
 from PIL import Image
+from pixaris.utils.encoding import attach_encoded_bytes
 
 
 def extract_value_from_list_of_dicts(
@@ -58,3 +59,18 @@ def encode_image_to_bytes(pillow_image: Image.Image) -> bytes:
     pillow_image.save(imgByteArr, format=pillow_image.format)
     imgByteArr = imgByteArr.getvalue()
     return imgByteArr
+
+
+def open_encoded_image(data: bytes) -> Image.Image:
+    """
+    Opens an encoded image returned by a generation API. The image is decoded lazily on first access to its pixels
+    and keeps the original bytes, so experiment handlers can store them without encoding the image again.
+
+    :param data: The encoded image.
+    :type data: bytes
+    :return: The image.
+    :rtype: PIL.Image.Image
+    """
+    image = Image.open(BytesIO(data))
+    attach_encoded_bytes(image, data)
+    return image
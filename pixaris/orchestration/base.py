@@ -1,14 +1,22 @@
+from collections import deque
 import concurrent.futures
+import contextlib
+import io
+import itertools
+import math
+import threading
+import time
 from pixaris.data_loaders.base import DatasetLoader
 from pixaris.generation.base import ImageGenerator
 from pixaris.experiment_handlers.base import ExperimentHandler
+from pixaris.experiment_handlers.background import BackgroundExperimentHandler
 from pixaris.metrics.base import BaseMetric
 from pixaris.utils.merge_dicts import merge_dicts
 from pixaris.utils.hyperparameters import (
     expand_hyperparameters,
     generate_hyperparameter_grid,
 )
-from typing import Iterable
+from typing import Callable, Iterable
 from PIL import Image
 
 
@@ -43,12 +51,15 @@ def generate_images_based_on_dataset(
     experiment_handler: ExperimentHandler,
     metrics: list[BaseMetric],
     args: dict[str, any],
+    progress_callback: Callable[[dict], None] = None,
 ) -> Iterable[tuple[Image.Image, str]]:
     """
     Generates images based on an evaluation set.
-    This function loads a dataset using the provided data loader, generates images
+    This function streams the dataset from the provided data loader, generates images
     using the provided image generator, and stores the results using the provided
-    experiment handler.
+    experiment handler. Only a few items per parallel job are loaded ahead, and every item
+    is validated before it is generated. An invalid item stops the run before any results are stored,
+    unless "skip_invalid_items" is set in args, in which case it counts as failed.
 
     :param data_loader: An instance of DatasetLoader to load the dataset.
     :type data_loader: DatasetLoader
@@ -58,28 +69,97 @@ def generate_images_based_on_dataset(
     :type experiment_handler: ExperimentHandler
     :param metrics: A list of metrics to calculate.
     :type metrics: list[BaseMetric]
-    :param args: A dictionary of arguments to be used for image generation and storing results.
+    :param args: A dictionary of arguments to be used for image generation and storing results. "dataset_prefetch"
+      is passed on to iter_dataset of the loader, e.g. {"workers": 4, "max_resolution": 1024, "pre_encode": True}.
+      "skip_invalid_items" continues with the next item if an item fails validation. Defaults to False.
     :type args: dict[str, any]
+    :param progress_callback: Called before the first and after every generated image with a dict containing
+      "total", "done", "failed" and "mean_seconds_per_image". "total" is None if the loader does not know the
+      number of items up front. Defaults to None.
+    :type progress_callback: Callable[[dict], None], optional
     :return: A list of generated images and names
     :rtype: list[tuple[PIL.Image.Image, str]]
     """
 
-    # Validate inputs
-    dataset = data_loader.load_dataset()
-    image_generator.validate_inputs_and_parameters(dataset, args)
     experiment_handler._validate_experiment_run_name(args["experiment_run_name"])
     max_parallel_jobs = args.get("max_parallel_jobs", 1)
+    skip_invalid_items = args.get("skip_invalid_items", False)
+
+    # Stream the dataset, loaders that do not derive from DatasetLoader only implement load_dataset
+    if isinstance(data_loader, DatasetLoader):
+        items = data_loader.iter_dataset(
+            **{"prefetch": 2 * max_parallel_jobs, **args.get("dataset_prefetch", {})}
+        )
+    else:
+        items = data_loader.load_dataset()
+    try:
+        total = len(items)
+    except TypeError:
+        total = None
 
     generated_image_name_pairs = []
     failed_args = []
+    progress = {
+        "total": total,
+        "done": 0,
+        "failed": 0,
+        "mean_seconds_per_image": None,
+    }
+    seconds_per_image = []
+    progress_lock = threading.Lock()
 
-    with concurrent.futures.ThreadPoolExecutor(max_workers=max_parallel_jobs) as pool:
-        results = list(
-            pool.map(
-                lambda data: generate_image(data, image_generator, args, failed_args),
-                dataset,
+    def report_progress():
+        if progress_callback is not None:
+            progress_callback(dict(progress))
+
+    def generate_and_report(data):
+        start = time.time()
+        result = generate_image(data, image_generator, args, failed_args)
+        with progress_lock:
+            seconds_per_image.append(time.time() - start)
+            progress["done" if result is not None else "failed"] += 1
+            progress["mean_seconds_per_image"] = sum(seconds_per_image) / len(
+                seconds_per_image
             )
-        )
+            report_progress()
+        return result
+
+    def reject(data, error):
+        failed_args.append({"error_message": str(error), "args": data})
+        print("WARNING", error)
+        print("continuing with next image.")
+        with progress_lock:
+            progress["failed"] += 1
+            report_progress()
+
+    report_progress()
+    # keep only a few items per worker in flight, the rest of the dataset is not loaded yet
+    results = []
+    in_flight = deque()
+    num_items = 0
+    with (
+        concurrent.futures.ThreadPoolExecutor(max_workers=max_parallel_jobs) as pool,
+        contextlib.closing(items)
+        if hasattr(items, "close")
+        else contextlib.nullcontext(),
+    ):
+        for data in items:
+            num_items += 1
+            try:
+                image_generator.validate_inputs_and_parameters([data], args)
+            except Exception as e:
+                if not skip_invalid_items:
+                    # nothing is stored, do not start the generations that are still waiting
+                    for future in in_flight:
+                        future.cancel()
+                    raise
+                reject(data, e)
+                continue
+            in_flight.append(pool.submit(generate_and_report, data))
+            if len(in_flight) >= 2 * max_parallel_jobs:
+                results.append(in_flight.popleft().result())
+        while in_flight:
+            results.append(in_flight.popleft().result())
 
     # Filter out None results and create pairs
     for result in results:
@@ -89,12 +169,12 @@ def generate_images_based_on_dataset(
     # If all generations fail, raise an exception
     if len(generated_image_name_pairs) == 0:
         raise ValueError(
-            f"Failed to generate images for all {len(dataset)} images. \nLast error message: {failed_args[-1]['error_message']}"
+            f"Failed to generate images for all {num_items} images. \nLast error message: {failed_args[-1]['error_message'] if failed_args else None}"
         )
 
     print("Generation done.")
     if failed_args:
-        print(f"Failed to generate images for {len(failed_args)} of {len(dataset)}.")
+        print(f"Failed to generate images for {len(failed_args)} of {num_items}.")
         print(f"Failed arguments: {failed_args}")
 
     metric_values = {}
@@ -144,6 +224,7 @@ def generate_images_for_hyperparameter_search_based_on_dataset(
     * "experiment_run_name" (str): The base name for each run.
     :type args: dict[str, any]
     :raises ValueError: If no hyperparameters are provided or if the hyperparameters are invalid.
+    :raises RuntimeError: If a BackgroundExperimentHandler failed to store runs.
     """
     hyperparameters = args.get("hyperparameters")
     if not hyperparameters:
@@ -171,3 +252,219 @@ def generate_images_for_hyperparameter_search_based_on_dataset(
             metrics=metrics,
             args=run_args,
         )
+
+    if isinstance(experiment_handler, BackgroundExperimentHandler):
+        # the runs were stored while the next ones were generated, wait for the last ones
+        experiment_handler.flush()
+
+
+def _shard_grid(args: dict[str, any]) -> list[list[dict] | None]:
+    """
+    The hyperparameter grid of a sharded run, or a single point without hyperparameters.
+    """
+    hyperparameters = args.get("hyperparameters")
+    if not hyperparameters:
+        return [None]
+    return generate_hyperparameter_grid(hyperparameters)
+
+
+def _shard_run_args(
+    args: dict[str, any], grid_index: int, hyperparameter: list[dict] | None
+) -> dict[str, any]:
+    """
+    The arguments of one grid point, named like in generate_images_for_hyperparameter_search_based_on_dataset.
+    """
+    if hyperparameter is None:
+        return args
+    run_args = merge_dicts(args, {"generation_params": hyperparameter})
+    run_args["experiment_run_name"] = f"hs-{args['experiment_run_name']}-{grid_index}"
+    return run_args
+
+
+def _load_shard_items(
+    data_loader: DatasetLoader, grid_size: int, shard_index: int, shard_count: int
+) -> dict[int, dict[str, any]]:
+    """
+    Loads only the dataset items a shard needs. Work item item_index * grid_size + grid_index belongs to the shard
+    with that number modulo shard_count, so whether a shard needs an item only depends on its index modulo
+    shard_count / gcd(grid_size, shard_count). Those residues are loaded with a single view of the data loader, so
+    the dataset is listed and downloaded once.
+
+    :return: The items of the shard by their index in the whole dataset.
+    :rtype: dict[int, dict[str, any]]
+    """
+    period = shard_count // math.gcd(grid_size, shard_count)
+    residues = [
+        residue
+        for residue in range(period)
+        if any(
+            (residue * grid_size + grid_index) % shard_count == shard_index
+            for grid_index in range(grid_size)
+        )
+    ]
+    if len(residues) == period:
+        return dict(enumerate(data_loader.load_dataset()))
+    # the view keeps the dataset order, so its items are the indices with one of the residues in order
+    item_indices = (
+        item_index
+        for item_index in itertools.count()
+        if item_index % period in residues
+    )
+    return dict(zip(item_indices, data_loader._shards(residues, period).load_dataset()))
+
+
+def generate_images_for_shard(
+    data_loader: DatasetLoader,
+    image_generator: ImageGenerator,
+    args: dict[str, any],
+    shard_index: int,
+    shard_count: int,
+) -> dict[str, any]:
+    """
+    Generates the images of one shard of a sharded run. The work items are all combinations of dataset item and
+    hyperparameter grid point, the shard takes every shard_count-th of them starting at shard_index and only loads
+    the dataset items it needs. Without hyperparameters, this is data_loader.shard(shard_index, shard_count).
+    Nothing is stored, merge the results of all shards with merge_shard_results.
+
+    :param data_loader: The data loader to load the evaluation set. Every shard has to load the same dataset.
+    :type data_loader: DatasetLoader
+    :param image_generator: The image generator to generate images.
+    :type image_generator: ImageGenerator
+    :param args: A dictionary of arguments as for generate_images_based_on_dataset. If it contains "hyperparameters",
+      the grid is split as well.
+    :type args: dict[str, any]
+    :param shard_index: The index of this shard, starting at 0.
+    :type shard_index: int
+    :param shard_count: The number of shards.
+    :type shard_count: int
+    :raises ValueError: If shard_index is not between 0 and shard_count - 1.
+    :return: A dict with "shard_index", "shard_count", "results" and "failed". Every result holds the "grid_index",
+      "item_index", "name" and the PNG encoded "image".
+    :rtype: dict[str, any]
+    """
+    if not 0 <= shard_index < shard_count:
+        raise ValueError(f"Shard index {shard_index} is not in [0, {shard_count}).")
+
+    grid = _shard_grid(args)
+    dataset = _load_shard_items(data_loader, len(grid), shard_index, shard_count)
+    for grid_index, hyperparameter in enumerate(grid):
+        image_generator.validate_inputs_and_parameters(
+            list(dataset.values()), _shard_run_args(args, grid_index, hyperparameter)
+        )
+
+    work_items = [
+        (grid_index, item_index)
+        for item_index in dataset
+        for grid_index in range(len(grid))
+        if (item_index * len(grid) + grid_index) % shard_count == shard_index
+    ]
+    print(
+        f"Shard {shard_index + 1} of {shard_count}: generating {len(work_items)} images"
+    )
+
+    failed_args = []
+
+    def generate_work_item(work_item):
+        grid_index, item_index = work_item
+        run_args = _shard_run_args(args, grid_index, grid[grid_index])
+        result = generate_image(
+            dataset[item_index], image_generator, run_args, failed_args
+        )
+        if result is None:
+            return None
+        image, name = result
+        buffer = io.BytesIO()
+        image.save(buffer, format="PNG")
+        return {
+            "grid_index": grid_index,
+            "item_index": item_index,
+            "name": name,
+            "image": buffer.getvalue(),
+        }
+
+    max_parallel_jobs = args.get("max_parallel_jobs", 1)
+    with concurrent.futures.ThreadPoolExecutor(max_workers=max_parallel_jobs) as pool:
+        results = list(pool.map(generate_work_item, work_items))
+
+    return {
+        "shard_index": shard_index,
+        "shard_count": shard_count,
+        "results": [result for result in results if result is not None],
+        # the failed arguments hold the input images, only keep the messages
+        "failed": [failed["error_message"] for failed in failed_args],
+    }
+
+
+def merge_shard_results(
+    shard_results: list[dict[str, any]],
+    experiment_handler: ExperimentHandler,
+    metrics: list[BaseMetric],
+    args: dict[str, any],
+) -> dict[str, list[tuple[Image.Image, str]]]:
+    """
+    Merges the results of all shards of a sharded run into one experiment run per hyperparameter grid point, or a
+    single run without hyperparameters. The metrics are calculated over all images of a run, not averaged over shards.
+
+    :param shard_results: The results of generate_images_for_shard of every shard.
+    :type shard_results: list[dict[str, any]]
+    :param experiment_handler: The experiment handler to store the merged runs.
+    :type experiment_handler: ExperimentHandler
+    :param metrics: A list of metrics to calculate.
+    :type metrics: list[BaseMetric]
+    :param args: The arguments that were passed to every shard.
+    :type args: dict[str, any]
+    :raises ValueError: If shards are missing or no image was generated at all.
+    :return: The generated images and names per experiment run name, in dataset order.
+    :rtype: dict[str, list[tuple[PIL.Image.Image, str]]]
+    """
+    shard_count = shard_results[0]["shard_count"] if shard_results else 0
+    shard_indices = sorted(shard["shard_index"] for shard in shard_results)
+    if shard_indices != list(range(shard_count)):
+        raise ValueError(
+            f"Expected the results of {shard_count} shards, got shards {shard_indices}."
+        )
+
+    failed = [message for shard in shard_results for message in shard["failed"]]
+    results = [result for shard in shard_results for result in shard["results"]]
+    if len(results) == 0:
+        raise ValueError(
+            f"Failed to generate images for all {len(failed)} work items. \nLast error message: {failed[-1] if failed else None}"
+        )
+    if failed:
+        print(f"Failed to generate {len(failed)} images.")
+
+    grid = _shard_grid(args)
+    merged_runs = {}
+    for grid_index, hyperparameter in enumerate(grid):
+        run_args = _shard_run_args(args, grid_index, hyperparameter)
+        run_results = sorted(
+            (result for result in results if result["grid_index"] == grid_index),
+            key=lambda result: result["item_index"],
+        )
+        if len(run_results) == 0:
+            print(f"No images generated for {run_args['experiment_run_name']}.")
+            continue
+        image_name_pairs = [
+            (Image.open(io.BytesIO(result["image"])), result["name"])
+            for result in run_results
+        ]
+
+        metric_values = {}
+        for metric in metrics:
+            metric_values.update(
+                metric.calculate([pair[0] for pair in image_name_pairs])
+            )
+
+        experiment_handler._validate_experiment_run_name(
+            run_args["experiment_run_name"]
+        )
+        experiment_handler.store_results(
+            project=run_args["project"],
+            dataset=run_args["dataset"],
+            experiment_run_name=run_args["experiment_run_name"],
+            image_name_pairs=image_name_pairs,
+            metric_values=metric_values,
+            args=run_args,
+        )
+        merged_runs[run_args["experiment_run_name"]] = image_name_pairs
+    return merged_runs
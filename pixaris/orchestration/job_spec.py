@@ -0,0 +1,179 @@
+import hashlib
+import io
+import os
+import pickle
+from PIL import Image
+
+JOB_SPEC_FORMAT = "pixaris-job-spec"
+JOB_SPEC_VERSION = 1
+
+
+def _dataset_dir(data_loader) -> str | None:
+    """
+    Get the local directory of the dataset a loader reads from, if it has one.
+
+    :param data_loader: The data loader.
+    :type data_loader: DatasetLoader
+    :return: The absolute dataset directory or None.
+    :rtype: str | None
+    """
+    if not all(
+        hasattr(data_loader, attr) for attr in ["eval_dir_local", "project", "dataset"]
+    ):
+        return None
+    return os.path.abspath(
+        os.path.join(
+            data_loader.eval_dir_local, data_loader.project, data_loader.dataset
+        )
+    )
+
+
+class _ImageReferencingPickler(pickle.Pickler):
+    """
+    Pickler that replaces PIL images by references. Images loaded from the dataset become their path relative to
+    the dataset directory, all other images are stored once in their encoded form instead of as decoded pixels.
+    """
+
+    def __init__(self, file, dataset_dir: str | None, encoded_images: dict):
+        super().__init__(file)
+        self.dataset_dir = dataset_dir
+        self.encoded_images = encoded_images
+        self.dataset_references = 0
+
+    def _is_unmodified_file_image(self, image: Image.Image, filename: str) -> bool:
+        """
+        Check that the image still has the pixels of the file it was opened from, so sending a reference to the file
+        gives the same image. Images changed in place, e.g. scaled down or painted on, are sent encoded instead.
+        """
+        if not filename or not os.path.isfile(filename):
+            return False
+        try:
+            with Image.open(filename) as file_image:
+                if (file_image.size, file_image.mode) != (image.size, image.mode):
+                    return False
+                return (
+                    file_image.tobytes() == image.tobytes()
+                    and file_image.getpalette() == image.getpalette()
+                )
+        except Exception:
+            return False
+
+    def persistent_id(self, obj):
+        if not isinstance(obj, Image.Image):
+            return None
+        filename = getattr(obj, "filename", "")
+        if self._is_unmodified_file_image(obj, filename):
+            path = os.path.abspath(filename)
+            if self.dataset_dir and path.startswith(self.dataset_dir + os.sep):
+                self.dataset_references += 1
+                return ("dataset_image", os.path.relpath(path, self.dataset_dir))
+            with open(path, "rb") as f:
+                encoded = f.read()
+        else:
+            buffer = io.BytesIO()
+            obj.save(buffer, format="PNG")
+            encoded = buffer.getvalue()
+        key = hashlib.sha256(encoded).hexdigest()
+        self.encoded_images[key] = encoded
+        return ("encoded_image", key, filename)
+
+
+class _ImageResolvingUnpickler(pickle.Unpickler):
+    """
+    Unpickler that turns the references written by _ImageReferencingPickler back into PIL images.
+    """
+
+    def __init__(self, file, dataset_dir: str | None, encoded_images: dict):
+        super().__init__(file)
+        self.dataset_dir = dataset_dir
+        self.encoded_images = encoded_images
+
+    def persistent_load(self, pid):
+        if pid[0] == "dataset_image":
+            if self.dataset_dir is None:
+                raise pickle.UnpicklingError(
+                    f"Dataset image {pid[1]} referenced, but the data loader has no local dataset directory."
+                )
+            return Image.open(os.path.join(self.dataset_dir, pid[1]))
+        if pid[0] == "encoded_image":
+            image = Image.open(io.BytesIO(self.encoded_images[pid[1]]))
+            if pid[2]:
+                # generators derive image names and seeds from the file name
+                image.filename = pid[2]
+            return image
+        raise pickle.UnpicklingError(f"Unsupported persistent id {pid[0]}.")
+
+
+def _ensure_dataset_available(data_loader):
+    """
+    Make sure the dataset is present locally before dataset images are resolved, e.g. download it for a GCPDatasetLoader.
+    The download is not repeated when the loader loads the dataset afterwards.
+    """
+    if hasattr(data_loader, "_download_dataset"):
+        data_loader._download_dataset()
+        if hasattr(data_loader, "force_download"):
+            data_loader.force_download = False
+
+
+def create_job_spec(inputs: dict[str, any]) -> bytes:
+    """
+    Create a compact job spec for a remote run. Instead of decoded pixels, it contains references: images from the
+    dataset are sent as their coordinates in the dataset, all other images in their encoded form and only once.
+    The remote side resolves them with load_job_spec.
+
+    :param inputs: The inputs of the run. Has to contain "data_loader". All other entries, e.g. "image_generator",
+      "experiment_handler", "metrics" and "args", may hold PIL images anywhere in their attributes.
+    :type inputs: dict[str, any]
+    :return: The serialised job spec.
+    :rtype: bytes
+    """
+    data_loader = inputs["data_loader"]
+    dataset_dir = _dataset_dir(data_loader)
+    encoded_images = {}
+
+    buffer = io.BytesIO()
+    pickler = _ImageReferencingPickler(buffer, dataset_dir, encoded_images)
+    pickler.dump({key: value for key, value in inputs.items() if key != "data_loader"})
+
+    spec = {
+        "format": JOB_SPEC_FORMAT,
+        "version": JOB_SPEC_VERSION,
+        "dataset": {
+            "project": getattr(data_loader, "project", None),
+            "dataset": getattr(data_loader, "dataset", None),
+            "references": pickler.dataset_references,
+        },
+        "data_loader": pickle.dumps(data_loader),
+        "payload": buffer.getvalue(),
+        "encoded_images": encoded_images,
+    }
+    return pickle.dumps(spec)
+
+
+def load_job_spec(job_spec: bytes) -> dict[str, any]:
+    """
+    Load a job spec created with create_job_spec and resolve all image references.
+
+    :param job_spec: The serialised job spec.
+    :type job_spec: bytes
+    :raises ValueError: If the bytes are not a job spec of a supported version.
+    :return: The inputs of the run as passed to create_job_spec.
+    :rtype: dict[str, any]
+    """
+    spec = pickle.loads(job_spec)
+    if not isinstance(spec, dict) or spec.get("format") != JOB_SPEC_FORMAT:
+        raise ValueError("The input is not a pixaris job spec.")
+    if spec["version"] != JOB_SPEC_VERSION:
+        raise ValueError(f"Unsupported job spec version {spec['version']}.")
+
+    data_loader = pickle.loads(spec["data_loader"])
+    if spec["dataset"]["references"]:
+        _ensure_dataset_available(data_loader)
+
+    inputs = _ImageResolvingUnpickler(
+        io.BytesIO(spec["payload"]),
+        _dataset_dir(data_loader),
+        spec["encoded_images"],
+    ).load()
+    inputs["data_loader"] = data_loader
+    return inputs
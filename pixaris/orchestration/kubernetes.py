@@ -4,7 +4,17 @@ import os
 #     "python"  # fix for aiplatform, it"s currently using pre 3.20 version of protobuf and we using > 5.0
 # )
 import click
-from kubernetes import client, config
+import concurrent.futures
+import hashlib
+import importlib
+import json
+from kubernetes import client, config, watch
+import math
+import pickle
+import random
+import struct
+import sys
+import threading
 import uuid
 import time
 
@@ -12,58 +22,849 @@ from pixaris.data_loaders.base import DatasetLoader
 from pixaris.generation.base import ImageGenerator
 from pixaris.experiment_handlers.base import ExperimentHandler
 from pixaris.metrics.base import BaseMetric
-from pixaris.orchestration.base import generate_images_based_on_dataset
-import pickle
+from pixaris.orchestration.base import (
+    generate_images_based_on_dataset,
+    generate_images_for_shard,
+    merge_shard_results,
+)
+from pixaris.orchestration.job_spec import create_job_spec, load_job_spec
 import io
 import tarfile
 import pathlib
+from typing import Callable
 from kubernetes.stream import stream
 
 
+class ComfyDeploymentAutoscaler:
+    """
+    Sizes the Comfy deployment from the pending work and a target completion time. The number of replicas is
+    pending_images * seconds_per_image / remaining_seconds, so it shrinks as the queue drains, but never below the
+    replicas that are still generating. stop restores the number of replicas the deployment had before.
+    Feed it progress with update_progress (compatible with the progress_callback of generate_images_based_on_dataset)
+    and call step, or let run_in_background do it periodically.
+
+    :param apps_v1_api: Client with read_namespaced_deployment_scale and patch_namespaced_deployment_scale methods,
+      e.g. kubernetes.client.AppsV1Api().
+      Pass a mock to test offline.
+    :type apps_v1_api: kubernetes.client.AppsV1Api
+    :param target_completion_seconds: Time from the creation of the autoscaler in which all images should be done.
+    :type target_completion_seconds: float
+    :param max_replicas: The maximum number of replicas.
+    :type max_replicas: int
+    :param min_replicas: The number of replicas while no images are pending. Defaults to 0.
+    :type min_replicas: int
+    :param seconds_per_image: Estimated generation time per image and replica, used until a latency was measured. Defaults to 60.
+    :type seconds_per_image: float
+    :param namespace: The namespace of the deployment. Defaults to "batch".
+    :type namespace: str
+    :param deployment: The name of the deployment. Defaults to "comfy-ui-deployment".
+    :type deployment: str
+    :param measure_seconds_per_image: Returns the measured generation time per image and replica or None if unknown,
+      e.g. from the metrics of a ComfyClusterGenerator. Without it, the mean duration from the progress is used. Defaults to None.
+    :type measure_seconds_per_image: Callable[[], float | None], optional
+    :param measure_busy_replicas: Returns the number of replicas that are generating an image or None if unknown,
+      e.g. the busy hosts of a ComfyClusterGenerator. Without it, every replica counts as busy while more images are
+      pending than there are replicas. Defaults to None.
+    :type measure_busy_replicas: Callable[[], int | None], optional
+    """
+
+    def __init__(
+        self,
+        apps_v1_api,
+        target_completion_seconds: float,
+        max_replicas: int,
+        min_replicas: int = 0,
+        seconds_per_image: float = 60,
+        namespace: str = "batch",
+        deployment: str = "comfy-ui-deployment",
+        measure_seconds_per_image: Callable[[], float | None] = None,
+        measure_busy_replicas: Callable[[], int | None] = None,
+    ):
+        self.apps_v1_api = apps_v1_api
+        self.target_completion_seconds = target_completion_seconds
+        self.max_replicas = max_replicas
+        self.min_replicas = min_replicas
+        self.seconds_per_image = seconds_per_image
+        self.namespace = namespace
+        self.deployment = deployment
+        self.measure_seconds_per_image = measure_seconds_per_image
+        self.measure_busy_replicas = measure_busy_replicas
+        self.deadline = time.time() + target_completion_seconds
+        self.initial_replicas = None
+        self.current_replicas = None
+        self.progress = None
+        self._stop_event = threading.Event()
+        self._thread = None
+
+    def desired_replicas(
+        self, pending_images: int, seconds_per_image: float, remaining_seconds: float
+    ) -> int:
+        """
+        Calculate the number of replicas needed to finish the pending images in the remaining time.
+
+        :param pending_images: The number of images that still have to be generated.
+        :type pending_images: int
+        :param seconds_per_image: The generation time per image on one replica.
+        :type seconds_per_image: float
+        :param remaining_seconds: The time left until the target completion time.
+        :type remaining_seconds: float
+        :return: The number of replicas, between min_replicas and max_replicas.
+        :rtype: int
+        """
+        if pending_images <= 0:
+            return self.min_replicas
+        if remaining_seconds <= 0:
+            # already late, use everything that is useful
+            needed = pending_images
+        else:
+            needed = math.ceil(pending_images * seconds_per_image / remaining_seconds)
+        # never more replicas than pending images, at least one while work is left
+        needed = min(needed, pending_images, self.max_replicas)
+        return max(needed, self.min_replicas, 1)
+
+    def scale(self, replicas: int):
+        """
+        Patch the deployment scale if it differs from the current scale. The scale the deployment had before the
+        first patch is kept in initial_replicas.
+
+        :param replicas: The number of replicas.
+        :type replicas: int
+        """
+        if self.initial_replicas is None:
+            # the deployment may be shared with other runs, stop restores its scale
+            current_scale = self.apps_v1_api.read_namespaced_deployment_scale(
+                self.deployment, self.namespace
+            )
+            self.initial_replicas = current_scale.spec.replicas or 0
+            self.current_replicas = self.initial_replicas
+        if replicas == self.current_replicas:
+            return
+        print(f"Scaling {self.deployment} to {replicas} replicas")
+        self.apps_v1_api.patch_namespaced_deployment_scale(
+            self.deployment, self.namespace, {"spec": {"replicas": replicas}}
+        )
+        self.current_replicas = replicas
+
+    def update_progress(self, progress: dict):
+        """
+        Store the latest progress of the run.
+
+        :param progress: A dict with "total", "done", "failed" and "mean_seconds_per_image".
+        :type progress: dict
+        """
+        self.progress = progress
+
+    def step(self) -> int | None:
+        """
+        Scale to the desired number of replicas for the latest progress, keeping the replicas that are generating.
+        Does nothing before the first progress arrived or while the number of images is unknown.
+
+        :return: The number of replicas or None if no progress is known yet.
+        :rtype: int | None
+        """
+        progress = self.progress
+        if progress is None or progress["total"] is None:
+            return None
+        pending_images = progress["total"] - progress["done"] - progress["failed"]
+        seconds_per_image = None
+        if self.measure_seconds_per_image is not None:
+            seconds_per_image = self.measure_seconds_per_image()
+        if not seconds_per_image:
+            seconds_per_image = (
+                progress.get("mean_seconds_per_image") or self.seconds_per_image
+            )
+        replicas = self.desired_replicas(
+            pending_images, seconds_per_image, self.deadline - time.time()
+        )
+        busy_replicas = None
+        if self.measure_busy_replicas is not None:
+            busy_replicas = self.measure_busy_replicas()
+        if busy_replicas is None:
+            # scaling down removes arbitrary pods, assume every replica is generating while images are pending
+            busy_replicas = pending_images
+        replicas = max(replicas, min(busy_replicas, self.current_replicas or 0))
+        self.scale(replicas)
+        return replicas
+
+    def run_in_background(self, interval: float = 30):
+        """
+        Call step every interval seconds in a daemon thread until stop is called.
+
+        :param interval: Seconds between two scaling decisions. Defaults to 30.
+        :type interval: float
+        """
+
+        def task():
+            while not self._stop_event.is_set():
+                try:
+                    self.step()
+                except Exception as e:
+                    print(f"Autoscaling failed: {e}")
+                self._stop_event.wait(interval)
+
+        self._thread = threading.Thread(target=task, daemon=True)
+        self._thread.start()
+
+    def stop(self):
+        """
+        Stop the background thread and restore the number of replicas the deployment had before it was scaled.
+        """
+        self._stop_event.set()
+        if self._thread is not None:
+            self._thread.join()
+        if self.initial_replicas is not None:
+            self.scale(self.initial_replicas)
+
+
+def _mean_generation_latency(cluster_metrics: dict) -> float | None:
+    """
+    Mean generation latency over all hosts of a ComfyClusterGenerator metrics snapshot.
+
+    :param cluster_metrics: The result of ComfyClusterGenerator.get_metrics().
+    :type cluster_metrics: dict
+    :return: The mean latency in seconds or None if no image was generated yet.
+    :rtype: float | None
+    """
+    latencies = [
+        host["generation_latency"]
+        for host in cluster_metrics["hosts"].values()
+        if "generation_latency" in host
+    ]
+    count = sum(latency["count"] for latency in latencies)
+    if not count:
+        return None
+    return sum(latency["sum"] for latency in latencies) / count
+
+
+# remote runs print progress events as log lines starting with this prefix, followed by a json object
+PROGRESS_EVENT_PREFIX = "PIXARIS_PROGRESS "
+
+
+def _build_progress_event(
+    progress: dict, max_parallel_jobs: int, image_generator: ImageGenerator
+) -> dict:
+    """
+    Build a progress event from the progress of generate_images_based_on_dataset.
+
+    :param progress: A dict with "total", "done", "failed" and "mean_seconds_per_image".
+    :type progress: dict
+    :param max_parallel_jobs: The number of images generated in parallel, to estimate the remaining time.
+    :type max_parallel_jobs: int
+    :param image_generator: The image generator. If it has get_metrics, e.g. ComfyClusterGenerator, the event
+      contains its interim metrics.
+    :type image_generator: ImageGenerator
+    :return: The event with "status" "running", the progress, "eta_seconds" and "generator_metrics".
+    :rtype: dict
+    """
+    mean_seconds_per_image = progress.get("mean_seconds_per_image")
+    eta_seconds = None
+    if progress["total"] is not None and mean_seconds_per_image is not None:
+        pending = progress["total"] - progress["done"] - progress["failed"]
+        eta_seconds = pending * mean_seconds_per_image / max_parallel_jobs
+    event = {
+        "status": "running",
+        **progress,
+        "eta_seconds": eta_seconds,
+        "generator_metrics": None,
+    }
+    if hasattr(image_generator, "get_metrics"):
+        generator_metrics = image_generator.get_metrics()
+        event["generator_metrics"] = {
+            "mean_generation_latency": _mean_generation_latency(generator_metrics),
+            "busy_hosts": generator_metrics.get("busy_hosts"),
+            "total_hosts": generator_metrics.get("total_hosts"),
+        }
+    return event
+
+
+def _publish_progress_event(event: dict):
+    """
+    Print a progress event as a single log line, to be parsed by follow_remote_progress.
+    """
+    print(PROGRESS_EVENT_PREFIX + json.dumps(event, default=str), flush=True)
+
+
+def _format_progress_bar(event: dict, width: int = 30) -> str:
+    """
+    Render a progress event as a one line text progress bar.
+    """
+    finished = event["done"] + event["failed"]
+    if event["total"] is None:
+        line = f"{finished} images"
+    else:
+        filled = int(width * finished / event["total"]) if event["total"] else width
+        line = f"[{'#' * filled}{'-' * (width - filled)}] {finished}/{event['total']} images"
+    if event["failed"]:
+        line += f", {event['failed']} failed"
+    if event.get("eta_seconds") is not None:
+        minutes, seconds = divmod(int(event["eta_seconds"]), 60)
+        line += f", ETA {minutes}m {seconds:02d}s"
+    return line
+
+
+def follow_remote_progress(
+    core_v1,
+    pod_name: str,
+    namespace: str = "batch",
+    on_event: Callable[[dict], None] = None,
+    show_progress_bar: bool = True,
+    job_id: str = None,
+) -> dict:
+    """
+    Follow the logs of a remote run and parse its progress events until the run is stored or failed.
+
+    :param core_v1: The core API client.
+    :type core_v1: kubernetes.client.CoreV1Api
+    :param pod_name: The name of the pod running the evaluation.
+    :type pod_name: str
+    :param namespace: The namespace of the pod. Defaults to "batch".
+    :type namespace: str
+    :param on_event: Called with every progress event. Defaults to None.
+    :type on_event: Callable[[dict], None], optional
+    :param show_progress_bar: Whether to print a text progress bar. Defaults to True.
+    :type show_progress_bar: bool
+    :param job_id: Only follow the events of this job, for pods of the orchestrator pool that run one job after
+      another. Defaults to None.
+    :type job_id: str, optional
+    :raises ValueError: If the run failed or the logs ended without a final event.
+    :return: The final event with "status" "stored".
+    :rtype: dict
+    """
+    log_watch = watch.Watch()
+    for line in log_watch.stream(
+        core_v1.read_namespaced_pod_log, name=pod_name, namespace=namespace
+    ):
+        if not line.startswith(PROGRESS_EVENT_PREFIX):
+            continue
+        event = json.loads(line[len(PROGRESS_EVENT_PREFIX) :])
+        if job_id is not None and event.get("job_id") != job_id:
+            continue
+        if on_event is not None:
+            on_event(event)
+        if event["status"] == "running":
+            if show_progress_bar:
+                print("\r" + _format_progress_bar(event), end="", flush=True)
+            continue
+        log_watch.stop()
+        if show_progress_bar:
+            print()
+        if event["status"] == "failed":
+            raise ValueError(f"Remote run failed: {event['error_message']}")
+        return event
+    raise ValueError(f"Logs of {pod_name} ended before the run was stored.")
+
+
 @click.group()
 def cli():
     pass
 
 
-@cli.command(name="cli-kubernetes-generate-images-based-on-eval-set-execute-remotely")
-def cli_kubernetes_generate_images_based_on_dataset_execute_remotely():
+# magic, payload length and sha256 of the payload, followed by the payload
+INPUT_FRAME_HEADER = struct.Struct(">8sQ32s")
+INPUT_FRAME_MAGIC = b"PIXARIS1"
+# same wait as for uploaded job specs, see _read_verified_upload
+INPUT_TIMEOUT_SECONDS = 300
+
+
+def _encode_input_frame(payload: bytes) -> bytes:
     """
-    CLI command to trigger remote evaluation. This command should be run on the Kubernetes cluster.
-    It will wait for a pickled input file to be uploaded to /tmp/input.pkl and then execute the evaluation.
-    """
-    pickled_input_path = "/tmp/input.pkl"
-    # wait on existence of file (until upload is completed)
-    wait_cycles = 0
-    while not os.path.exists(f"{pickled_input_path}.done"):
-        wait_cycles += 1
-        if wait_cycles > 100:
-            raise ValueError("Timeout: Input file was not uploaded.")
-        print("Waiting for inputs to be uploaded...")
-        time.sleep(3)
-    with open(pickled_input_path, "rb") as f:
-        inputs = pickle.load(f)
+    Frame a job spec to be pushed through the stdin of a pod.
+    """
+    return (
+        INPUT_FRAME_HEADER.pack(
+            INPUT_FRAME_MAGIC, len(payload), hashlib.sha256(payload).digest()
+        )
+        + payload
+    )
+
 
+def _read_exactly(stream, size: int) -> bytes:
+    """
+    Read exactly size bytes from a binary stream, raising ValueError if it ends early.
+    """
+    chunks = []
+    while size > 0:
+        chunk = stream.read(size)
+        if not chunk:
+            raise ValueError("Input stream ended before the job spec was complete.")
+        chunks.append(chunk)
+        size -= len(chunk)
+    return b"".join(chunks)
+
+
+def _read_input_frame(stream, timeout: float = None) -> bytes:
+    """
+    Block until a framed job spec was read from a binary stream, e.g. stdin, and verify its checksum.
+
+    :param stream: The binary stream.
+    :type stream: io.BufferedIOBase
+    :param timeout: Seconds to wait for the complete frame. Defaults to None, which waits forever.
+    :type timeout: float
+    :raises ValueError: If the frame is malformed, incomplete, does not match its checksum or did not arrive in time.
+    :return: The payload of the frame.
+    :rtype: bytes
+    """
+    if timeout is not None:
+        # a blocking read cannot be interrupted, read in a daemon thread that is abandoned on timeout
+        result = {}
+
+        def read_frame():
+            try:
+                result["payload"] = _read_input_frame(stream)
+            except Exception as e:
+                result["error"] = e
+
+        reader = threading.Thread(target=read_frame, daemon=True)
+        reader.start()
+        reader.join(timeout)
+        if reader.is_alive():
+            raise ValueError(
+                "Timeout: The job spec did not arrive on the input stream."
+            )
+        if "error" in result:
+            raise result["error"]
+        return result["payload"]
+
+    magic, size, sha256 = INPUT_FRAME_HEADER.unpack(
+        _read_exactly(stream, INPUT_FRAME_HEADER.size)
+    )
+    if magic != INPUT_FRAME_MAGIC:
+        raise ValueError("The input stream does not start with a pixaris job spec.")
+    payload = _read_exactly(stream, size)
+    if hashlib.sha256(payload).digest() != sha256:
+        raise ValueError(
+            "Checksum of the job spec from the input stream does not match."
+        )
+    return payload
+
+
+def _run_remote_evaluation(inputs: dict[str, any], job_id: str = None):
+    """
+    Run an evaluation from a loaded job spec on the cluster, with the autoscaler if the job spec asks for it,
+    and publish its progress events.
+
+    :param inputs: The inputs loaded from the job spec.
+    :type inputs: dict[str, any]
+    :param job_id: Added to all progress events, to tell apart the jobs of an orchestrator worker. Defaults to None.
+    :type job_id: str, optional
+    """
     data_loader = inputs["data_loader"]
     image_generator = inputs["image_generator"]
     experiment_handler = inputs["experiment_handler"]
     metrics = inputs["metrics"]
     args = inputs["args"]
 
+    autoscaler = None
+    if autoscaling := inputs.get("autoscaling"):
+        config.load_incluster_config()
+        if hasattr(image_generator, "get_metrics"):
+            autoscaling["measure_seconds_per_image"] = lambda: _mean_generation_latency(
+                image_generator.get_metrics()
+            )
+            autoscaling["measure_busy_replicas"] = lambda: (
+                image_generator.get_metrics()["busy_hosts"]
+            )
+        autoscaler = ComfyDeploymentAutoscaler(client.AppsV1Api(), **autoscaling)
+        autoscaler.run_in_background()
+
+    def publish(event):
+        _publish_progress_event({**event, "job_id": job_id} if job_id else event)
+
+    def report_progress(progress):
+        if autoscaler is not None:
+            autoscaler.update_progress(progress)
+        publish(
+            _build_progress_event(
+                progress, args.get("max_parallel_jobs", 1), image_generator
+            )
+        )
+
     print("Starting generation...")
-    generate_images_based_on_dataset(
-        data_loader=data_loader,
-        image_generator=image_generator,
-        experiment_handler=experiment_handler,
-        metrics=metrics,
-        args=args,
+    try:
+        image_name_pairs = generate_images_based_on_dataset(
+            data_loader=data_loader,
+            image_generator=image_generator,
+            experiment_handler=experiment_handler,
+            metrics=metrics,
+            args=args,
+            progress_callback=report_progress,
+        )
+        publish(
+            {
+                "status": "stored",
+                "experiment_run_name": args["experiment_run_name"],
+                "images": len(image_name_pairs),
+            }
+        )
+    except Exception as e:
+        publish({"status": "failed", "error_message": str(e)})
+        raise
+    finally:
+        if autoscaler is not None:
+            autoscaler.stop()
+        # orchestrator workers run many jobs, stop the threads of this one and free its metrics port
+        if hasattr(image_generator, "close"):
+            image_generator.close()
+
+
+@cli.command(name="cli-kubernetes-generate-images-based-on-eval-set-execute-remotely")
+@click.option(
+    "--input-source",
+    type=click.Choice(["file", "stdin"]),
+    default="file",
+    help="Read the job spec pushed through stdin or wait for it to be uploaded to /tmp/input.pkl.",
+)
+@click.option(
+    "--input-timeout",
+    type=float,
+    default=INPUT_TIMEOUT_SECONDS,
+    help="Seconds to wait for the job spec on stdin before failing.",
+)
+def cli_kubernetes_generate_images_based_on_dataset_execute_remotely(
+    input_source, input_timeout
+):
+    """
+    CLI command to trigger remote evaluation. This command should be run on the Kubernetes cluster.
+    It will wait for the job spec to arrive on stdin or to be uploaded to /tmp/input.pkl, verify its
+    checksum and then execute the evaluation. It fails if the job spec is incomplete or does not arrive in time,
+    so the pod does not keep running when the handoff was interrupted.
+    """
+    if input_source == "stdin":
+        print("Waiting for inputs on stdin...")
+        inputs = load_job_spec(
+            _read_input_frame(sys.stdin.buffer, timeout=input_timeout)
+        )
+    else:
+        inputs = load_job_spec(_read_verified_upload("/tmp/input.pkl"))
+
+    _run_remote_evaluation(inputs)
+
+
+# job specs in this directory are run one after another by the orchestrator workers,
+# uploads land in its "incoming" subdirectory and are moved here once verified
+ORCHESTRATOR_QUEUE_DIR = "/tmp/pixaris-queue"
+
+# imported when a worker starts, so the first job spec does not pay for it
+ORCHESTRATOR_WARM_MODULES = [
+    "pixaris.data_loaders.gcp",
+    "pixaris.data_loaders.local",
+    "pixaris.experiment_handlers.gcp",
+    "pixaris.experiment_handlers.local",
+    "pixaris.generation.comfyui_cluster",
+    "pixaris.metrics.iou",
+    "pixaris.metrics.llm",
+]
+
+
+def _next_queued_job_spec(queue_dir: str) -> str | None:
+    """
+    Get the path of the oldest job spec in the queue whose upload is complete.
+
+    :param queue_dir: The queue directory.
+    :type queue_dir: str
+    :return: The path of the job spec or None if the queue is empty.
+    :rtype: str | None
+    """
+    markers = [
+        entry
+        for entry in os.scandir(queue_dir)
+        if entry.is_file() and entry.name.endswith(".pkl.done")
+    ]
+    if not markers:
+        return None
+    oldest = min(markers, key=lambda entry: entry.stat().st_mtime)
+    return oldest.path[: -len(".done")]
+
+
+def _process_queued_job_spec(job_spec_path: str):
+    """
+    Run a queued job spec and remove it from the queue. Failures are published as progress events and do not stop
+    the worker.
+
+    :param job_spec_path: The path of the job spec.
+    :type job_spec_path: str
+    """
+    job_id = pathlib.Path(job_spec_path).name[: -len(".pkl")]
+    print(f"Starting job {job_id}...")
+    try:
+        try:
+            inputs = load_job_spec(
+                _read_verified_upload(job_spec_path, wait_seconds=0, max_wait_cycles=1)
+            )
+        except Exception as e:
+            _publish_progress_event(
+                {"status": "failed", "error_message": str(e), "job_id": job_id}
+            )
+            raise
+        _run_remote_evaluation(inputs, job_id=job_id)
+    except Exception as e:
+        print(f"Job {job_id} failed: {e}")
+    finally:
+        for suffix in ["", ".sha256", ".done"]:
+            if os.path.exists(job_spec_path + suffix):
+                os.remove(job_spec_path + suffix)
+
+
+@cli.command(name="cli-kubernetes-orchestrator-worker")
+@click.option("--queue-dir", default=ORCHESTRATOR_QUEUE_DIR, show_default=True)
+@click.option("--poll-interval", default=0.2, show_default=True)
+def cli_kubernetes_orchestrator_worker(queue_dir, poll_interval):
+    """
+    CLI command for the long-lived workers of the orchestrator pool. This command should be run in the
+    pixaris-orchestrator deployment. It imports the heavy modules once and then runs the job specs that are queued
+    in the queue directory one after another.
+    """
+    for module in ORCHESTRATOR_WARM_MODULES:
+        try:
+            importlib.import_module(module)
+        except ImportError as e:
+            print(f"Could not preload {module}: {e}")
+    os.makedirs(os.path.join(queue_dir, "incoming"), exist_ok=True)
+    print(f"Orchestrator worker waiting for job specs in {queue_dir}")
+    while True:
+        job_spec_path = _next_queued_job_spec(queue_dir)
+        if job_spec_path is None:
+            time.sleep(poll_interval)
+            continue
+        _process_queued_job_spec(job_spec_path)
+
+
+def _shard_blob_name(prefix: str, shard_index: int) -> str:
+    """
+    Name of the blob holding the result of a shard of a sharded run.
+    """
+    return f"{prefix}/shard-{shard_index:05d}.pkl"
+
+
+# a reduce lock older than this is taken over, its shard is assumed to have crashed while merging
+REDUCE_LOCK_TIMEOUT_SECONDS = 3600
+
+
+def _take_over_reduce_lock(bucket, lock_name: str, lock: dict) -> bool:
+    """
+    Take over the reduce lock of a sharded run if its shard stopped merging: the lock was created by an earlier
+    attempt of the same shard, e.g. a pod that was restarted, or is older than REDUCE_LOCK_TIMEOUT_SECONDS.
+    The lock is replaced only if it did not change in the meantime, so at most one shard takes it over.
+
+    :param bucket: The bucket holding the shard results.
+    :type bucket: google.cloud.storage.Bucket
+    :param lock_name: The name of the lock blob.
+    :type lock_name: str
+    :param lock: The content of the lock for this shard.
+    :type lock: dict
+    :return: Whether this shard holds the lock now.
+    :rtype: bool
+    """
+    from google.api_core.exceptions import PreconditionFailed
+
+    held_blob = bucket.get_blob(lock_name)
+    if held_blob is None:
+        return False
+    try:
+        held = json.loads(held_blob.download_as_bytes())
+    except ValueError:
+        held = {}
+    if held.get("done"):
+        print("The results were merged already.")
+        return False
+    age = time.time() - held.get("created", 0)
+    if held.get("shard_index") != lock["shard_index"] and (
+        age < REDUCE_LOCK_TIMEOUT_SECONDS
+    ):
+        print(
+            f"Shard {held.get('shard_index')} is merging the results since {age:.0f} s."
+        )
+        return False
+    print(
+        f"Taking over the reduce lock of shard {held.get('shard_index')}, created {age:.0f} s ago."
+    )
+    try:
+        bucket.blob(lock_name).upload_from_string(
+            json.dumps(lock), if_generation_match=held_blob.generation
+        )
+    except PreconditionFailed:
+        return False
+    return True
+
+
+def _reduce_if_last_shard(
+    bucket,
+    prefix: str,
+    shard_count: int,
+    inputs: dict[str, any],
+    shard_index: int = None,
+) -> bool:
+    """
+    Merge the results of a sharded run if all shards are done. Every shard calls this after uploading its result,
+    the one that sees all results and creates the reduce lock first does the merge. Creating the lock only succeeds
+    if it does not exist yet, so exactly one shard reduces even if several finish at the same time. The lock holds
+    the shard and its creation time. If the merge crashes, the retry of the shard or, after
+    REDUCE_LOCK_TIMEOUT_SECONDS, any other shard takes the lock over. The lock is marked as done after the merge.
+
+    :param bucket: The bucket holding the shard results.
+    :type bucket: google.cloud.storage.Bucket
+    :param prefix: The folder of the sharded run in the bucket.
+    :type prefix: str
+    :param shard_count: The number of shards.
+    :type shard_count: int
+    :param inputs: The inputs of the run loaded from the job spec.
+    :type inputs: dict[str, any]
+    :param shard_index: The index of the calling shard. Defaults to None.
+    :type shard_index: int, optional
+    :return: Whether this shard merged the results.
+    :rtype: bool
+    """
+    from google.api_core.exceptions import PreconditionFailed
+
+    shard_blobs = list(bucket.list_blobs(prefix=f"{prefix}/shard-"))
+    if len(shard_blobs) < shard_count:
+        print(f"{len(shard_blobs)} of {shard_count} shards done, not reducing.")
+        return False
+    lock_name = f"{prefix}/reduce.lock"
+    lock = {
+        "shard_index": shard_index,
+        "host": os.environ.get("HOSTNAME", ""),
+        "created": time.time(),
+    }
+    try:
+        bucket.blob(lock_name).upload_from_string(
+            json.dumps(lock), if_generation_match=0
+        )
+    except PreconditionFailed:
+        if not _take_over_reduce_lock(bucket, lock_name, lock):
+            return False
+
+    print(f"All {shard_count} shards done, merging results...")
+    shard_results = [pickle.loads(blob.download_as_bytes()) for blob in shard_blobs]
+    merge_shard_results(
+        shard_results=shard_results,
+        experiment_handler=inputs["experiment_handler"],
+        metrics=inputs["metrics"],
+        args=inputs["args"],
+    )
+    bucket.blob(lock_name).upload_from_string(json.dumps({**lock, "done": True}))
+    return True
+
+
+@cli.command(name="cli-kubernetes-generate-images-for-shard-execute-remotely")
+def cli_kubernetes_generate_images_for_shard_execute_remotely():
+    """
+    CLI command to run one shard of a sharded remote evaluation. This command should be run as an indexed job on the
+    Kubernetes cluster. It reads the job spec from the bucket, generates the images of its shard and uploads them.
+    The last shard to finish merges all shards into the experiment runs.
+    """
+    shard_index = int(os.environ["JOB_COMPLETION_INDEX"])
+    shard_count = int(os.environ["PIXARIS_SHARD_COUNT"])
+    prefix = os.environ["PIXARIS_SHARD_PREFIX"]
+    from google.cloud import storage
+
+    bucket = storage.Client().bucket(os.environ["PIXARIS_BUCKET"])
+
+    inputs = load_job_spec(bucket.blob(f"{prefix}/job_spec.pkl").download_as_bytes())
+    print(f"Starting generation for shard {shard_index + 1} of {shard_count}...")
+    shard_result = generate_images_for_shard(
+        data_loader=inputs["data_loader"],
+        image_generator=inputs["image_generator"],
+        args=inputs["args"],
+        shard_index=shard_index,
+        shard_count=shard_count,
+    )
+    bucket.blob(_shard_blob_name(prefix, shard_index)).upload_from_string(
+        pickle.dumps(shard_result)
     )
+    _reduce_if_last_shard(bucket, prefix, shard_count, inputs, shard_index)
+
+
+class _StdinChunkWriter:
+    """
+    File-like object that forwards everything written to it to the stdin of an exec stream in chunks.
+    Only one chunk is buffered, so a tar stream written to it is compressed and sent with bounded memory.
+
+    :param resp: The exec stream with stdin enabled.
+    :type resp: kubernetes.stream.ws_client.WSClient
+    :param chunk_size: The size of the websocket frames in bytes.
+    :type chunk_size: int
+    """
+
+    def __init__(self, resp, chunk_size: int):
+        self.resp = resp
+        self.chunk_size = chunk_size
+        self.buffer = bytearray()
+        self.bytes_sent = 0
+
+    def _send(self, chunk: bytes):
+        self.resp.write_stdin(chunk)
+        self.bytes_sent += len(chunk)
+        # drain output without waiting, the next chunk is sent as soon as the websocket accepts it
+        self.resp.update(timeout=0)
+        if self.resp.peek_stderr():
+            print(f"STDERR: {self.resp.read_stderr()}")
+
+    def write(self, data: bytes) -> int:
+        self.buffer += data
+        while len(self.buffer) >= self.chunk_size:
+            self._send(bytes(self.buffer[: self.chunk_size]))
+            del self.buffer[: self.chunk_size]
+        return len(data)
+
+    def flush(self):
+        if self.buffer:
+            self._send(bytes(self.buffer))
+            self.buffer.clear()
+
+
+def _add_bytes_to_tar(tar: tarfile.TarFile, name: str, data: bytes):
+    """
+    Add bytes as a file to a tar archive.
+    """
+    tarinfo = tarfile.TarInfo(name)
+    tarinfo.size = len(data)
+    tarinfo.mtime = int(time.time())
+    tar.addfile(tarinfo, io.BytesIO(data))
+
+
+def _remote_sha256(
+    kube_conn, namespace: str, pod_name: str, dest_path: str, timeout: int = 60
+) -> str | None:
+    """
+    Wait for the completion marker of an upload on a pod and hash the uploaded file there.
+
+    :return: The sha256 hex digest of the file on the pod or None if it did not arrive in time.
+    :rtype: str | None
+    """
+    output = stream(
+        kube_conn.connect_get_namespaced_pod_exec,
+        pod_name,
+        namespace,
+        command=[
+            "sh",
+            "-c",
+            f"for i in $(seq {timeout}); do [ -f {dest_path}.done ] && break; sleep 1; done; "
+            f"[ -f {dest_path}.done ] && sha256sum {dest_path}",
+        ],
+        stderr=True,
+        stdin=False,
+        stdout=True,
+        tty=False,
+    )
+    return output.split()[0] if output.strip() else None
 
 
 def copy_bytes_to_pod(
-    kube_conn, namespace: str, pod_name: str, bytes_to_copy: bytes, dest_path: str
+    kube_conn,
+    namespace: str,
+    pod_name: str,
+    bytes_to_copy: bytes,
+    dest_path: str,
+    chunk_size: int = 1024 * 1024,
+    retries: int = 3,
 ):
     """
     Copy a file to a pod comparable with kubectl cp. See here: https://github.com/kubernetes-client/python/issues/476#issuecomment-2701387338
+    The gzip tar is compressed while it is sent. Besides the file, it contains <dest_path>.sha256 with the checksum
+    and, as its last member, the completion marker <dest_path>.done. tar only extracts the last members once stdin
+    is closed, so the stream is closed before the checksum of the file on the pod is compared with the local one in
+    a separate exec. The upload is repeated if they differ.
 
     Args:
         kube_conn: The connection to the Kubernetes cluster.
@@ -71,56 +872,228 @@ def copy_bytes_to_pod(
         pod_name: The name of the pod.
         bytes_to_copy: The bytes to be copied.
         dest_path: The destination path on the pod.
+        chunk_size: The size of the chunks sent to the pod in bytes. Defaults to 1 MiB.
+        retries: How often to repeat the upload if the checksum on the pod does not match. Defaults to 3.
     """
-    # open and compress local tar file
-    buf = io.BytesIO()
-    with tarfile.open(fileobj=buf, mode="w:gz") as tar:
-        tarinfo = tarfile.TarInfo(pathlib.Path(dest_path).name)
-        tarinfo.size = len(bytes_to_copy)
-        tar.addfile(tarinfo, io.BytesIO(bytes_to_copy))
-    buf.seek(0)
+    name = pathlib.Path(dest_path).name
+    sha256 = hashlib.sha256(bytes_to_copy).hexdigest()
+    # remove the marker of an earlier attempt, it must only appear once this upload is extracted completely
+    exec_command = [
+        "sh",
+        "-c",
+        f"rm -f {dest_path}.done && tar xzf - -C {pathlib.Path(dest_path).parent}",
+    ]
 
-    # Copying file
-    exec_command = ["tar", "xzvf", "-", "-C", str(pathlib.Path(dest_path).parent)]
-    resp = stream(
-        kube_conn.connect_get_namespaced_pod_exec,
-        pod_name,
-        namespace,
-        command=exec_command,
-        stderr=True,
-        stdin=True,
-        stdout=True,
-        tty=False,
-        _preload_content=False,
-    )
+    for attempt in range(1, retries + 2):
+        resp = stream(
+            kube_conn.connect_get_namespaced_pod_exec,
+            pod_name,
+            namespace,
+            command=exec_command,
+            stderr=True,
+            stdin=True,
+            stdout=True,
+            tty=False,
+            _preload_content=False,
+        )
+        writer = _StdinChunkWriter(resp, chunk_size)
+        with tarfile.open(fileobj=writer, mode="w|gz") as tar:
+            _add_bytes_to_tar(tar, name, bytes_to_copy)
+            _add_bytes_to_tar(tar, f"{name}.sha256", sha256.encode("ascii"))
+            _add_bytes_to_tar(tar, f"{name}.done", b"")
+        writer.flush()
+        # closing the stream closes the stdin of tar, which then extracts the remaining members and exits
+        resp.close()
+
+        remote_sha256 = _remote_sha256(kube_conn, namespace, pod_name, dest_path)
+        if remote_sha256 == sha256:
+            print(
+                f"File copied to {pod_name}:{dest_path} "
+                f"({len(bytes_to_copy) / 1024:.1f} KiB, {writer.bytes_sent / 1024:.1f} KiB sent)"
+            )
+            return
+        print(
+            f"Checksum mismatch on {pod_name}:{dest_path} (attempt {attempt}), uploading again..."
+        )
+    raise ValueError(f"Failed to copy file to {pod_name}:{dest_path}.")
 
-    chunk_size = 10 * 1024 * 1024
-    while resp.is_open():
-        resp.update(timeout=1)
-        if resp.peek_stdout():
-            print(f"STDOUT: {resp.read_stdout()}")
-        if resp.peek_stderr():
-            print(f"STDERR: {resp.read_stderr()}")
-        if read := buf.read(chunk_size):
-            resp.write_stdin(read)
-        else:
-            break
-    resp.close()
 
+def push_bytes_to_pod_stdin(
+    kube_conn,
+    namespace: str,
+    pod_name: str,
+    bytes_to_push: bytes,
+    container: str = "main",
+    chunk_size: int = 1024 * 1024,
+):
+    """
+    Push bytes as one checksummed frame to the stdin of a running container, which has to be created with
+    stdin and stdinOnce. The remote side reads it with _read_input_frame and starts as soon as it arrived.
+
+    :param kube_conn: The connection to the Kubernetes cluster.
+    :type kube_conn: kubernetes.client.CoreV1Api
+    :param namespace: The namespace of the pod.
+    :type namespace: str
+    :param pod_name: The name of the pod.
+    :type pod_name: str
+    :param bytes_to_push: The bytes to push.
+    :type bytes_to_push: bytes
+    :param container: The name of the container. Defaults to "main".
+    :type container: str
+    :param chunk_size: The size of the chunks sent to the pod in bytes. Defaults to 1 MiB.
+    :type chunk_size: int
+    """
     resp = stream(
-        kube_conn.connect_get_namespaced_pod_exec,
+        kube_conn.connect_get_namespaced_pod_attach,
         pod_name,
         namespace,
-        command=["touch", f"{dest_path}.done"],
-        stderr=True,
-        stdin=False,
-        stdout=True,
+        container=container,
+        stdin=True,
+        stdout=False,
+        stderr=False,
         tty=False,
         _preload_content=False,
     )
+    writer = _StdinChunkWriter(resp, chunk_size)
+    writer.write(_encode_input_frame(bytes_to_push))
+    writer.flush()
+    # closing the attach closes stdin because of stdinOnce
     resp.close()
+    print(f"Pushed {len(bytes_to_push) / 1024:.1f} KiB to {pod_name}")
+
+
+def _wait_for_job_pod(
+    core_v1, job_name: str, namespace: str = "batch", timeout_seconds: int = 600
+) -> str:
+    """
+    Watch the pods of a job until one is running, instead of polling.
+
+    :param core_v1: The core API client.
+    :type core_v1: kubernetes.client.CoreV1Api
+    :param job_name: The name of the job.
+    :type job_name: str
+    :param namespace: The namespace of the job. Defaults to "batch".
+    :type namespace: str
+    :param timeout_seconds: Seconds to wait for the pod. Defaults to 600.
+    :type timeout_seconds: int
+    :raises ValueError: If the pod failed or did not start in time.
+    :return: The name of the running pod.
+    :rtype: str
+    """
+    print("Waiting for pod to start...")
+    pod_watch = watch.Watch()
+    for event in pod_watch.stream(
+        core_v1.list_namespaced_pod,
+        namespace=namespace,
+        label_selector=f"job-name={job_name}",
+        timeout_seconds=timeout_seconds,
+    ):
+        pod = event["object"]
+        if pod.status.phase == "Running":
+            pod_watch.stop()
+            return pod.metadata.name
+        if pod.status.phase == "Failed":
+            pod_watch.stop()
+            raise ValueError(f"Job {job_name} failed.")
+    raise ValueError(f"Timeout: No pod of job {job_name} started.")
+
+
+def _read_verified_upload(
+    path: str, wait_seconds: float = 0.5, max_wait_cycles: int = 600
+) -> bytes:
+    """
+    Wait for a file uploaded with copy_bytes_to_pod and check it against its checksum. A corrupted upload is discarded
+    and the wait continues, the sender uploads it again.
+
+    :param path: The path of the uploaded file.
+    :type path: str
+    :param wait_seconds: Seconds between two checks. Defaults to 0.5.
+    :type wait_seconds: float
+    :param max_wait_cycles: Number of checks before giving up. Defaults to 600.
+    :type max_wait_cycles: int
+    :raises ValueError: If no valid file arrived in time.
+    :return: The content of the file.
+    :rtype: bytes
+    """
+    print("Waiting for inputs to be uploaded...")
+    for _ in range(max_wait_cycles):
+        if os.path.exists(f"{path}.done"):
+            with open(path, "rb") as f:
+                data = f.read()
+            with open(f"{path}.sha256", "r") as f:
+                expected_sha256 = f.read().strip()
+            if hashlib.sha256(data).hexdigest() == expected_sha256:
+                return data
+            print(
+                "Checksum of the uploaded inputs does not match, waiting for upload..."
+            )
+            os.remove(f"{path}.done")
+        time.sleep(wait_seconds)
+    raise ValueError("Timeout: Input file was not uploaded.")
 
-    print(f"File copied to {pod_name}:{dest_path}")
+
+def _prepare_autoscaling(
+    auto_scale: bool,
+    target_completion_seconds: float | None,
+    seconds_per_image: float,
+    args: dict[str, any],
+) -> dict | None:
+    """
+    Prepare the scaling of the Comfy deployment for a remote run. With a target completion time, the remote side
+    runs a ComfyDeploymentAutoscaler, otherwise the deployment is scaled to max_parallel_jobs right away.
+
+    :return: The arguments of the ComfyDeploymentAutoscaler for the job spec or None.
+    :rtype: dict | None
+    """
+    if auto_scale and target_completion_seconds is not None:
+        # the remote job knows the dataset size and measures latency, it scales the deployment itself
+        return {
+            "target_completion_seconds": target_completion_seconds,
+            "max_replicas": args.get("max_parallel_jobs", 1),
+            "seconds_per_image": seconds_per_image,
+        }
+    if auto_scale:  # always necessary unless the cluster was already scaled up manually
+        max_parallel_jobs = args.get("max_parallel_jobs", 1)
+        print("Auto scaling...")
+        print(f"Scaling to {max_parallel_jobs} replicas")
+        apps_v1 = client.AppsV1Api()
+        apps_v1.patch_namespaced_deployment_scale(
+            "comfy-ui-deployment", "batch", {"spec": {"replicas": max_parallel_jobs}}
+        )
+    return None
+
+
+def _follow_remote_run(
+    core_v1, pod_name: str, follow: str | None, job_id: str = None
+) -> dict | concurrent.futures.Future | None:
+    """
+    Follow a remote run as requested by the follow argument of the launchers.
+
+    :return: The final progress event if follow is "block", a Future of it if follow is "future", otherwise None.
+    :rtype: dict | concurrent.futures.Future | None
+    """
+    if follow == "block":
+        return follow_remote_progress(core_v1, pod_name, "batch", job_id=job_id)
+    if follow == "future":
+        future = concurrent.futures.Future()
+
+        def follow_in_background():
+            try:
+                future.set_result(
+                    follow_remote_progress(
+                        core_v1,
+                        pod_name,
+                        "batch",
+                        show_progress_bar=False,
+                        job_id=job_id,
+                    )
+                )
+            except Exception as e:
+                future.set_exception(e)
+
+        threading.Thread(target=follow_in_background, daemon=True).start()
+        return future
+    return None
 
 
 def pixaris_orchestration_kubernetes_locally(
@@ -130,10 +1103,15 @@ def pixaris_orchestration_kubernetes_locally(
     metrics: list[BaseMetric],
     args: dict[str, any],
     auto_scale: bool,
-):
+    target_completion_seconds: float = None,
+    seconds_per_image: float = 60,
+    input_handoff: str = "stdin",
+    follow: str = None,
+) -> dict | concurrent.futures.Future | None:
     """
-    Trigger remote evaluation on the Kubernetes cluster. This function will pickle the inputs and upload them to the
-    Kubernetes cluster. It will then trigger the remote evaluation.
+    Trigger remote evaluation on the Kubernetes cluster. This function will serialise the inputs into a compact job spec
+    and upload it to the Kubernetes cluster. Dataset images are sent as references and resolved remotely.
+    It will then trigger the remote evaluation.
 
     :param data_loader: The data loader to load the evaluation set.
     :type data_loader: DatasetLoader
@@ -143,8 +1121,20 @@ def pixaris_orchestration_kubernetes_locally(
     :type experiment_handler: ExperimentHandler
     :param metrics: The metrics to calculate.
     :type metrics: list[BaseMetric]
-    :param auto_scale: Whether to auto scale the cluster to the maximum number of parallel jobs.
+    :param auto_scale: Whether to auto scale the cluster. Without target_completion_seconds, the cluster is scaled to
+      the maximum number of parallel jobs once.
     :type auto_scale: bool
+    :param target_completion_seconds: If set together with auto_scale, the remote job runs a ComfyDeploymentAutoscaler that
+      sizes the deployment to finish all images within this time and scales it down as the queue drains. Defaults to None.
+    :type target_completion_seconds: float, optional
+    :param seconds_per_image: The estimated generation time per image used by the autoscaler until it measured one. Defaults to 60.
+    :type seconds_per_image: float
+    :param input_handoff: "stdin" pushes the job spec through the stdin of the pod as soon as it runs, "file" uploads it
+      to /tmp/input.pkl for the remote side to pick up. Defaults to "stdin".
+    :type input_handoff: str
+    :param follow: "block" waits for the run and shows a progress bar, "future" returns a Future that completes when
+      the run is stored. Defaults to None, which returns right after the job spec was handed over.
+    :type follow: str, optional
     :param args: A dictionary of arguments, including:
     * "workflow_apiformat_json" (str): The path to the workflow file in API format.
     * "workflow_pillow_image" (PIL.Image): The image to use as input for the workflow.
@@ -153,27 +1143,30 @@ def pixaris_orchestration_kubernetes_locally(
     * "experiment_run_name" (str): The name of the run.
     * "max_parallel_jobs" (int): The maximum number of parallel jobs to run.
     :type args: dict[str, any]
+    :return: The final progress event if follow is "block", a Future of it if follow is "future", otherwise None.
+    :rtype: dict | concurrent.futures.Future | None
     """
+    if input_handoff not in ["stdin", "file"]:
+        raise ValueError(f"Unsupported input handoff {input_handoff}.")
+    if follow not in [None, "block", "future"]:
+        raise ValueError(f"Unsupported follow mode {follow}.")
     config.load_kube_config()
-    if auto_scale:  # always necessary unless the cluster was already scaled up manually
-        max_parallel_jobs = args.get("max_parallel_jobs", 1)
-        print("Auto scaling...")
-        print(f"Scaling to {max_parallel_jobs} replicas")
-        apps_v1 = client.AppsV1Api()
-        apps_v1.patch_namespaced_deployment_scale(
-            "comfy-ui-deployment", "batch", {"spec": {"replicas": max_parallel_jobs}}
-        )
+    autoscaling = _prepare_autoscaling(
+        auto_scale, target_completion_seconds, seconds_per_image, args
+    )
     print("Triggering remote evaluation...")
 
-    # Prepare the inputs and and pickle them
+    # Prepare the inputs and serialise them into a job spec
     inputs = {
         "data_loader": data_loader,
         "image_generator": image_generator,
         "experiment_handler": experiment_handler,
         "metrics": metrics,
         "args": args,
+        "autoscaling": autoscaling,
     }
-    pickled_inputs = pickle.dumps(inputs)
+    job_spec = create_job_spec(inputs)
+    print(f"Job spec size: {len(job_spec) / 1024:.1f} KiB")
 
     # Trigger the remote evaluation
     batch_v1 = client.BatchV1Api()
@@ -194,49 +1187,328 @@ def pixaris_orchestration_kubernetes_locally(
                         {
                             "name": "main",
                             "image": "ghcr.io/ottogroup/pixaris:latest",
+                            "imagePullPolicy": "Always",
                             "command": [
                                 "pixaris-orchestration-kubernetes",
                                 "cli-kubernetes-generate-images-based-on-eval-set-execute-remotely",
+                                f"--input-source={input_handoff}",
                             ],
+                            # the job spec is pushed through stdin, which closes after the first attach
+                            "stdin": input_handoff == "stdin",
+                            "stdinOnce": input_handoff == "stdin",
                         }
                     ],
                     "restartPolicy": "Never",
-                    "imagePullPolicy": "Always",
                 }
             },
         },
     }
     batch_v1.create_namespaced_job(body=job, namespace="batch")
 
-    # Get pod name to upload inputs there
+    # Hand the job spec to the pod as soon as it runs
     core_v1 = client.CoreV1Api()
-    pod_name = None
-    while pod_name is None:
-        print("Waiting for pod to start...")
-        time.sleep(5)
-        job = batch_v1.read_namespaced_job(job_name, "batch")
-        if job.status.failed:
-            raise ValueError(f"Job {job_name} failed.")
+    pod_name = _wait_for_job_pod(core_v1, job_name, "batch")
+    if input_handoff == "stdin":
+        push_bytes_to_pod_stdin(
+            kube_conn=core_v1,
+            namespace="batch",
+            pod_name=pod_name,
+            bytes_to_push=job_spec,
+        )
+    else:
+        copy_bytes_to_pod(
+            kube_conn=core_v1,
+            namespace="batch",
+            pod_name=pod_name,
+            bytes_to_copy=job_spec,
+            dest_path="/tmp/input.pkl",
+        )
+
+    print("Remote evaluation triggered.")
+    print(f"Job logs: kubectl logs -n batch job/{job_name}")
+    print(
+        f"or https://console.cloud.google.com/kubernetes/job/europe-west4-a/cluster/batch/{job_name}/logs?project={args['gcp_project_id']}"
+    )
+
+    return _follow_remote_run(core_v1, pod_name, follow)
+
+
+def pixaris_orchestration_kubernetes_sharded_locally(
+    data_loader: DatasetLoader,
+    image_generator: ImageGenerator,
+    experiment_handler: ExperimentHandler,
+    metrics: list[BaseMetric],
+    args: dict[str, any],
+    num_shards: int,
+    gcp_pixaris_bucket_name: str,
+):
+    """
+    Trigger a sharded remote evaluation on the Kubernetes cluster. The dataset and, if args contains "hyperparameters",
+    the hyperparameter grid are split into num_shards shards that run as an indexed job with one pod per shard.
+    The job spec and the shard results are exchanged through the bucket, the last shard to finish merges them into
+    one experiment run per grid point with the metrics calculated over all images.
 
-        pods = core_v1.list_namespaced_pod(
-            namespace="batch", label_selector=f"job-name={job_name}"
+    :param data_loader: The data loader to load the evaluation set.
+    :type data_loader: DatasetLoader
+    :param image_generator: The image generator to generate images. E.g. ComfyClusterGenerator
+    :type image_generator: ImageGenerator
+    :param experiment_handler: The experiment handler to save generated images.
+    :type experiment_handler: ExperimentHandler
+    :param metrics: The metrics to calculate.
+    :type metrics: list[BaseMetric]
+    :param args: A dictionary of arguments as for pixaris_orchestration_kubernetes_locally. "max_parallel_jobs" applies
+      to every shard.
+    :type args: dict[str, any]
+    :param num_shards: The number of shards and pods.
+    :type num_shards: int
+    :param gcp_pixaris_bucket_name: The bucket to exchange the job spec and the shard results.
+    :type gcp_pixaris_bucket_name: str
+    :return: The name of the job.
+    :rtype: str
+    """
+    if num_shards < 1:
+        raise ValueError("num_shards has to be at least 1.")
+    config.load_kube_config()
+    print("Triggering sharded remote evaluation...")
+
+    inputs = {
+        "data_loader": data_loader,
+        "image_generator": image_generator,
+        "experiment_handler": experiment_handler,
+        "metrics": metrics,
+        "args": args,
+    }
+    job_spec = create_job_spec(inputs)
+    print(f"Job spec size: {len(job_spec) / 1024:.1f} KiB")
+
+    experiment_run_name = args["experiment_run_name"]
+    job_name = f"evaluation-{experiment_run_name[0 : (min(30, len(experiment_run_name)))]}-{uuid.uuid4().hex[0:6]}"
+    prefix = f"results/pickled_results/{job_name}"
+    # only sharded runs need the gcp dependencies
+    from google.cloud import storage
+
+    bucket = storage.Client().bucket(gcp_pixaris_bucket_name)
+    bucket.blob(f"{prefix}/job_spec.pkl").upload_from_string(job_spec)
+
+    job = {
+        "apiVersion": "batch/v1",
+        "kind": "Job",
+        "metadata": {"name": job_name},
+        "spec": {
+            "completionMode": "Indexed",
+            "parallelism": num_shards,
+            "completions": num_shards,
+            # allow every shard one retry, the results are written idempotently
+            "backoffLimit": num_shards,
+            "template": {
+                "spec": {
+                    "serviceAccountName": "experiment",
+                    "containers": [
+                        {
+                            "name": "main",
+                            "image": "ghcr.io/ottogroup/pixaris:latest",
+                            "imagePullPolicy": "Always",
+                            "command": [
+                                "pixaris-orchestration-kubernetes",
+                                "cli-kubernetes-generate-images-for-shard-execute-remotely",
+                            ],
+                            "env": [
+                                {
+                                    "name": "PIXARIS_SHARD_COUNT",
+                                    "value": str(num_shards),
+                                },
+                                {
+                                    "name": "PIXARIS_BUCKET",
+                                    "value": gcp_pixaris_bucket_name,
+                                },
+                                {"name": "PIXARIS_SHARD_PREFIX", "value": prefix},
+                            ],
+                        }
+                    ],
+                    "restartPolicy": "Never",
+                }
+            },
+        },
+    }
+    client.BatchV1Api().create_namespaced_job(body=job, namespace="batch")
+
+    print(f"Remote evaluation triggered with {num_shards} shards.")
+    print(f"Job logs: kubectl logs -n batch job/{job_name}")
+    print(f"Shard results: gs://{gcp_pixaris_bucket_name}/{prefix}/")
+    return job_name
+
+
+def ensure_orchestrator_pool(
+    replicas: int = 1,
+    namespace: str = "batch",
+    deployment: str = "pixaris-orchestrator",
+):
+    """
+    Create the deployment of long-lived orchestrator workers or scale it to the given number of replicas. The workers
+    import the pixaris stack once and then accept job specs from pixaris_orchestration_kubernetes_pooled_locally.
+    Scale to 0 replicas to shut the pool down.
+
+    :param replicas: The number of workers. Defaults to 1.
+    :type replicas: int
+    :param namespace: The namespace of the deployment. Defaults to "batch".
+    :type namespace: str
+    :param deployment: The name of the deployment. Defaults to "pixaris-orchestrator".
+    :type deployment: str
+    """
+    config.load_kube_config()
+    apps_v1 = client.AppsV1Api()
+    body = {
+        "apiVersion": "apps/v1",
+        "kind": "Deployment",
+        "metadata": {"name": deployment},
+        "spec": {
+            "replicas": replicas,
+            "selector": {"matchLabels": {"app": deployment}},
+            "template": {
+                "metadata": {"labels": {"app": deployment}},
+                "spec": {
+                    "serviceAccountName": "experiment",
+                    "containers": [
+                        {
+                            "name": "main",
+                            "image": "ghcr.io/ottogroup/pixaris:latest",
+                            # the pool is long-lived, a cached image is fine
+                            "imagePullPolicy": "IfNotPresent",
+                            "command": [
+                                "pixaris-orchestration-kubernetes",
+                                "cli-kubernetes-orchestrator-worker",
+                            ],
+                        }
+                    ],
+                },
+            },
+        },
+    }
+    try:
+        apps_v1.create_namespaced_deployment(namespace=namespace, body=body)
+        print(f"Created {deployment} with {replicas} replicas")
+    except client.exceptions.ApiException as e:
+        if e.status != 409:
+            raise
+        apps_v1.patch_namespaced_deployment_scale(
+            deployment, namespace, {"spec": {"replicas": replicas}}
         )
-        for pod in pods.items:
-            pod_phase = pod.status.phase
-            if pod_phase == "Running":
-                pod_name = pod.metadata.name
+        print(f"Scaled {deployment} to {replicas} replicas")
+
 
-    # Copy the pickled inputs to the pod
+def _pick_orchestrator_pod(
+    core_v1, namespace: str = "batch", deployment: str = "pixaris-orchestrator"
+) -> str:
+    """
+    Pick a running worker of the orchestrator pool at random.
+
+    :raises ValueError: If no worker is running.
+    :return: The name of the pod.
+    :rtype: str
+    """
+    pods = core_v1.list_namespaced_pod(
+        namespace=namespace, label_selector=f"app={deployment}"
+    )
+    running_pods = [
+        pod.metadata.name
+        for pod in pods.items
+        if pod.status.phase == "Running" and pod.metadata.deletion_timestamp is None
+    ]
+    if not running_pods:
+        raise ValueError(
+            f"No running orchestrator worker in {namespace}/{deployment}, start the pool with ensure_orchestrator_pool."
+        )
+    return random.choice(running_pods)
+
+
+def pixaris_orchestration_kubernetes_pooled_locally(
+    data_loader: DatasetLoader,
+    image_generator: ImageGenerator,
+    experiment_handler: ExperimentHandler,
+    metrics: list[BaseMetric],
+    args: dict[str, any],
+    auto_scale: bool = False,
+    target_completion_seconds: float = None,
+    seconds_per_image: float = 60,
+    follow: str = None,
+    deployment: str = "pixaris-orchestrator",
+) -> dict | concurrent.futures.Future | None:
+    """
+    Run a remote evaluation on a warm worker of the orchestrator pool instead of a new job. The job spec is queued on
+    a running worker, which starts it without pulling an image or importing the pixaris stack.
+    Start the pool once with ensure_orchestrator_pool.
+
+    :param data_loader: The data loader to load the evaluation set.
+    :type data_loader: DatasetLoader
+    :param image_generator: The image generator to generate images. E.g. ComfyClusterGenerator
+    :type image_generator: ImageGenerator
+    :param experiment_handler: The experiment handler to save generated images.
+    :type experiment_handler: ExperimentHandler
+    :param metrics: The metrics to calculate.
+    :type metrics: list[BaseMetric]
+    :param args: A dictionary of arguments as for pixaris_orchestration_kubernetes_locally.
+    :type args: dict[str, any]
+    :param auto_scale: Whether to auto scale the cluster, see pixaris_orchestration_kubernetes_locally. Defaults to False.
+    :type auto_scale: bool
+    :param target_completion_seconds: The target completion time for the autoscaler. Defaults to None.
+    :type target_completion_seconds: float, optional
+    :param seconds_per_image: The estimated generation time per image for the autoscaler. Defaults to 60.
+    :type seconds_per_image: float
+    :param follow: "block" waits for the run and shows a progress bar, "future" returns a Future that completes when
+      the run is stored. Defaults to None, which returns right after the job spec was queued.
+    :type follow: str, optional
+    :param deployment: The name of the orchestrator deployment. Defaults to "pixaris-orchestrator".
+    :type deployment: str
+    :return: The final progress event if follow is "block", a Future of it if follow is "future", otherwise None.
+    :rtype: dict | concurrent.futures.Future | None
+    """
+    if follow not in [None, "block", "future"]:
+        raise ValueError(f"Unsupported follow mode {follow}.")
+    config.load_kube_config()
+    autoscaling = _prepare_autoscaling(
+        auto_scale, target_completion_seconds, seconds_per_image, args
+    )
+
+    inputs = {
+        "data_loader": data_loader,
+        "image_generator": image_generator,
+        "experiment_handler": experiment_handler,
+        "metrics": metrics,
+        "args": args,
+        "autoscaling": autoscaling,
+    }
+    job_spec = create_job_spec(inputs)
+    print(f"Job spec size: {len(job_spec) / 1024:.1f} KiB")
+
+    core_v1 = client.CoreV1Api()
+    pod_name = _pick_orchestrator_pod(core_v1, "batch", deployment)
+    experiment_run_name = args["experiment_run_name"]
+    job_id = f"{experiment_run_name[0 : (min(30, len(experiment_run_name)))]}-{uuid.uuid4().hex[0:6]}"
+    incoming_path = f"{ORCHESTRATOR_QUEUE_DIR}/incoming/{job_id}.pkl"
     copy_bytes_to_pod(
         kube_conn=core_v1,
         namespace="batch",
         pod_name=pod_name,
-        bytes_to_copy=pickled_inputs,
-        dest_path="/tmp/input.pkl",
+        bytes_to_copy=job_spec,
+        dest_path=incoming_path,
     )
-
-    print("Remote evaluation triggered.")
-    print(f"Job logs: kubectl logs -n batch job/{job_name}")
-    print(
-        f"or https://console.cloud.google.com/kubernetes/job/europe-west4-a/cluster/batch/{job_name}/logs?project={args['gcp_project_id']}"
+    # enqueue only the verified upload, the marker moves last so the worker never sees a partial job spec
+    stream(
+        core_v1.connect_get_namespaced_pod_exec,
+        pod_name,
+        "batch",
+        command=[
+            "sh",
+            "-c",
+            f"mv {incoming_path} {incoming_path}.sha256 {ORCHESTRATOR_QUEUE_DIR}/ "
+            f"&& mv {incoming_path}.done {ORCHESTRATOR_QUEUE_DIR}/",
+        ],
+        stderr=True,
+        stdin=False,
+        stdout=True,
+        tty=False,
     )
+
+    print(f"Job {job_id} queued on {pod_name}.")
+    print(f"Job logs: kubectl logs -n batch {pod_name}")
+    return _follow_remote_run(core_v1, pod_name, follow, job_id=job_id)
@@ -46,7 +46,7 @@ def ensure_table_exists(
     bigquery_client: bigquery.Client,
 ):
     """
-    Ensures that the BigQuery table exists with the correct schema.
+    Ensures that the BigQuery table exists with the correct schema. Columns missing in an existing table are added.
     :param table_ref: The reference to the BigQuery table.
     :type table_ref: str
     :param bigquery_input: The dictionary used to generate the schema.
@@ -66,3 +66,13 @@ def ensure_table_exists(
             print(f"Created table {table_ref}.")
         else:
             raise e
+        return
+
+    existing_fields = {field.name for field in table.schema}
+    missing_fields = [field for field in schema if field.name not in existing_fields]
+    if missing_fields:
+        table.schema = list(table.schema) + missing_fields
+        bigquery_client.update_table(table, ["schema"])
+        print(
+            f"Added columns {', '.join(field.name for field in missing_fields)} to table {table_ref}."
+        )
@@ -0,0 +1,136 @@
+from PIL import Image, features
+
+# the extensions of images the experiment and feedback handlers read
+IMAGE_EXTENSIONS = (".png", ".jpg", ".jpeg", ".webp", ".avif")
+
+# pass_through: images that a generator returned already encoded in the format are written as they are
+ENCODING_PROFILES = {
+    # Pillow's default, a balance of size and speed
+    "png": {
+        "format": "PNG",
+        "extension": ".png",
+        "save_kwargs": {},
+        "pass_through": True,
+    },
+    # about 3x faster to encode, 10-30% larger
+    "png-fast": {
+        "format": "PNG",
+        "extension": ".png",
+        "save_kwargs": {"compress_level": 1},
+        "pass_through": True,
+    },
+    # slowest to encode, smallest lossless PNG
+    "png-small": {
+        "format": "PNG",
+        "extension": ".png",
+        "save_kwargs": {"compress_level": 9, "optimize": True},
+        "pass_through": False,
+    },
+    # lossless, usually 25-35% smaller than PNG
+    "webp-lossless": {
+        "format": "WEBP",
+        "extension": ".webp",
+        "save_kwargs": {"lossless": True, "quality": 100, "method": 4},
+        # a WEBP from a generator may be lossy
+        "pass_through": False,
+    },
+    # lossy previews, use quality 95 and no chroma subsampling, otherwise expect square artifacts
+    "jpeg-preview": {
+        "format": "JPEG",
+        "extension": ".jpg",
+        "save_kwargs": {"quality": 95, "subsampling": 0},
+        "pass_through": False,
+    },
+    "avif-preview": {
+        "format": "AVIF",
+        "extension": ".avif",
+        "save_kwargs": {"quality": 90},
+        "pass_through": False,
+    },
+}
+
+_REQUIRED_FEATURES = {"WEBP": "webp", "AVIF": "avif"}
+
+
+def resolve_encoding_profile(profile: str | dict) -> dict:
+    """
+    Looks up an encoding profile and checks that the installed Pillow can write it.
+
+    :param profile: The name of a profile in ENCODING_PROFILES or a custom profile, a dict with the keys "name",
+      "format", "extension", "save_kwargs" and "pass_through", e.g. a PNG with {"compress_level": 4}.
+    :type profile: str | dict
+    :raises ValueError: If the profile is unknown or its format is not supported by the installed Pillow.
+    :return: The profile, including its name.
+    :rtype: dict
+    """
+    if isinstance(profile, str):
+        if profile not in ENCODING_PROFILES:
+            raise ValueError(
+                f"Unknown encoding profile {profile}. Choose one of {', '.join(ENCODING_PROFILES)} or pass a dict."
+            )
+        profile = {"name": profile, **ENCODING_PROFILES[profile]}
+    else:
+        profile = {
+            "name": "custom",
+            "save_kwargs": {},
+            "pass_through": False,
+            **profile,
+        }
+    feature = _REQUIRED_FEATURES.get(profile["format"])
+    if feature is not None and not features.check(feature):
+        raise ValueError(
+            f"The encoding profile {profile['name']} needs {profile['format']} support, which the installed Pillow lacks."
+        )
+    return profile
+
+
+def convert_for_format(image: Image.Image, format: str) -> Image.Image:
+    """
+    Converts an image to a mode the format can store, e.g. JPEG has no alpha channel.
+
+    :param image: The image.
+    :type image: Image.Image
+    :param format: The format the image will be saved in.
+    :type format: str
+    :return: The image itself or a converted copy.
+    :rtype: Image.Image
+    """
+    if format == "JPEG" and image.mode not in ("RGB", "L", "CMYK"):
+        return image.convert("RGB")
+    if format in ("WEBP", "AVIF") and image.mode not in ("RGB", "RGBA", "L"):
+        return image.convert("RGBA" if "A" in image.getbands() else "RGB")
+    return image
+
+
+def attach_encoded_bytes(image: Image.Image, data: bytes):
+    """
+    Keeps the bytes an image was decoded from next to it, so they can be stored without encoding the image again.
+    Copies and conversions of the image do not carry them.
+
+    :param image: The image opened from data.
+    :type image: Image.Image
+    :param data: The encoded image.
+    :type data: bytes
+    """
+    image._pixaris_encoded = (data, image.format, image.size, image.mode)
+
+
+def get_encoded_bytes(image: Image.Image, format: str) -> bytes | None:
+    """
+    The bytes attached with attach_encoded_bytes, if they are in the given format and the size and mode of the
+    image did not change since.
+
+    :param image: The image.
+    :type image: Image.Image
+    :param format: The format the bytes are needed in, e.g. "PNG".
+    :type format: str
+    :return: The encoded image or None.
+    :rtype: bytes | None
+    """
+    encoded = getattr(image, "_pixaris_encoded", None)
+    if not isinstance(encoded, tuple):
+        return None
+    data, encoded_format, size, mode = encoded
+    if encoded_format != format or image.size != size or image.mode != mode:
+        return None
+    return data
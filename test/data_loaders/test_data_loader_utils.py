@@ -0,0 +1,125 @@
+import io
+import os
+import tempfile
+import threading
+import time
+import unittest
+
+from PIL import Image
+
+from pixaris.data_loaders.utils import PrefetchIterator, load_item_images
+
+
+class TestPrefetchIterator(unittest.TestCase):
+    def test_prefetch_is_bounded(self):
+        """
+        The background thread should not prepare more than prefetch items ahead.
+        """
+        produced = []
+
+        def source():
+            for i in range(100):
+                produced.append(i)
+                yield i
+
+        items = PrefetchIterator(source(), prefetch=3, total=100)
+        self.assertEqual(next(items), 0)
+        time.sleep(0.3)
+        # three items in the queue, one waiting to be put
+        self.assertLessEqual(len(produced), 5)
+        self.assertEqual(list(items), list(range(1, 100)))
+        self.assertEqual(len(items), 100)
+
+    def test_errors_are_raised_in_order(self):
+        def source():
+            yield 1
+            raise ValueError("broken item")
+
+        items = PrefetchIterator(source())
+        self.assertEqual(next(items), 1)
+        with self.assertRaisesRegex(ValueError, "broken item"):
+            next(items)
+        with self.assertRaises(TypeError):
+            len(items)
+
+    def test_close_stops_background_thread(self):
+        items = PrefetchIterator(iter(range(1000)), prefetch=2)
+        next(items)
+        items.close()
+        items._thread.join(timeout=1)
+        self.assertFalse(items._thread.is_alive())
+        self.assertEqual(list(items), [])
+
+    def test_parallel_transform_keeps_order_and_bound(self):
+        """
+        Workers may finish out of order, the items should still come in order and never more than prefetch
+        of them should be in progress at once.
+        """
+        lock = threading.Lock()
+        running = [0, 0]  # current, maximum
+
+        def transform(i):
+            with lock:
+                running[0] += 1
+                running[1] = max(running[1], running[0])
+            time.sleep(0.01 * (i % 3))
+            with lock:
+                running[0] -= 1
+            return i * 2
+
+        items = PrefetchIterator(
+            range(30), prefetch=4, total=30, transform=transform, workers=4
+        )
+        self.assertEqual(list(items), [i * 2 for i in range(30)])
+        # the queue holds prefetch futures, one more may be submitted while waiting for space
+        self.assertLessEqual(running[1], 5)
+
+    def test_transform_errors_are_raised(self):
+        def transform(i):
+            if i == 2:
+                raise ValueError("broken item")
+            return i
+
+        items = PrefetchIterator(range(5), transform=transform, workers=2)
+        self.assertEqual([next(items), next(items)], [0, 1])
+        with self.assertRaisesRegex(ValueError, "broken item"):
+            next(items)
+
+
+class TestLoadItemImages(unittest.TestCase):
+    def test_resize_and_pre_encode(self):
+        buffer = io.BytesIO()
+        Image.new("RGB", (400, 200), color="red").save(buffer, format="JPEG")
+        image = Image.open(io.BytesIO(buffer.getvalue()))
+        image.filename = "dataset/input/image.jpg"
+        item = {
+            "pillow_images": [{"node_name": "Load Input Image", "pillow_image": image}]
+        }
+
+        load_item_images(item, max_resolution=100, pre_encode=True)
+
+        image_info = item["pillow_images"][0]
+        self.assertEqual(image_info["pillow_image"].size, (100, 50))
+        self.assertEqual(image_info["pillow_image"].filename, "dataset/input/image.jpg")
+        encoded = Image.open(io.BytesIO(image_info["encoded_image"]))
+        self.assertEqual((encoded.format, encoded.size), ("PNG", (100, 50)))
+
+    def test_pre_encode_keeps_the_bytes_of_unresized_files(self):
+        with tempfile.TemporaryDirectory() as temp_dir:
+            path = os.path.join(temp_dir, "image.jpg")
+            Image.new("RGB", (40, 20), color="red").save(path, quality=95)
+            with open(path, "rb") as f:
+                file_bytes = f.read()
+            item = {
+                "pillow_images": [
+                    {"node_name": "Load Input Image", "pillow_image": Image.open(path)}
+                ]
+            }
+
+            load_item_images(item, max_resolution=100, pre_encode=True)
+
+        self.assertEqual(item["pillow_images"][0]["encoded_image"], file_bytes)
+
+
+if __name__ == "__main__":
+    unittest.main()
@@ -1,9 +1,12 @@
+import io
 import unittest
-from unittest.mock import patch
+from unittest.mock import MagicMock, patch
 import shutil
 import os
 
-from pixaris.data_loaders.gcp import GCPDatasetLoader
+from PIL import Image
+
+from pixaris.data_loaders.gcp import GCPDatasetLoader, _file_crc32c
 
 
 def copy_test_project():
@@ -156,5 +159,277 @@ class TestLocalDataset(unittest.TestCase):
         tearDown()
 
 
+class FakeBucket:
+    """
+    Bucket with blobs in memory, downloads go through fake_download_blob.
+    """
+
+    def __init__(self, contents: dict[str, bytes]):
+        self.contents = contents
+        self.generations = {name: 1 for name in contents}
+
+    def upload(self, name: str, data: bytes):
+        self.contents[name] = data
+        self.generations[name] = self.generations.get(name, 0) + 1
+
+    def list_blobs(self, prefix, max_results=None):
+        blobs = []
+        for name, data in self.contents.items():
+            if name.startswith(prefix):
+                blob = MagicMock()
+                blob.name = name
+                blob.generation = self.generations[name]
+                blob.size = len(data)
+                blob.md5_hash = str(hash(data))
+                blob.crc32c = str(len(data))
+                blobs.append(blob)
+        return blobs[:max_results]
+
+
+class TestGCPDatasetSync(unittest.TestCase):
+    prefix = "experiment_inputs/test_project/synced/"
+
+    def setUp(self):
+        self.bucket = FakeBucket(
+            {
+                self.prefix + "input/cat.png": b"cat",
+                self.prefix + "input/dog.png": b"dog",
+                self.prefix + "mask/cat.png": b"cat mask",
+                self.prefix + "mask/dog.png": b"dog mask",
+            }
+        )
+        self.downloads = []
+        self.loader = GCPDatasetLoader(
+            gcp_project_id="test_project_id",
+            gcp_pixaris_bucket_name="test_bucket_name",
+            project="test_project",
+            dataset="synced",
+            eval_dir_local="temp_test_files",
+            sync=True,
+        )
+        self.loader.bucket = self.bucket
+        self.local_dir = os.path.join("temp_test_files", "test_project", "synced")
+
+    def tearDown(self):
+        tearDown()
+
+    def fake_download_blob(self, bucket, blob_name, size, path):
+        if blob_name not in bucket.contents:
+            raise ValueError("404 No such object")
+        os.makedirs(os.path.dirname(path), exist_ok=True)
+        with open(path, "wb") as f:
+            f.write(bucket.contents[blob_name])
+        self.downloads.append(blob_name[len(self.prefix) :])
+
+    def sync(self):
+        self.downloads = []
+        with patch("pixaris.data_loaders.gcp._download_blob", self.fake_download_blob):
+            self.loader._sync_bucket_dir()
+
+    def test_sync_downloads_only_changes(self):
+        """
+        A second sync should only download changed blobs and delete removed ones.
+        """
+        self.sync()
+        self.assertEqual(len(self.downloads), 4)
+
+        self.sync()
+        self.assertEqual(self.downloads, [])
+
+        self.bucket.upload(self.prefix + "input/cat.png", b"new cat")
+        self.bucket.upload(self.prefix + "mask/dog.png", b"dog mask")  # same content
+        del self.bucket.contents[self.prefix + "input/dog.png"]
+        self.sync()
+        self.assertEqual(self.downloads, ["input/cat.png"])
+        with open(os.path.join(self.local_dir, "input", "cat.png"), "rb") as f:
+            self.assertEqual(f.read(), b"new cat")
+        self.assertFalse(
+            os.path.exists(os.path.join(self.local_dir, "input", "dog.png"))
+        )
+
+    def test_verify_bucket_folder_lists_one_blob(self):
+        """
+        The existence check should not list the whole folder before the download.
+        """
+        self.loader.bucket = MagicMock(wraps=self.bucket)
+        self.loader._verify_bucket_folder_exists()
+        self.loader.bucket.list_blobs.assert_called_once_with(
+            prefix=self.prefix, max_results=1
+        )
+        self.bucket.contents.clear()
+        with self.assertRaisesRegex(ValueError, "No images found"):
+            self.loader._verify_bucket_folder_exists()
+
+    def test_sync_repairs_local_changes(self):
+        """
+        Missing or modified local files should be downloaded again.
+        """
+        self.sync()
+        os.remove(os.path.join(self.local_dir, "mask", "cat.png"))
+        with open(os.path.join(self.local_dir, "input", "dog.png"), "wb") as f:
+            f.write(b"truncated")
+        self.sync()
+        self.assertEqual(sorted(self.downloads), ["input/dog.png", "mask/cat.png"])
+
+    def test_download_streams_listing_and_reports_failures(self):
+        """
+        Every listed blob should be downloaded, failures should not stop the others.
+        """
+        listed = self.bucket.list_blobs(self.prefix)
+        missing = MagicMock()
+        missing.name, missing.size = self.prefix + "input/gone.png", 3
+        self.bucket.list_blobs = lambda prefix: iter(listed + [missing])
+        self.loader.download_workers = 1
+
+        with (
+            patch("pixaris.data_loaders.gcp._download_blob", self.fake_download_blob),
+            patch("builtins.print") as mock_print,
+        ):
+            self.loader._download_bucket_dir()
+        failures = [
+            call.args[0]
+            for call in mock_print.call_args_list
+            if "Failed" in call.args[0]
+        ]
+        self.assertEqual(len(failures), 1)
+        self.assertIn("input/gone.png", failures[0])
+        self.assertIn("4 files", mock_print.call_args_list[-1].args[0])
+        self.assertEqual(len(self.downloads), 4)
+        with open(os.path.join(self.local_dir, "mask", "dog.png"), "rb") as f:
+            self.assertEqual(f.read(), b"dog mask")
+
+    def test_sync_downloads_only_the_selected_shard(self):
+        """
+        A shard view should only download its items and select them from the names in the bucket.
+        """
+        self.loader = self.loader.shard(1, 2)
+        self.sync()
+        self.assertEqual(sorted(self.downloads), ["input/dog.png", "mask/dog.png"])
+        self.assertEqual(self.loader.remote_image_names, ["cat.png", "dog.png"])
+        self.assertEqual(self.loader._selected_image_names(), ["dog.png"])
+
+
+class TestGCPDatasetViews(unittest.TestCase):
+    prefix = "experiment_inputs/test_project/views/"
+
+    def setUp(self):
+        buffer = io.BytesIO()
+        Image.new("RGB", (4, 4), "red").save(buffer, format="PNG")
+        self.bucket = FakeBucket(
+            {
+                f"{self.prefix}{image_dir}/img{i:02d}.png": buffer.getvalue()
+                for image_dir in ["input", "mask"]
+                for i in range(8)
+            }
+        )
+        self.loader = GCPDatasetLoader(
+            gcp_project_id="test_project_id",
+            gcp_pixaris_bucket_name="test_bucket_name",
+            project="test_project",
+            dataset="views",
+            eval_dir_local="temp_test_files",
+            force_download=False,
+        )
+
+    def tearDown(self):
+        tearDown()
+
+    def load_image_names(self, loader):
+        def download_blob(bucket, blob_name, size, path):
+            os.makedirs(os.path.dirname(path), exist_ok=True)
+            with open(path, "wb") as f:
+                f.write(bucket.contents[blob_name])
+
+        with (
+            patch("pixaris.data_loaders.gcp.storage.Client") as client,
+            patch("pixaris.data_loaders.gcp._download_blob", download_blob),
+        ):
+            client.return_value.get_bucket.return_value = self.bucket
+            return [
+                os.path.basename(item["pillow_images"][0]["pillow_image"].filename)
+                for item in loader.load_dataset()
+            ]
+
+    def test_views_and_the_whole_dataset_share_the_local_copy(self):
+        """
+        Views loaded one after another should select from the bucket, not from what earlier views downloaded, and
+        the whole dataset should be completed afterwards.
+        """
+        self.assertEqual(
+            self.load_image_names(self.loader.shard(0, 4)), ["img00.png", "img04.png"]
+        )
+        self.assertEqual(
+            self.load_image_names(self.loader.shard(1, 4)), ["img01.png", "img05.png"]
+        )
+        self.assertEqual(
+            self.load_image_names(self.loader),
+            [f"img{i:02d}.png" for i in range(8)],
+        )
+        self.assertEqual(
+            self.load_image_names(self.loader.take(3)),
+            ["img00.png", "img01.png", "img02.png"],
+        )
+
+
+class TestGCPDatasetUpload(unittest.TestCase):
+    def setUp(self):
+        copy_test_project()
+        self.loader = GCPDatasetLoader(
+            gcp_project_id="test_project_id",
+            gcp_pixaris_bucket_name="test_bucket_name",
+            project="test_project",
+            dataset="mock",
+            eval_dir_local="temp_test_files",
+        )
+        self.local_dir = os.path.join("temp_test_files", "test_project", "mock")
+
+    def tearDown(self):
+        tearDown()
+
+    @patch("pixaris.data_loaders.gcp.transfer_manager.upload_chunks_concurrently")
+    @patch("pixaris.data_loaders.gcp.transfer_manager.upload_many_from_filenames")
+    @patch("pixaris.data_loaders.gcp.storage.Client")
+    def test_upload_skips_unchanged_files(self, client, upload_many, upload_chunks):
+        """
+        Only files whose crc32c differs from the bucket should be uploaded, large files in chunks.
+        """
+        prefix = "experiment_inputs/test_project/mock/"
+        unchanged = MagicMock()
+        unchanged.name = prefix + "input/cat.png"
+        unchanged.crc32c = _file_crc32c(
+            os.path.join(self.local_dir, "input", "cat.png")
+        )
+        outdated = MagicMock()
+        outdated.name = prefix + "mask/cat.png"
+        outdated.crc32c = "AAAAAA=="
+        bucket = client.return_value.get_bucket.return_value
+        bucket.list_blobs.return_value = [unchanged, outdated]
+        upload_many.side_effect = lambda bucket, names, **kwargs: [None] * len(names)
+
+        # the inputs are larger than the threshold, the masks smaller
+        with patch("pixaris.data_loaders.gcp.CHUNKED_TRANSFER_THRESHOLD", 100_000):
+            failed = self.loader._upload_dir_to_bucket(prefix)
+
+        self.assertEqual(failed, [])
+        self.assertEqual(
+            sorted(upload_many.call_args.args[1]),
+            [
+                "mask/cat.png",
+                "mask/chinchilla.png",
+                "mask/doggo.png",
+                "mask/sillygoose.png",
+            ],
+        )
+        self.assertEqual(
+            [call.args[0] for call in bucket.blob.call_args_list],
+            [
+                prefix + "input/chinchilla.png",
+                prefix + "input/doggo.png",
+                prefix + "input/sillygoose.png",
+            ],
+        )
+        self.assertEqual(upload_chunks.call_count, 3)
+
+
 if __name__ == "__main__":
     unittest.main()
@@ -1,5 +1,13 @@
+import os
+import shutil
+import tempfile
 import unittest
+from unittest.mock import patch
 
+from PIL import Image
+
+from pixaris.data_loaders.index import check_image_names
+from pixaris.data_loaders.utils import file_sha256
 from pixaris.data_loaders.local import LocalDatasetLoader
 
 
@@ -18,6 +26,29 @@ class TestLocalDataset(unittest.TestCase):
                 self.assertIn("node_name", path)
                 self.assertIn("pillow_image", path)
 
+    def test_iter_dataset(self):
+        """
+        The streamed items should match load_dataset and be decoded, without open files.
+        """
+        loader = LocalDatasetLoader(
+            project="test_project", dataset="mock", eval_dir_local="test"
+        )
+        items = loader.iter_dataset(prefetch=1)
+        self.assertEqual(len(items), 4)
+        streamed = list(items)
+        loaded = loader.load_dataset()
+        self.assertEqual(len(streamed), 4)
+        for streamed_item, loaded_item in zip(streamed, loaded):
+            for streamed_image, loaded_image in zip(
+                streamed_item["pillow_images"], loaded_item["pillow_images"]
+            ):
+                self.assertEqual(streamed_image["node_name"], loaded_image["node_name"])
+                self.assertEqual(
+                    streamed_image["pillow_image"].filename,
+                    loaded_image["pillow_image"].filename,
+                )
+                self.assertIsNone(streamed_image["pillow_image"].fp)
+
     def test_retrieve_and_check_dataset_image_names(self):
         loader = LocalDatasetLoader(
             project="test_project", dataset="mock", eval_dir_local="test"
@@ -40,6 +71,102 @@ class TestLocalDataset(unittest.TestCase):
         ):
             loader._retrieve_and_check_dataset_image_names()
 
+    def test_image_names_are_compared_independent_of_order(self):
+        self.assertEqual(
+            check_image_names(
+                {"input": ["b.png", "a.png"], "mask": ["a.png", "b.png"]}
+            ),
+            ["a.png", "b.png"],
+        )
+
+    def test_dataset_index_is_reused_until_a_directory_changes(self):
+        """
+        The index should be built once, reused while the dataset is unchanged and rebuilt when an image is added.
+        """
+        with tempfile.TemporaryDirectory() as tmp:
+            shutil.copytree("test/test_project/mock", os.path.join(tmp, "p", "mock"))
+            loader = LocalDatasetLoader(
+                project="p", dataset="mock", eval_dir_local=tmp, use_index=True
+            )
+            image_names = loader._retrieve_and_check_dataset_image_names()
+            self.assertEqual(
+                image_names,
+                ["cat.png", "chinchilla.png", "doggo.png", "sillygoose.png"],
+            )
+            self.assertTrue(os.path.isfile(os.path.join(tmp, "p", ".mock.index.json")))
+            self.assertEqual(
+                len(loader.dataset_index["items"][0]["images"]["input"]["sha256"]), 64
+            )
+
+            with patch("pixaris.data_loaders.base.build_dataset_index") as build:
+                self.assertEqual(
+                    loader._retrieve_and_check_dataset_image_names(), image_names
+                )
+                build.assert_not_called()
+
+            for image_dir in ["input", "mask"]:
+                shutil.copy(
+                    os.path.join(tmp, "p", "mock", image_dir, "cat.png"),
+                    os.path.join(tmp, "p", "mock", image_dir, "zebra.png"),
+                )
+            self.assertEqual(
+                loader._retrieve_and_check_dataset_image_names(),
+                image_names + ["zebra.png"],
+            )
+
+            # overwriting in place does not change the directory
+            cat_path = os.path.join(tmp, "p", "mock", "input", "cat.png")
+            cat_hash = loader.dataset_index["items"][0]["images"]["input"]["sha256"]
+            with open(cat_path, "ab") as f:
+                f.write(b"changed")
+            with patch("pixaris.data_loaders.base.build_dataset_index") as build:
+                loader._retrieve_and_check_dataset_image_names()
+                build.assert_not_called()
+            self.assertEqual(
+                loader.dataset_index["items"][0]["images"]["input"]["sha256"],
+                file_sha256(cat_path),
+            )
+            self.assertNotEqual(file_sha256(cat_path), cat_hash)
+
+            os.remove(os.path.join(tmp, "p", "mock", "mask", "zebra.png"))
+            with self.assertRaisesRegex(ValueError, "should be the same"):
+                loader._retrieve_and_check_dataset_image_names()
+
+    def test_views_select_items_before_loading(self):
+        loader = LocalDatasetLoader(
+            project="test_project", dataset="mock", eval_dir_local="test"
+        )
+        names = ["cat.png", "chinchilla.png", "doggo.png", "sillygoose.png"]
+        self.assertEqual(loader.take(2)._select_image_names(names), names[:2])
+        self.assertEqual(
+            loader.shard(0, 2)._select_image_names(names)
+            + loader.shard(1, 2)._select_image_names(names),
+            ["cat.png", "doggo.png", "chinchilla.png", "sillygoose.png"],
+        )
+        # samples are stable and nested
+        many = [f"{i}.png" for i in range(1000)]
+        small = loader.sample(0.1, seed=3)._select_image_names(many)
+        self.assertEqual(small, loader.sample(0.1, seed=3)._select_image_names(many))
+        self.assertLess(abs(len(small) - 100), 40)
+        self.assertTrue(
+            set(small) <= set(loader.sample(0.5, seed=3)._select_image_names(many))
+        )
+        self.assertNotEqual(small, loader.sample(0.1, seed=4)._select_image_names(many))
+
+        with patch(
+            "pixaris.data_loaders.local.Image.open", side_effect=Image.open
+        ) as image_open:
+            dataset = loader.shard(1, 2).take(1).load_dataset()
+        self.assertEqual(len(dataset), 1)
+        self.assertEqual(image_open.call_count, 2)  # input and mask
+        self.assertEqual(
+            os.path.basename(dataset[0]["pillow_images"][0]["pillow_image"].filename),
+            "chinchilla.png",
+        )
+        self.assertEqual(len(loader.take(3).iter_dataset()), 3)
+        # the original loader is unchanged
+        self.assertEqual(len(loader.load_dataset()), 4)
+
 
 if __name__ == "__main__":
     unittest.main()
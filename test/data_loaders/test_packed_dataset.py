@@ -0,0 +1,84 @@
+import os
+import shutil
+import unittest
+from unittest.mock import patch
+
+from pixaris.data_loaders.gcp import GCPDatasetLoader
+from pixaris.data_loaders.local import LocalDatasetLoader
+from pixaris.data_loaders.packed import pack_dataset
+
+TEMP_DIR = os.path.join(os.getcwd(), "temp_test_files")
+
+
+class TestPackedDataset(unittest.TestCase):
+    def setUp(self):
+        self.index = pack_dataset(
+            "test/test_project/mock",
+            os.path.join(TEMP_DIR, "test_project", "packed"),
+            shard_size=1,
+        )
+
+    def tearDown(self):
+        shutil.rmtree(TEMP_DIR)
+
+    def assert_same_items(self, packed_dataset, dataset):
+        packed_by_name = {
+            os.path.basename(item["pillow_images"][0]["pillow_image"].filename): item
+            for item in packed_dataset
+        }
+        self.assertEqual(len(packed_by_name), len(dataset))
+        for item in dataset:
+            name = os.path.basename(item["pillow_images"][0]["pillow_image"].filename)
+            packed_images = {
+                image["node_name"]: image["pillow_image"]
+                for image in packed_by_name[name]["pillow_images"]
+            }
+            for image in item["pillow_images"]:
+                self.assertEqual(
+                    packed_images[image["node_name"]].tobytes(),
+                    image["pillow_image"].tobytes(),
+                )
+
+    def test_pack_dataset(self):
+        self.assertEqual(self.index["image_dirs"], ["input", "mask"])
+        self.assertEqual(len(self.index["items"]), 4)
+        # every item starts a new shard because of the tiny shard size
+        self.assertEqual(len(self.index["shards"]), 4)
+
+    def test_pack_rejects_faulty_names(self):
+        with self.assertRaisesRegex(ValueError, "should be the same"):
+            pack_dataset(
+                "test/test_project/faulty_names",
+                os.path.join(TEMP_DIR, "test_project", "faulty_packed"),
+            )
+
+    def test_local_loader_reads_packed_dataset(self):
+        unpacked = LocalDatasetLoader(
+            project="test_project", dataset="mock", eval_dir_local="test"
+        ).load_dataset()
+        loader = LocalDatasetLoader(
+            project="test_project", dataset="packed", eval_dir_local=TEMP_DIR
+        )
+        self.assert_same_items(loader.load_dataset(), unpacked)
+        self.assert_same_items(list(loader.iter_dataset()), unpacked)
+
+    @patch("pixaris.data_loaders.gcp.GCPDatasetLoader._sync_bucket_dir")
+    @patch("pixaris.data_loaders.gcp.storage.Client")
+    def test_gcp_loader_reads_packed_dataset(self, mock_client, mock_sync):
+        unpacked = LocalDatasetLoader(
+            project="test_project", dataset="mock", eval_dir_local="test"
+        ).load_dataset()
+        loader = GCPDatasetLoader(
+            gcp_project_id="test_project_id",
+            gcp_pixaris_bucket_name="test_bucket_name",
+            project="test_project",
+            dataset="packed",
+            eval_dir_local=TEMP_DIR,
+            sync=True,
+        )
+        self.assert_same_items(loader.load_dataset(), unpacked)
+        mock_sync.assert_called_once()
+
+
+if __name__ == "__main__":
+    unittest.main()
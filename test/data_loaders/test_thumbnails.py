@@ -0,0 +1,86 @@
+import io
+import os
+import shutil
+import tempfile
+import unittest
+from unittest.mock import patch
+
+from PIL import Image
+
+from pixaris.data_loaders.local import LocalDatasetLoader
+from pixaris.data_loaders.thumbnails import ThumbnailCache
+
+
+class TestThumbnailCache(unittest.TestCase):
+    def setUp(self):
+        self.tmp = tempfile.mkdtemp()
+        self.cache = ThumbnailCache(os.path.join(self.tmp, "cache"), sizes=(256, 512))
+        self.path = os.path.join(self.tmp, "large.jpg")
+        Image.new("RGB", (2000, 1000), color="blue").save(self.path)
+
+    def tearDown(self):
+        shutil.rmtree(self.tmp)
+
+    def test_smallest_sufficient_variant_is_built_once(self):
+        image = self.cache.open(self.path, 300)
+        self.assertEqual((image.size, image.format), ((512, 256), "JPEG"))
+        self.assertEqual(image.filename, self.path)
+        self.assertEqual(len(os.listdir(os.path.join(self.tmp, "cache", "512"))), 1)
+
+        with patch.object(Image.Image, "thumbnail") as thumbnail:
+            self.assertEqual(self.cache.open(self.path, 400).size, (512, 256))
+            thumbnail.assert_not_called()
+
+    def test_jpeg_variants_are_saved_at_high_quality(self):
+        variant = self.cache.open(self.path, 300)
+        reference = io.BytesIO()
+        Image.new("RGB", (8, 8)).save(reference, format="JPEG", quality=95)
+        self.assertEqual(variant.quantization, Image.open(reference).quantization)
+
+    def test_source_is_returned_without_sufficient_variant(self):
+        self.assertEqual(self.cache.open(self.path, 4000).size, (2000, 1000))
+        self.assertEqual(self.cache.open(self.path, 1024).size, (2000, 1000))
+        self.assertFalse(os.path.exists(os.path.join(self.tmp, "cache")))
+
+    def test_loader_reads_variants_keyed_by_index_hash(self):
+        shutil.copytree("test/test_project/mock", os.path.join(self.tmp, "p", "mock"))
+        loader = LocalDatasetLoader(
+            project="p",
+            dataset="mock",
+            eval_dir_local=self.tmp,
+            use_index=True,
+            thumbnail_sizes=(256,),
+        )
+        items = list(loader.iter_dataset(max_resolution=200))
+        self.assertEqual(len(items), 4)
+        for item in items:
+            for image_info in item["pillow_images"]:
+                self.assertEqual(image_info["pillow_image"].size, (200, 200))
+        hashes = {
+            image["sha256"]
+            for item in loader.dataset_index["items"]
+            for image in item["images"].values()
+        }
+        variants = os.listdir(os.path.join(self.tmp, "p", ".mock.thumbnails", "256"))
+        self.assertEqual({os.path.splitext(name)[0] for name in variants}, hashes)
+
+    def test_variants_are_rebuilt_when_an_image_is_overwritten(self):
+        os.makedirs(os.path.join(self.tmp, "p", "d", "input"))
+        path = os.path.join(self.tmp, "p", "d", "input", "a.png")
+        loader = LocalDatasetLoader(
+            project="p",
+            dataset="d",
+            eval_dir_local=self.tmp,
+            use_index=True,
+            thumbnail_sizes=(256,),
+        )
+
+        for color in [(255, 0, 0), (0, 0, 255)]:
+            Image.new("RGB", (600, 400), color=color).save(path)
+            (item,) = loader.iter_dataset(max_resolution=256)
+            pillow_image = item["pillow_images"][0]["pillow_image"]
+            self.assertEqual(pillow_image.getpixel((0, 0)), color)
+
+
+if __name__ == "__main__":
+    unittest.main()
@@ -0,0 +1,175 @@
+import io
+import os
+import shutil
+import subprocess
+import sys
+import tempfile
+import threading
+import unittest
+from unittest.mock import MagicMock
+
+import pandas as pd
+from PIL import Image
+
+from pixaris.experiment_handlers.background import BackgroundExperimentHandler
+from pixaris.experiment_handlers.base import ExperimentHandler, _unreserved_name
+from pixaris.generation.utils import open_encoded_image
+from pixaris.utils.encoding import get_encoded_bytes
+
+
+def exited_pid():
+    """The pid of a process that is not running anymore."""
+    process = subprocess.Popen([sys.executable, "-c", "pass"])
+    process.wait()
+    return process.pid
+
+
+def wrapped_handler():
+    handler = MagicMock(spec=ExperimentHandler)
+    handler._resolve_experiment_run_name.side_effect = (
+        lambda project, dataset, name, reserved_names: _unreserved_name(
+            f"resolved-{name}", reserved_names
+        )
+    )
+    return handler
+
+
+class TestBackgroundExperimentHandler(unittest.TestCase):
+    def setUp(self):
+        self.spool_dir = tempfile.mkdtemp()
+        buffer = io.BytesIO()
+        Image.new("RGB", (8, 8), "blue").save(buffer, format="PNG")
+        self.encoded = buffer.getvalue()
+        self.run = {
+            "project": "project",
+            "dataset": "dataset",
+            "experiment_run_name": "run",
+            "image_name_pairs": [
+                (Image.new("RGB", (8, 8), "red"), "a.png"),
+                (open_encoded_image(self.encoded), "b.png"),
+            ],
+            "metric_values": {"metric": 1.0},
+            "args": {"seed": 1},
+        }
+
+    def tearDown(self):
+        shutil.rmtree(self.spool_dir)
+
+    def test_store_results_returns_before_the_wrapped_handler_is_done(self):
+        release = threading.Event()
+        wrapped = wrapped_handler()
+        wrapped._store_resolved_results.side_effect = lambda **kwargs: release.wait(5)
+        handler = BackgroundExperimentHandler(wrapped, spool_dir=self.spool_dir)
+
+        handler.store_results(**self.run)
+        self.assertFalse(handler.wait(timeout=0.1))
+        self.assertEqual(len(os.listdir(self.spool_dir)), 1)
+
+        release.set()
+        handler.flush()
+        self.assertEqual(os.listdir(self.spool_dir), [])
+        kwargs = wrapped._store_resolved_results.call_args.kwargs
+        self.assertEqual(kwargs["experiment_run_name"], "resolved-run")
+        self.assertEqual(kwargs["metric_values"], {"metric": 1.0})
+        (decoded, a_name), (passed, b_name) = kwargs["image_name_pairs"]
+        self.assertEqual((a_name, b_name), ("a.png", "b.png"))
+        self.assertEqual(decoded.getpixel((0, 0)), (255, 0, 0))
+        self.assertIsNone(get_encoded_bytes(decoded, "PNG"))
+        self.assertEqual(get_encoded_bytes(passed, "PNG"), self.encoded)
+
+    def test_failed_runs_are_replayed_once_under_the_same_name(self):
+        failing = wrapped_handler()
+        failing._store_resolved_results.side_effect = ConnectionError("offline")
+        handler = BackgroundExperimentHandler(failing, spool_dir=self.spool_dir)
+        handler.store_results(**self.run)
+        with self.assertRaisesRegex(RuntimeError, "offline"):
+            handler.flush()
+
+        # the entry and a partial write of a process that stopped
+        pid = exited_pid()
+        (file_name,) = os.listdir(self.spool_dir)
+        entry_id = file_name.split(".")[0]
+        os.rename(
+            os.path.join(self.spool_dir, file_name),
+            os.path.join(self.spool_dir, f"{entry_id}.{pid}.pkl"),
+        )
+        with open(os.path.join(self.spool_dir, f"partial.{pid}.pkl.tmp"), "wb") as f:
+            f.write(b"partial")
+
+        wrapped = wrapped_handler()
+        replaying = BackgroundExperimentHandler(wrapped, spool_dir=self.spool_dir)
+        other = wrapped_handler()
+        BackgroundExperimentHandler(other, spool_dir=self.spool_dir).flush()
+        replaying.flush()
+
+        wrapped._store_resolved_results.assert_called_once()
+        other._store_resolved_results.assert_not_called()
+        wrapped._resolve_experiment_run_name.assert_not_called()
+        self.assertEqual(
+            wrapped._store_resolved_results.call_args.kwargs["experiment_run_name"],
+            "resolved-run",
+        )
+        self.assertEqual(os.listdir(self.spool_dir), [])
+
+    def test_waiting_runs_reserve_their_names(self):
+        release = threading.Event()
+        wrapped = wrapped_handler()
+        wrapped._store_resolved_results.side_effect = lambda **kwargs: release.wait(5)
+        handler = BackgroundExperimentHandler(wrapped, spool_dir=self.spool_dir)
+
+        handler.store_results(**self.run)
+        handler.store_results(**self.run)
+        handler.store_results(**{**self.run, "dataset": "other"})
+        release.set()
+        handler.flush()
+        handler.store_results(**self.run)
+        handler.flush()
+
+        self.assertEqual(
+            [
+                (call.kwargs["dataset"], call.kwargs["experiment_run_name"])
+                for call in wrapped._store_resolved_results.call_args_list
+            ],
+            [
+                ("dataset", "resolved-run"),
+                ("dataset", "resolved-run-2"),
+                ("other", "resolved-run"),
+                ("dataset", "resolved-run"),
+            ],
+        )
+
+    def test_entries_of_running_processes_are_not_replayed(self):
+        wrapped = wrapped_handler()
+        blocked = threading.Event()
+        wrapped._store_resolved_results.side_effect = lambda **kwargs: blocked.wait(5)
+        handler = BackgroundExperimentHandler(wrapped, spool_dir=self.spool_dir)
+        handler.store_results(**self.run)
+
+        other = wrapped_handler()
+        BackgroundExperimentHandler(other, spool_dir=self.spool_dir).flush()
+        other._store_resolved_results.assert_not_called()
+        blocked.set()
+        handler.flush()
+
+    def test_handlers_without_selection_arguments_are_filtered_afterwards(self):
+        class OldHandler:
+            def load_experiment_results_for_dataset(self, project, dataset):
+                return pd.DataFrame(
+                    {"experiment_run_name": ["a", "b"], "metric": [0.1, 0.2]}
+                )
+
+        handler = BackgroundExperimentHandler(
+            OldHandler(), spool_dir=self.spool_dir, replay=False
+        )
+
+        results = handler.load_experiment_results_for_dataset(
+            "project",
+            "dataset",
+            columns=["metric"],
+            filters={"experiment_run_name": "b"},
+        )
+        self.assertEqual(results.to_dict(orient="records"), [{"metric": 0.2}])
+
+
+if __name__ == "__main__":
+    unittest.main()
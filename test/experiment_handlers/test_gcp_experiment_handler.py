@@ -0,0 +1,208 @@
+import os
+import tempfile
+import unittest
+from unittest.mock import MagicMock, patch
+
+from PIL import Image
+
+from pixaris.experiment_handlers.gcp import GCPExperimentHandler
+
+
+class TestGCPExperimentHandlerUpload(unittest.TestCase):
+    def setUp(self):
+        self.handler = GCPExperimentHandler(
+            gcp_project_id="project-id",
+            gcp_bq_experiment_dataset="bq_dataset",
+            gcp_pixaris_bucket_name="bucket",
+            upload_workers=4,
+        )
+        self.handler.pixaris_bucket = MagicMock()
+        self.handler.project = "project"
+        self.handler.dataset = "dataset"
+        self.handler.experiment_run_name = "run"
+        self.image_name_pairs = [
+            (Image.new("RGB", (32, 32), color=(i, 0, 0)), f"image_{i}.jpg")
+            for i in range(6)
+        ]
+
+    def test_images_are_uploaded_from_memory(self):
+        cwd = os.getcwd()
+        with tempfile.TemporaryDirectory() as tmp:
+            os.chdir(tmp)
+            try:
+                self.handler._store_generated_images(self.image_name_pairs)
+                self.assertEqual(os.listdir(tmp), [])
+            finally:
+                os.chdir(cwd)
+
+        blob_names = sorted(
+            call.args[0] for call in self.handler.pixaris_bucket.blob.call_args_list
+        )
+        self.assertEqual(
+            blob_names,
+            [
+                f"results/project/dataset/run/generated_images/image_{i}.png"
+                for i in range(6)
+            ],
+        )
+        (data,) = (
+            self.handler.pixaris_bucket.blob.return_value.upload_from_string.call_args_list[
+                0
+            ].args
+        )
+        self.assertTrue(data.startswith(b"\x89PNG"))
+
+    @patch("pixaris.utils.retry.time.sleep")
+    def test_failed_uploads_are_retried_and_reported(self, _sleep):
+        blobs = {}
+
+        def blob(name):
+            if name not in blobs:
+                blobs[name] = MagicMock()
+                if name.endswith("image_1.png"):
+                    blobs[name].upload_from_string.side_effect = ConnectionError()
+                elif name.endswith("image_2.png"):
+                    blobs[name].upload_from_string.side_effect = [
+                        ConnectionError(),
+                        None,
+                    ]
+            return blobs[name]
+
+        self.handler.pixaris_bucket.blob.side_effect = blob
+
+        with self.assertRaisesRegex(RuntimeError, "image_1.png"):
+            self.handler._store_generated_images(self.image_name_pairs)
+        prefix = "results/project/dataset/run/generated_images"
+        self.assertEqual(
+            blobs[f"{prefix}/image_1.png"].upload_from_string.call_count, 3
+        )
+        self.assertEqual(
+            blobs[f"{prefix}/image_2.png"].upload_from_string.call_count, 2
+        )
+        self.assertEqual(
+            blobs[f"{prefix}/image_5.png"].upload_from_string.call_count, 1
+        )
+
+    def test_failures_of_images_with_the_same_name_are_reported(self):
+        first_image = self.image_name_pairs[0][0]
+        encode = self.handler._encode_generated_image
+
+        def encode_all_but_first(pillow_image):
+            if pillow_image is first_image:
+                raise ValueError("cannot encode")
+            return encode(pillow_image)
+
+        self.handler._encode_generated_image = encode_all_but_first
+
+        with self.assertRaisesRegex(RuntimeError, "same.png"):
+            self.handler._store_generated_images(
+                [(image, "same.jpg") for image, _ in self.image_name_pairs]
+            )
+        upload = self.handler.pixaris_bucket.blob.return_value.upload_from_string
+        self.assertEqual(upload.call_count, 5)
+
+    @patch("pixaris.experiment_handlers.gcp.ensure_table_exists")
+    @patch("pixaris.experiment_handlers.gcp.bigquery.Client")
+    @patch("pixaris.experiment_handlers.gcp.storage.Client")
+    def test_resolved_run_is_stored_under_its_name_with_the_row_last(
+        self, storage_client, bigquery_client, _ensure_table_exists
+    ):
+        calls = []
+        bucket = storage_client.return_value.bucket.return_value
+        bucket.blob.return_value.upload_from_string.side_effect = (
+            lambda *args, **kwargs: calls.append("upload")
+        )
+        bigquery_client.return_value.insert_rows_json.side_effect = (
+            lambda *args, **kwargs: calls.append("row") or []
+        )
+
+        self.handler._store_resolved_results(
+            "project", "dataset", "241019-run", self.image_name_pairs, {}, {}
+        )
+
+        bucket.list_blobs.assert_not_called()
+        self.assertEqual(calls, ["upload"] * 6 + ["row"])
+        table_ref, rows = bigquery_client.return_value.insert_rows_json.call_args.args
+        self.assertEqual(rows[0]["experiment_run_name"], "241019-run")
+        self.assertEqual(
+            bigquery_client.return_value.insert_rows_json.call_args.kwargs,
+            {"row_ids": ["241019-run"]},
+        )
+
+
+class FakeListing:
+    """The iterator list_blobs returns, prefixes are only known after the pages were fetched."""
+
+    def __init__(self, prefixes):
+        self._prefixes = prefixes
+        self.prefixes = set()
+
+    @property
+    def pages(self):
+        self.prefixes = set(self._prefixes)
+        yield []
+
+
+class TestGCPExperimentHandlerListing(unittest.TestCase):
+    def setUp(self):
+        self.handler = GCPExperimentHandler(
+            gcp_project_id="project-id",
+            gcp_bq_experiment_dataset="bq_dataset",
+            gcp_pixaris_bucket_name="bucket",
+        )
+        self.bucket = MagicMock()
+
+    @patch("pixaris.experiment_handlers.gcp.storage.Client")
+    def test_projects_and_datasets_are_listed_by_prefix(self, client):
+        client.return_value.bucket.return_value = self.bucket
+        listings = {
+            "results/": [
+                "results/p1/",
+                "results/p2/",
+                "results/p3/",
+                "results/pickled_results/",
+            ],
+            "results/p1/": ["results/p1/d2/", "results/p1/d1/"],
+            "results/p2/": ["results/p2/d3/", "results/p2/feedback_iterations/"],
+            "results/p3/": ["results/p3/feedback_iterations/"],
+        }
+        self.bucket.list_blobs.side_effect = lambda prefix, delimiter: FakeListing(
+            listings[prefix]
+        )
+
+        self.assertEqual(
+            self.handler.load_projects_and_datasets(),
+            {"p1": ["d1", "d2"], "p2": ["d3"]},
+        )
+        for call in self.bucket.list_blobs.call_args_list:
+            self.assertEqual(call.kwargs["delimiter"], "/")
+
+    def test_unique_run_name_checks_only_the_run_directory(self):
+        self.handler.pixaris_bucket = self.bucket
+
+        self.bucket.list_blobs.return_value = iter([])
+        name = self.handler._resolve_experiment_run_name("p", "d", "run")
+        self.assertTrue(name.endswith("-run"))
+        self.bucket.list_blobs.assert_called_once_with(
+            prefix=f"results/p/d/{name}/", max_results=1
+        )
+
+        self.bucket.list_blobs.return_value = iter([MagicMock()])
+        self.assertNotEqual(
+            self.handler._resolve_experiment_run_name("p", "d", "run"), name
+        )
+        self.assertIsNone(self.handler.experiment_run_name)
+
+        self.bucket.list_blobs.return_value = iter([])
+        with_time = self.handler._resolve_experiment_run_name("p", "d", "run", {name})
+        self.assertTrue(with_time.startswith(name) and with_time != name)
+        self.bucket.list_blobs.return_value = iter([])
+        counted = self.handler._resolve_experiment_run_name(
+            "p", "d", "run", {name, with_time}
+        )
+        self.assertTrue(counted.startswith(name))
+        self.assertNotIn(counted, {name, with_time})
+
+
+if __name__ == "__main__":
+    unittest.main()
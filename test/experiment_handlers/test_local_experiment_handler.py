@@ -0,0 +1,175 @@
+import io
+import json
+import os
+import shutil
+import tempfile
+import unittest
+
+from PIL import Image
+
+from pixaris.experiment_handlers.local import LocalExperimentHandler
+from pixaris.experiment_handlers.tracking import SQLiteTrackingStore
+from pixaris.generation.utils import open_encoded_image
+from pixaris.experiment_handlers.utils import save_images
+
+
+class TestLocalExperimentHandler(unittest.TestCase):
+    def setUp(self):
+        self.results_folder = tempfile.mkdtemp()
+
+    def tearDown(self):
+        shutil.rmtree(self.results_folder)
+
+    def test_store_results_saves_images_in_parallel(self):
+        handler = LocalExperimentHandler(
+            self.results_folder, save_workers=2, save_worker_type="process"
+        )
+        image_name_pairs = [
+            (Image.new("RGB", (64, 64), color=(i, 0, 0)), f"image_{i}.jpg")
+            for i in range(5)
+        ]
+        handler.store_results(
+            "project", "dataset", "run", image_name_pairs, {"metric": 0.5}
+        )
+
+        dataset_dir = os.path.join(self.results_folder, "project", "dataset")
+        with open(os.path.join(dataset_dir, "experiment_tracking.jsonl")) as f:
+            tracking_info = json.loads(f.readline())
+        self.assertEqual(tracking_info["metric"], 0.5)
+        image_paths = handler.load_images_for_experiment(
+            "project",
+            "dataset",
+            tracking_info["experiment_run_name"],
+            self.results_folder,
+        )
+        self.assertEqual(
+            [os.path.basename(path) for path in image_paths],
+            [f"image_{i}.png" for i in range(5)],
+        )
+        for i, path in enumerate(image_paths):
+            self.assertEqual(Image.open(path).getpixel((0, 0)), (i, 0, 0))
+
+    def test_store_results_with_encoding_profile(self):
+        handler = LocalExperimentHandler(
+            self.results_folder, encoding_profile="webp-lossless"
+        )
+        image = Image.new("RGBA", (32, 32), color=(10, 20, 30, 40))
+        handler.store_results("project", "dataset", "run", [(image, "cat.png")], {})
+
+        results = handler.load_experiment_results_for_dataset("project", "dataset")
+        self.assertEqual(results["encoding_profile"][0], "webp-lossless")
+        (path,) = handler.load_images_for_experiment(
+            "project", "dataset", results["experiment_run_name"][0], self.results_folder
+        )
+        self.assertTrue(path.endswith("cat.webp"))
+        self.assertEqual(Image.open(path).tobytes(), image.tobytes())
+
+    def test_encoded_generator_outputs_are_written_as_is(self):
+        buffer = io.BytesIO()
+        Image.new("RGB", (16, 16), color="red").save(
+            buffer, format="PNG", compress_level=0
+        )
+        handler = LocalExperimentHandler(self.results_folder, save_workers=2)
+        handler.store_results(
+            "project",
+            "dataset",
+            "run",
+            [
+                (open_encoded_image(buffer.getvalue()), "passed.png"),
+                (open_encoded_image(buffer.getvalue()).convert("L"), "encoded.png"),
+            ],
+            {},
+        )
+        run_dir = os.path.join(self.results_folder, "project", "dataset")
+        (run_name,) = [name for name in os.listdir(run_dir) if name.endswith("_run")]
+        images_dir = os.path.join(run_dir, run_name, "generated_images")
+        with open(os.path.join(images_dir, "passed.png"), "rb") as f:
+            self.assertEqual(f.read(), buffer.getvalue())
+        self.assertEqual(Image.open(os.path.join(images_dir, "encoded.png")).mode, "L")
+
+    def test_jpeg_profile_drops_alpha_and_unknown_profiles_fail(self):
+        handler = LocalExperimentHandler(
+            self.results_folder, encoding_profile="jpeg-preview"
+        )
+        handler.store_results(
+            "project", "dataset", "run", [(Image.new("RGBA", (8, 8)), "cat")], {}
+        )
+        with self.assertRaisesRegex(ValueError, "Unknown encoding profile"):
+            LocalExperimentHandler(self.results_folder, encoding_profile="gif")
+
+    def test_sqlite_tracking_loads_selected_columns_and_rows(self):
+        jsonl_handler = LocalExperimentHandler(self.results_folder)
+        jsonl_handler.store_results("project", "dataset", "old", [], {"metric": 0.1})
+        handler = LocalExperimentHandler(self.results_folder, tracking_backend="sqlite")
+        handler.store_results(
+            "project",
+            "dataset",
+            "new",
+            [],
+            {"metric": 0.9, "new_metric": 1.0},
+            {"generation_params": [{"node_name": "seed", "value": 1}]},
+        )
+
+        run_names = handler.load_experiment_results_for_dataset(
+            "project", "dataset", columns=["experiment_run_name", "missing"]
+        )
+        self.assertEqual(list(run_names.columns), ["experiment_run_name"])
+        old_run, new_run = run_names["experiment_run_name"]
+        self.assertTrue(old_run.endswith("_old") and new_run.endswith("_new"))
+
+        results = handler.load_experiment_results_for_dataset(
+            "project", "dataset", filters={"experiment_run_name": [new_run]}
+        )
+        self.assertEqual(len(results), 1)
+        self.assertEqual(results["new_metric"][0], 1.0)
+        self.assertEqual(
+            results["generation_params"][0], [{"node_name": "seed", "value": 1}]
+        )
+        self.assertEqual(
+            jsonl_handler.load_experiment_results_for_dataset(
+                "project", "dataset", ["metric"], {"metric": 0.1}
+            ).to_dict(orient="records"),
+            [{"metric": 0.1}],
+        )
+
+        store = handler.get_tracking_store("project", "dataset")
+        store.compact()
+        export_path = os.path.join(self.results_folder, "export.jsonl")
+        store.export_jsonl(export_path)
+        with open(export_path) as f:
+            rows = [json.loads(line) for line in f]
+        self.assertEqual([row["metric"] for row in rows], [0.1, 0.9])
+        self.assertNotIn("new_metric", rows[0])
+        self.assertEqual(rows[1]["generation_params"][0]["value"], 1)
+
+    def test_sqlite_tracking_keeps_strings_and_folds_case(self):
+        store = SQLiteTrackingStore(os.path.join(self.results_folder, "tracking.db"))
+        store.append([{"prompt": ["a", "b"], "Score": 1}])
+        store.append([{"prompt": '["not", "json"]', "score": 2}, {"prompt": "plain"}])
+
+        results = store.load()
+        self.assertEqual(list(results.columns), ["prompt", "Score"])
+        self.assertEqual(
+            list(results["prompt"]), [["a", "b"], '["not", "json"]', "plain"]
+        )
+        self.assertEqual(
+            list(store.load(["score"], {"SCORE": 2})["Score"]),
+            [2],
+        )
+        with self.assertRaisesRegex(ValueError, "differ only in case"):
+            store.append([{"score": 3, "SCORE": 3}])
+        self.assertEqual(len(store.load()), 3)
+
+    def test_save_images_attempts_all_and_raises_first_error(self):
+        images = [
+            (Image.new("RGB", (8, 8)), os.path.join(self.results_folder, "a.png")),
+            (Image.new("RGB", (8, 8)), os.path.join(self.results_folder, "x", "b.png")),
+            (Image.new("RGB", (8, 8)), os.path.join(self.results_folder, "c.png")),
+        ]
+        with self.assertRaises(FileNotFoundError):
+            save_images(images, {"format": "PNG"}, workers=2, worker_type="thread")
+        self.assertTrue(os.path.isfile(images[2][1]))
+
+
+if __name__ == "__main__":
+    unittest.main()
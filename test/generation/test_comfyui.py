@@ -1,7 +1,8 @@
+import io
 import os
 import re
 import unittest
-from unittest.mock import MagicMock
+from unittest.mock import MagicMock, patch
 from PIL import Image
 
 from pixaris.generation.comfyui import ComfyGenerator
@@ -299,9 +300,27 @@ class TestComfyUI(unittest.TestCase):
         ]
         self.generator._modify_workflow(pillow_images=pillow_images)
         self.generator.workflow.upload_image.assert_called_with(
-            self.mock_image1, "input"
+            self.mock_image1, "input", encoded_image=None
         )
 
+    @patch("pixaris.generation.comfyui_utils.workflow.requests.post")
+    def test_upload_image_is_named_after_its_format(self, mock_post):
+        """
+        check if encoded images are uploaded as is, with the extension of their format
+        """
+        encoded = io.BytesIO()
+        self.mock_image1.convert("RGB").save(encoded, format="JPEG")
+        self.generator.workflow.upload_image(
+            self.mock_image1, "input", encoded_image=encoded.getvalue()
+        )
+        name, uploaded = mock_post.call_args.kwargs["files"]["image"]
+        self.assertEqual(name, "input.jpeg")
+        self.assertEqual(uploaded.read(), encoded.getvalue())
+
+        self.generator.workflow.upload_image(self.mock_image1, "input")
+        name, _ = mock_post.call_args.kwargs["files"]["image"]
+        self.assertEqual(name, "input.png")
+
     def test_modify_workflow_set_generation_params(self):
         """
         check if _modify_workflow sets the generation params correctly
@@ -0,0 +1,191 @@
+import json
+import os
+import time
+import unittest
+import urllib.request
+from concurrent.futures import ThreadPoolExecutor
+from unittest.mock import patch
+
+from PIL import Image
+
+from pixaris.generation.comfyui_utils.cluster_metrics import start_metrics_server
+from pixaris.generation.comfyui_cluster import (
+    ComfyClusterGenerator,
+    ComfyClusterJob,
+    ComfyHostWorker,
+)
+
+
+class FakeComfyGenerator:
+    """
+    Stands in for ComfyGenerator. Records the host of every call and fails on hosts listed in failing_hosts.
+    """
+
+    calls = []
+    failing_hosts = set()
+
+    def __init__(self, workflow_apiformat_json, api_host="localhost:8188"):
+        self.api_host = api_host
+        self.workflow = type("Workflow", (), {})()
+        self.workflow.workflow_apiformat_json = workflow_apiformat_json
+
+    def generate_single_image(self, args):
+        time.sleep(0.01)
+        FakeComfyGenerator.calls.append(self.api_host)
+        if self.api_host in FakeComfyGenerator.failing_hosts:
+            raise ConnectionError("host down")
+        return Image.new("RGB", (10, 10)), args["name"]
+
+
+class TestComfyClusterGenerator(unittest.TestCase):
+    def setUp(self):
+        with open(
+            os.getcwd() + "/test/assets/test-background-generation.json", "r"
+        ) as file:
+            self.workflow_apiformat_json = json.load(file)
+        FakeComfyGenerator.calls = []
+        FakeComfyGenerator.failing_hosts = set()
+
+    def test_workflow_template_is_cleaned_once(self):
+        """
+        The template should not contain preview nodes and the input workflow should stay untouched.
+        """
+        number_of_nodes = len(self.workflow_apiformat_json)
+        cluster = ComfyClusterGenerator(self.workflow_apiformat_json)
+        self.assertEqual(len(self.workflow_apiformat_json), number_of_nodes)
+        self.assertFalse(
+            any(
+                node["class_type"] == "PreviewImage"
+                for node in cluster.workflow_template.values()
+            )
+        )
+
+    def test_idle_worker_steals_from_busy_worker(self):
+        """
+        A worker with an empty queue should take the newest job from the host with the longest queue.
+        """
+        cluster = ComfyClusterGenerator(self.workflow_apiformat_json)
+        busy = ComfyHostWorker(cluster, "busy:8188", pipeline_depth=2)
+        idle = ComfyHostWorker(cluster, "idle:8188", pipeline_depth=2)
+        cluster.hosts = {"busy:8188": busy, "idle:8188": idle}
+        first, second = ComfyClusterJob({}), ComfyClusterJob({})
+        busy.queue.extend([first, second])
+
+        self.assertIs(cluster._take_job(idle), second)
+        self.assertIs(cluster._take_job(busy), first)
+        self.assertIsNone(cluster._take_job(idle))
+
+    @patch("pixaris.generation.comfyui_cluster.config.load_incluster_config")
+    @patch("pixaris.generation.comfyui_cluster.ComfyGenerator", FakeComfyGenerator)
+    def test_generate_images_on_all_hosts(self, mock_load_config):
+        """
+        All jobs should finish and be spread over both hosts.
+        """
+        cluster = ComfyClusterGenerator(self.workflow_apiformat_json)
+        with patch.object(
+            ComfyClusterGenerator,
+            "_fetch_available_hosts",
+            return_value=["a:8188", "b:8188"],
+        ):
+            with ThreadPoolExecutor(max_workers=8) as pool:
+                results = list(
+                    pool.map(
+                        lambda i: cluster.generate_single_image({"name": f"{i}.png"}),
+                        range(16),
+                    )
+                )
+            cluster.close()
+
+        self.assertEqual([name for _, name in results], [f"{i}.png" for i in range(16)])
+        self.assertEqual(set(FakeComfyGenerator.calls), {"a:8188", "b:8188"})
+
+        metrics = cluster.get_metrics()
+        self.assertEqual(metrics["total_hosts"], 2)
+        self.assertEqual(metrics["acquisition_wait"]["count"], 16)
+        self.assertEqual(
+            sum(host["jobs_finished"] for host in metrics["hosts"].values()), 16
+        )
+
+    @patch("pixaris.generation.comfyui_cluster.config.load_incluster_config")
+    @patch("pixaris.generation.comfyui_cluster.ComfyGenerator", FakeComfyGenerator)
+    def test_failed_job_is_retried_on_other_host(self, mock_load_config):
+        """
+        A job that fails on one host should be marked and finished by another host.
+        """
+        FakeComfyGenerator.failing_hosts = {"a:8188"}
+        cluster = ComfyClusterGenerator(self.workflow_apiformat_json)
+        cluster.hosts = {
+            "a:8188": ComfyHostWorker(cluster, "a:8188", pipeline_depth=1),
+        }
+        job = ComfyClusterJob({"name": "cat.png"})
+        cluster.hosts["a:8188"].queue.append(job)
+        cluster.hosts["b:8188"] = ComfyHostWorker(cluster, "b:8188", pipeline_depth=1)
+        cluster.hosts["b:8188"].unresponsive = True
+
+        cluster.run_background_task = True
+        for worker in cluster.hosts.values():
+            worker.start()
+        # wait until host a failed, then bring host b back
+        while not cluster.hosts["a:8188"].unresponsive:
+            time.sleep(0.01)
+        cluster.hosts["b:8188"].unresponsive = False
+        _, name = job.future.result(timeout=5)
+        cluster.close()
+
+        self.assertEqual(name, "cat.png")
+        self.assertEqual(job.retries, 1)
+        self.assertEqual(FakeComfyGenerator.calls, ["a:8188", "b:8188"])
+        metrics = cluster.get_metrics()["hosts"]
+        self.assertEqual(metrics["a:8188"]["jobs_failed"], 1)
+        self.assertEqual(metrics["a:8188"]["retries"], 1)
+        self.assertEqual(metrics["b:8188"]["jobs_finished"], 1)
+
+    def test_metrics_endpoint_serves_prometheus_text(self):
+        """
+        The metrics server should expose counters and histograms per host.
+        """
+        cluster = ComfyClusterGenerator(self.workflow_apiformat_json)
+        cluster.hosts = {"a:8188": ComfyHostWorker(cluster, "a:8188", 1)}
+        cluster.metrics.record_job_started("a:8188", 0.2)
+        cluster.metrics.record_job_finished("a:8188", 3.0)
+
+        server = start_metrics_server(cluster.metrics_as_prometheus_text, port=0)
+        try:
+            with urllib.request.urlopen(
+                f"http://127.0.0.1:{server.server_address[1]}/metrics", timeout=5
+            ) as response:
+                text = response.read().decode("utf-8")
+        finally:
+            server.shutdown()
+
+        self.assertIn('pixaris_comfy_jobs_finished_total{host="a:8188"} 1', text)
+        self.assertIn('pixaris_comfy_hosts{state="idle"} 1', text)
+        self.assertIn(
+            'pixaris_comfy_generation_latency_seconds_bucket{host="a:8188",le="5"} 1',
+            text,
+        )
+        self.assertIn("pixaris_comfy_acquisition_wait_seconds_count 1", text)
+
+    def test_close_stops_background_task_and_frees_metrics_port(self):
+        """
+        A closed cluster should not keep threads or its metrics port, the next cluster may use the same port.
+        """
+        cluster = ComfyClusterGenerator(self.workflow_apiformat_json)
+        cluster.metrics_server = start_metrics_server(
+            cluster.metrics_as_prometheus_text, port=0
+        )
+        port = cluster.metrics_server.server_address[1]
+        cluster.run_background_task = True
+        with patch.object(ComfyClusterGenerator, "update_available_hosts"):
+            cluster.start_background_task()
+            cluster.close()
+            cluster.background_task.join(timeout=5)
+        self.assertFalse(cluster.background_task.is_alive())
+
+        server = start_metrics_server(cluster.metrics_as_prometheus_text, port=port)
+        server.shutdown()
+        server.server_close()
+
+
+if __name__ == "__main__":
+    unittest.main()
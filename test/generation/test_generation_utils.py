@@ -5,7 +5,9 @@ import io
 from pixaris.generation.utils import (
     encode_image_to_bytes,
     extract_value_from_list_of_dicts,
+    open_encoded_image,
 )
+from pixaris.utils.encoding import get_encoded_bytes
 
 
 class TestGenerationUtils(unittest.TestCase):
@@ -108,6 +110,16 @@ class TestGenerationUtils(unittest.TestCase):
                 dict_list, identifying_key, identifying_value, return_key
             )
 
+    def test_open_encoded_image_keeps_bytes_until_changed(self):
+        with open("test/test_project/mock/mask/cat.png", "rb") as f:
+            data = f.read()
+        image = open_encoded_image(data)
+        self.assertEqual(get_encoded_bytes(image, "PNG"), data)
+        self.assertIsNone(get_encoded_bytes(image, "JPEG"))
+        self.assertIsNone(get_encoded_bytes(image.convert("RGB"), "PNG"))
+        image.thumbnail((64, 64))
+        self.assertIsNone(get_encoded_bytes(image, "PNG"))
+
 
 if __name__ == "__main__":
     unittest.main()
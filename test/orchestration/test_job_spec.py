@@ -0,0 +1,94 @@
+import json
+import os
+import pickle
+import unittest
+
+from PIL import Image
+
+from pixaris.data_loaders.local import LocalDatasetLoader
+from pixaris.metrics.iou import IoUMetric
+from pixaris.orchestration.job_spec import create_job_spec, load_job_spec
+
+
+class TestJobSpec(unittest.TestCase):
+    def setUp(self):
+        self.data_loader = LocalDatasetLoader(
+            project="test_project", dataset="mock", eval_dir_local="test"
+        )
+        self.dataset = self.data_loader.load_dataset()
+        with open(
+            os.getcwd() + "/test/assets/test-just-load-and-save_apiformat.json", "r"
+        ) as file:
+            self.workflow_apiformat_json = json.load(file)
+        self.mask_images = [
+            image["pillow_image"]
+            for item in self.dataset
+            for image in item["pillow_images"]
+            if image["node_name"] == "Load Mask Image"
+        ]
+        for mask_image in self.mask_images:
+            mask_image.load()  # decoded images are what made the old pickles large
+
+        self.inputs = {
+            "data_loader": self.data_loader,
+            "metrics": [IoUMetric(reference_images=self.mask_images)],
+            "args": {
+                "workflow_apiformat_json": self.workflow_apiformat_json,
+                "workflow_pillow_image": Image.new("RGB", (64, 64), color="red"),
+                "experiment_run_name": "testrun",
+            },
+        }
+
+    def test_dataset_images_are_sent_as_references(self):
+        """
+        The job spec should be much smaller than pickling the decoded images.
+        """
+        job_spec = create_job_spec(self.inputs)
+        self.assertLess(len(job_spec), len(pickle.dumps(self.mask_images)) / 10)
+
+    def test_round_trip_restores_images_and_args(self):
+        """
+        Loading the spec should give the same pixels, file names and arguments.
+        """
+        inputs = load_job_spec(create_job_spec(self.inputs))
+
+        self.assertEqual(inputs["args"]["experiment_run_name"], "testrun")
+        self.assertEqual(
+            inputs["args"]["workflow_apiformat_json"], self.workflow_apiformat_json
+        )
+        self.assertEqual(
+            inputs["args"]["workflow_pillow_image"].tobytes(),
+            Image.new("RGB", (64, 64), color="red").tobytes(),
+        )
+        self.assertEqual(inputs["data_loader"].dataset, "mock")
+
+        restored_masks = inputs["metrics"][0].reference_images
+        self.assertEqual(len(restored_masks), len(self.mask_images))
+        for restored, original in zip(restored_masks, self.mask_images):
+            self.assertEqual(
+                os.path.basename(restored.filename), os.path.basename(original.filename)
+            )
+            self.assertEqual(restored.tobytes(), original.tobytes())
+
+    def test_images_changed_in_place_are_sent_encoded(self):
+        """
+        A dataset image whose pixels changed since it was loaded should not be sent as a reference to its file.
+        """
+        self.mask_images[0].paste(0, (0, 0, 4, 4))
+
+        inputs = load_job_spec(create_job_spec(self.inputs))
+
+        restored_masks = inputs["metrics"][0].reference_images
+        self.assertEqual(restored_masks[0].tobytes(), self.mask_images[0].tobytes())
+        self.assertEqual(restored_masks[1].tobytes(), self.mask_images[1].tobytes())
+
+    def test_load_rejects_other_pickles(self):
+        """
+        Plain pickles from older clients should not be mistaken for job specs.
+        """
+        with self.assertRaisesRegex(ValueError, "not a pixaris job spec"):
+            load_job_spec(pickle.dumps({"args": {}}))
+
+
+if __name__ == "__main__":
+    unittest.main()
@@ -0,0 +1,108 @@
+import unittest
+from unittest.mock import MagicMock
+
+from pixaris.orchestration.kubernetes import ComfyDeploymentAutoscaler
+
+
+class TestComfyDeploymentAutoscaler(unittest.TestCase):
+    def setUp(self):
+        self.apps_v1_api = MagicMock()
+        self.apps_v1_api.read_namespaced_deployment_scale.return_value.spec.replicas = 2
+        self.autoscaler = ComfyDeploymentAutoscaler(
+            self.apps_v1_api,
+            target_completion_seconds=600,
+            max_replicas=8,
+            seconds_per_image=60,
+        )
+
+    def test_desired_replicas_from_pending_work(self):
+        """
+        100 images at 30 s each in 10 minutes need 5 replicas.
+        """
+        self.assertEqual(self.autoscaler.desired_replicas(100, 30, 600), 5)
+
+    def test_desired_replicas_is_capped(self):
+        """
+        Never more than max_replicas and never more replicas than pending images.
+        """
+        self.assertEqual(self.autoscaler.desired_replicas(1000, 60, 60), 8)
+        self.assertEqual(self.autoscaler.desired_replicas(2, 60, 1), 2)
+        self.assertEqual(self.autoscaler.desired_replicas(3, 60, -5), 3)
+
+    def test_desired_replicas_without_pending_work(self):
+        """
+        Scale to min_replicas when the queue is empty, keep one replica while work is left.
+        """
+        self.assertEqual(self.autoscaler.desired_replicas(0, 60, 600), 0)
+        self.assertEqual(self.autoscaler.desired_replicas(1, 1, 600), 1)
+
+    def test_step_scales_down_as_queue_drains(self):
+        """
+        The deployment should be patched once per change of the desired replicas, never below the pending images
+        while busy replicas are unknown, and get its initial scale back on stop.
+        """
+        self.assertIsNone(self.autoscaler.step())
+        self.apps_v1_api.patch_namespaced_deployment_scale.assert_not_called()
+
+        self.autoscaler.update_progress(
+            {"total": 100, "done": 0, "failed": 0, "mean_seconds_per_image": None}
+        )
+        self.assertEqual(self.autoscaler.step(), 8)
+        self.assertEqual(self.autoscaler.step(), 8)
+
+        self.autoscaler.update_progress(
+            {"total": 100, "done": 96, "failed": 1, "mean_seconds_per_image": 60}
+        )
+        self.assertEqual(self.autoscaler.step(), 3)
+
+        self.autoscaler.stop()
+        self.assertEqual(
+            [
+                call.args
+                for call in self.apps_v1_api.patch_namespaced_deployment_scale.call_args_list
+            ],
+            [
+                ("comfy-ui-deployment", "batch", {"spec": {"replicas": 8}}),
+                ("comfy-ui-deployment", "batch", {"spec": {"replicas": 3}}),
+                ("comfy-ui-deployment", "batch", {"spec": {"replicas": 2}}),
+            ],
+        )
+
+    def test_step_keeps_busy_replicas(self):
+        """
+        Replicas that are generating should not be removed, the idle ones should.
+        """
+        busy_replicas = 5
+        self.autoscaler.measure_busy_replicas = lambda: busy_replicas
+        self.autoscaler.update_progress(
+            {"total": 100, "done": 0, "failed": 0, "mean_seconds_per_image": None}
+        )
+        self.assertEqual(self.autoscaler.step(), 8)
+
+        self.autoscaler.update_progress(
+            {"total": 100, "done": 90, "failed": 0, "mean_seconds_per_image": 1}
+        )
+        self.assertEqual(self.autoscaler.step(), 5)
+        busy_replicas = 0
+        self.assertEqual(self.autoscaler.step(), 1)
+
+    def test_stop_without_scaling_leaves_the_deployment(self):
+        """
+        A run that never scaled should not touch the deployment on stop.
+        """
+        self.autoscaler.stop()
+        self.apps_v1_api.patch_namespaced_deployment_scale.assert_not_called()
+
+    def test_step_prefers_measured_latency(self):
+        """
+        A measured latency should replace the duration reported by the progress.
+        """
+        self.autoscaler.measure_seconds_per_image = lambda: 3
+        self.autoscaler.update_progress(
+            {"total": 100, "done": 0, "failed": 0, "mean_seconds_per_image": 600}
+        )
+        self.assertEqual(self.autoscaler.step(), 1)
+
+
+if __name__ == "__main__":
+    unittest.main()
@@ -0,0 +1,115 @@
+import hashlib
+import os
+import pickle
+import tempfile
+import time
+import unittest
+from unittest.mock import MagicMock, patch
+
+from pixaris.orchestration.kubernetes import (
+    _next_queued_job_spec,
+    _pick_orchestrator_pod,
+    _process_queued_job_spec,
+    _run_remote_evaluation,
+)
+
+
+def queue_job_spec(queue_dir, job_id, payload, checksum=None, complete=True):
+    path = os.path.join(queue_dir, f"{job_id}.pkl")
+    with open(path, "wb") as f:
+        f.write(payload)
+    with open(f"{path}.sha256", "w") as f:
+        f.write(checksum or hashlib.sha256(payload).hexdigest())
+    if complete:
+        open(f"{path}.done", "w").close()
+    return path
+
+
+class TestOrchestratorQueue(unittest.TestCase):
+    def setUp(self):
+        self.tmp_dir = tempfile.TemporaryDirectory()
+        self.queue_dir = self.tmp_dir.name
+
+    def tearDown(self):
+        self.tmp_dir.cleanup()
+
+    def test_next_job_spec_is_oldest_complete_upload(self):
+        self.assertIsNone(_next_queued_job_spec(self.queue_dir))
+        queue_job_spec(self.queue_dir, "incomplete", b"spec", complete=False)
+        self.assertIsNone(_next_queued_job_spec(self.queue_dir))
+
+        first = queue_job_spec(self.queue_dir, "first", b"spec")
+        later = time.time() + 10
+        second = queue_job_spec(self.queue_dir, "second", b"spec")
+        os.utime(f"{second}.done", (later, later))
+        self.assertEqual(_next_queued_job_spec(self.queue_dir), first)
+
+    @patch("pixaris.orchestration.kubernetes._run_remote_evaluation")
+    @patch("pixaris.orchestration.kubernetes.load_job_spec")
+    def test_process_runs_job_and_cleans_up(self, mock_load_job_spec, mock_run):
+        path = queue_job_spec(self.queue_dir, "testrun-abc123", pickle.dumps({}))
+        _process_queued_job_spec(path)
+
+        mock_run.assert_called_once_with(
+            mock_load_job_spec.return_value, job_id="testrun-abc123"
+        )
+        self.assertEqual(os.listdir(self.queue_dir), [])
+
+    @patch("pixaris.orchestration.kubernetes._publish_progress_event")
+    @patch("pixaris.orchestration.kubernetes._run_remote_evaluation")
+    def test_process_reports_corrupted_job_spec(self, mock_run, mock_publish):
+        """
+        A job spec that does not match its checksum should fail without stopping the worker.
+        """
+        path = queue_job_spec(self.queue_dir, "broken", b"spec", checksum="0" * 64)
+        _process_queued_job_spec(path)
+
+        mock_run.assert_not_called()
+        event = mock_publish.call_args.args[0]
+        self.assertEqual((event["status"], event["job_id"]), ("failed", "broken"))
+        self.assertEqual(os.listdir(self.queue_dir), [])
+
+    @patch("pixaris.orchestration.kubernetes._publish_progress_event")
+    @patch("pixaris.orchestration.kubernetes.generate_images_based_on_dataset")
+    def test_generator_is_closed_after_each_job(self, mock_generate, mock_publish):
+        """
+        The generator of a job should be closed even if the job failed, workers run many jobs.
+        """
+        mock_generate.side_effect = RuntimeError("generation failed")
+        inputs = {
+            "data_loader": MagicMock(),
+            "image_generator": MagicMock(),
+            "experiment_handler": MagicMock(),
+            "metrics": [],
+            "args": {"experiment_run_name": "run"},
+        }
+        with self.assertRaises(RuntimeError):
+            _run_remote_evaluation(inputs, job_id="job")
+        inputs["image_generator"].close.assert_called_once()
+
+
+class TestPickOrchestratorPod(unittest.TestCase):
+    @staticmethod
+    def pod(name, phase, deleting=False):
+        pod = MagicMock()
+        pod.metadata.name = name
+        pod.metadata.deletion_timestamp = "now" if deleting else None
+        pod.status.phase = phase
+        return pod
+
+    def test_picks_running_pod(self):
+        core_v1 = MagicMock()
+        core_v1.list_namespaced_pod.return_value.items = [
+            self.pod("pending", "Pending"),
+            self.pod("terminating", "Running", deleting=True),
+            self.pod("running", "Running"),
+        ]
+        self.assertEqual(_pick_orchestrator_pod(core_v1), "running")
+
+        core_v1.list_namespaced_pod.return_value.items = []
+        with self.assertRaisesRegex(ValueError, "ensure_orchestrator_pool"):
+            _pick_orchestrator_pod(core_v1)
+
+
+if __name__ == "__main__":
+    unittest.main()
@@ -0,0 +1,74 @@
+import json
+import unittest
+from unittest.mock import MagicMock, patch
+
+from pixaris.orchestration.kubernetes import (
+    PROGRESS_EVENT_PREFIX,
+    _build_progress_event,
+    _format_progress_bar,
+    follow_remote_progress,
+)
+
+
+def log_line(event):
+    return PROGRESS_EVENT_PREFIX + json.dumps(event)
+
+
+class TestRemoteProgress(unittest.TestCase):
+    def test_build_progress_event_estimates_remaining_time(self):
+        """
+        The ETA should account for the images generated in parallel.
+        """
+        image_generator = MagicMock(spec=["generate_single_image"])
+        event = _build_progress_event(
+            {"total": 10, "done": 3, "failed": 1, "mean_seconds_per_image": 20},
+            2,
+            image_generator,
+        )
+        self.assertEqual(event["status"], "running")
+        self.assertEqual(event["eta_seconds"], 60)
+        self.assertIsNone(event["generator_metrics"])
+
+    def test_format_progress_bar(self):
+        line = _format_progress_bar(
+            {"total": 10, "done": 4, "failed": 1, "eta_seconds": 75}, width=10
+        )
+        self.assertEqual(line, "[#####-----] 5/10 images, 1 failed, ETA 1m 15s")
+
+    @patch("pixaris.orchestration.kubernetes.watch.Watch")
+    @patch("builtins.print")
+    def test_follow_returns_final_event(self, mock_print, mock_watch):
+        """
+        Progress events should be passed on, other log lines ignored.
+        """
+        running = {
+            "status": "running",
+            "total": 2,
+            "done": 1,
+            "failed": 0,
+            "eta_seconds": None,
+        }
+        stored = {"status": "stored", "experiment_run_name": "testrun", "images": 2}
+        mock_watch.return_value.stream.return_value = iter(
+            ["Starting generation...", log_line(running), log_line(stored)]
+        )
+        events = []
+        result = follow_remote_progress(MagicMock(), "pod", on_event=events.append)
+        self.assertEqual(result, stored)
+        self.assertEqual(events, [running, stored])
+
+    @patch("pixaris.orchestration.kubernetes.watch.Watch")
+    def test_follow_raises_on_failure(self, mock_watch):
+        mock_watch.return_value.stream.return_value = iter(
+            [log_line({"status": "failed", "error_message": "Test"})]
+        )
+        with self.assertRaisesRegex(ValueError, "Remote run failed: Test"):
+            follow_remote_progress(MagicMock(), "pod", show_progress_bar=False)
+
+        mock_watch.return_value.stream.return_value = iter(["Starting generation..."])
+        with self.assertRaisesRegex(ValueError, "ended before"):
+            follow_remote_progress(MagicMock(), "pod", show_progress_bar=False)
+
+
+if __name__ == "__main__":
+    unittest.main()
@@ -0,0 +1,198 @@
+import hashlib
+import io
+import os
+import shutil
+import subprocess
+import tempfile
+import time
+import unittest
+from unittest.mock import MagicMock, patch
+
+from pixaris.orchestration.kubernetes import (
+    _encode_input_frame,
+    _read_input_frame,
+    _read_verified_upload,
+    _wait_for_job_pod,
+    copy_bytes_to_pod,
+)
+
+
+class TarExecStream:
+    """
+    Runs the exec command of an upload, i.e. tar, locally and forwards what is written to its stdin.
+    Like the websocket of an exec, closing it closes stdin without waiting for the process.
+    """
+
+    def __init__(self, command):
+        self.process = subprocess.Popen(command, stdin=subprocess.PIPE)
+        self.chunks = 0
+
+    def write_stdin(self, data):
+        self.process.stdin.write(data)
+        self.chunks += 1
+
+    def update(self, timeout=0):
+        pass
+
+    def peek_stderr(self):
+        return False
+
+    def close(self):
+        self.process.stdin.close()
+
+
+class TestCopyBytesToPod(unittest.TestCase):
+    def setUp(self):
+        self.data = os.urandom(300 * 1024)
+        self.tmp_dir = tempfile.mkdtemp()
+        self.dest_path = os.path.join(self.tmp_dir, "input.pkl")
+        self.uploads = []
+
+    def tearDown(self):
+        for upload in self.uploads:
+            upload.process.wait(timeout=10)
+        shutil.rmtree(self.tmp_dir)
+
+    def fake_stream(self, corrupt_first_check=False):
+        def stream(*args, **kwargs):
+            if kwargs["stdin"]:
+                self.uploads.append(TarExecStream(kwargs["command"]))
+                return self.uploads[-1]
+            output = subprocess.run(
+                kwargs["command"], capture_output=True, text=True, timeout=70
+            ).stdout
+            if corrupt_first_check and len(self.uploads) == 1:
+                return "0" * 64 + output[64:]
+            return output
+
+        return stream
+
+    def test_streams_file_checksum_and_marker(self):
+        """
+        The tar stream should be sent in chunks and extracted completely before the checksum is checked.
+        """
+        start = time.monotonic()
+        with patch("pixaris.orchestration.kubernetes.stream", self.fake_stream()):
+            copy_bytes_to_pod(
+                MagicMock(),
+                "batch",
+                "pod",
+                self.data,
+                self.dest_path,
+                chunk_size=1024,
+            )
+
+        self.assertLess(time.monotonic() - start, 30)
+        self.assertEqual(len(self.uploads), 1)
+        self.assertGreater(self.uploads[0].chunks, 1)
+        with open(self.dest_path, "rb") as f:
+            self.assertEqual(f.read(), self.data)
+        with open(f"{self.dest_path}.sha256") as f:
+            self.assertEqual(f.read(), hashlib.sha256(self.data).hexdigest())
+        self.assertTrue(os.path.exists(f"{self.dest_path}.done"))
+
+    def test_retries_on_checksum_mismatch(self):
+        """
+        An upload whose checksum on the pod does not match should be sent again.
+        """
+        with patch(
+            "pixaris.orchestration.kubernetes.stream",
+            self.fake_stream(corrupt_first_check=True),
+        ):
+            copy_bytes_to_pod(MagicMock(), "batch", "pod", self.data, self.dest_path)
+        self.assertEqual(len(self.uploads), 2)
+
+
+class TestReadVerifiedUpload(unittest.TestCase):
+    def test_rejects_corrupted_upload(self):
+        """
+        A file that does not match its checksum should be discarded, a valid one returned.
+        """
+        with tempfile.TemporaryDirectory() as tmp_dir:
+            path = os.path.join(tmp_dir, "input.pkl")
+            with open(path, "wb") as f:
+                f.write(b"truncated")
+            with open(f"{path}.sha256", "w") as f:
+                f.write(hashlib.sha256(b"complete").hexdigest())
+            open(f"{path}.done", "w").close()
+
+            with self.assertRaisesRegex(ValueError, "Timeout"):
+                _read_verified_upload(path, wait_seconds=0, max_wait_cycles=2)
+            self.assertFalse(os.path.exists(f"{path}.done"))
+
+            with open(path, "wb") as f:
+                f.write(b"complete")
+            open(f"{path}.done", "w").close()
+            self.assertEqual(
+                _read_verified_upload(path, wait_seconds=0, max_wait_cycles=1),
+                b"complete",
+            )
+
+
+class TestInputFrame(unittest.TestCase):
+    def test_round_trip(self):
+        """
+        The payload should be read back from a stream that delivers it in pieces.
+        """
+        payload = os.urandom(100 * 1024)
+        stream = io.BufferedReader(io.BytesIO(_encode_input_frame(payload)), 4096)
+        self.assertEqual(_read_input_frame(stream), payload)
+
+    def test_rejects_incomplete_and_corrupted_frames(self):
+        frame = _encode_input_frame(b"job spec")
+        with self.assertRaisesRegex(ValueError, "ended before"):
+            _read_input_frame(io.BytesIO(frame[:-1]))
+        with self.assertRaisesRegex(ValueError, "Checksum"):
+            _read_input_frame(io.BytesIO(frame[:-1] + b"X"))
+        with self.assertRaisesRegex(ValueError, "does not start"):
+            _read_input_frame(io.BytesIO(b"X" + frame[1:]))
+
+    def test_times_out_when_the_frame_does_not_arrive(self):
+        """
+        An interrupted handoff leaves stdin open, the read should give up instead of blocking the pod forever.
+        """
+        read_fd, write_fd = os.pipe()
+        frame = _encode_input_frame(b"job spec")
+        os.write(write_fd, frame[:10])
+        with open(read_fd, "rb") as stream:
+            with self.assertRaisesRegex(ValueError, "Timeout"):
+                _read_input_frame(stream, timeout=0.2)
+            os.close(write_fd)
+
+    def test_fails_fast_on_end_of_stream(self):
+        frame = _encode_input_frame(b"job spec")
+        start = time.monotonic()
+        with self.assertRaisesRegex(ValueError, "ended before"):
+            _read_input_frame(io.BytesIO(frame[:10]), timeout=60)
+        self.assertLess(time.monotonic() - start, 10)
+        self.assertEqual(_read_input_frame(io.BytesIO(frame), timeout=60), b"job spec")
+
+
+class TestWaitForJobPod(unittest.TestCase):
+    @staticmethod
+    def pod_event(phase):
+        pod = MagicMock()
+        pod.metadata.name = "evaluation-pod"
+        pod.status.phase = phase
+        return {"type": "MODIFIED", "object": pod}
+
+    @patch("pixaris.orchestration.kubernetes.watch.Watch")
+    def test_returns_running_pod(self, mock_watch):
+        mock_watch.return_value.stream.return_value = iter(
+            [self.pod_event("Pending"), self.pod_event("Running")]
+        )
+        self.assertEqual(_wait_for_job_pod(MagicMock(), "job"), "evaluation-pod")
+        mock_watch.return_value.stop.assert_called_once()
+
+    @patch("pixaris.orchestration.kubernetes.watch.Watch")
+    def test_raises_on_failed_pod_and_timeout(self, mock_watch):
+        mock_watch.return_value.stream.return_value = iter([self.pod_event("Failed")])
+        with self.assertRaisesRegex(ValueError, "failed"):
+            _wait_for_job_pod(MagicMock(), "job")
+        mock_watch.return_value.stream.return_value = iter([])
+        with self.assertRaisesRegex(ValueError, "Timeout"):
+            _wait_for_job_pod(MagicMock(), "job")
+
+
+if __name__ == "__main__":
+    unittest.main()
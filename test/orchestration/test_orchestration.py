@@ -1,6 +1,6 @@
 import json
 import shutil
-from unittest.mock import patch
+from unittest.mock import MagicMock, patch
 from PIL import Image
 from pixaris.experiment_handlers.local import LocalExperimentHandler
 from pixaris.generation.comfyui import ComfyGenerator
@@ -132,11 +132,21 @@ class TestOrchestration(unittest.TestCase):
             (Image.new("RGB", (100, 100), color="red"), "correct.png"),
             Exception("Test"),
         ]
+        progress = []
         images = generate_images_based_on_dataset(
-            mock_loader, generator, experiment_handler, [], args
+            mock_loader,
+            generator,
+            experiment_handler,
+            [],
+            args,
+            progress_callback=progress.append,
         )
         mock_print.assert_any_call("Failed to generate images for 1 of 2.")
         self.assertEqual(len(images), 1)
+        self.assertEqual(
+            [(p["total"], p["done"], p["failed"]) for p in progress],
+            [(2, 0, 0), (2, 1, 0), (2, 1, 1)],
+        )
 
         tearDown()
 
@@ -204,6 +214,53 @@ class TestOrchestration(unittest.TestCase):
 
         tearDown()
 
+    def test_invalid_items(self):
+        """
+        An invalid item should stop the run before anything is stored, unless invalid items are skipped.
+        """
+
+        def validate(dataset, args):
+            if not dataset[0]["valid"]:
+                raise ValueError("invalid item")
+
+        experiment_handler = MagicMock()
+        generator = MagicMock()
+        generator.validate_inputs_and_parameters.side_effect = validate
+        generator.generate_single_image.side_effect = lambda args: (
+            Image.new("RGB", (10, 10)),
+            args["name"],
+        )
+        loader = MagicMock()
+        loader.load_dataset.return_value = [
+            {"name": "first.png", "valid": True},
+            {"name": "second.png", "valid": False},
+            {"name": "third.png", "valid": True},
+        ]
+        args = {
+            "project": "test_project",
+            "dataset": "test_dataset",
+            "experiment_run_name": "testrun",
+        }
+
+        with self.assertRaisesRegex(ValueError, "invalid item"):
+            generate_images_based_on_dataset(
+                loader, generator, experiment_handler, [], args
+            )
+        experiment_handler.store_results.assert_not_called()
+
+        progress = []
+        images = generate_images_based_on_dataset(
+            loader,
+            generator,
+            experiment_handler,
+            [],
+            {**args, "skip_invalid_items": True},
+            progress_callback=progress.append,
+        )
+        self.assertEqual([name for _, name in images], ["first.png", "third.png"])
+        self.assertEqual(progress[-1]["failed"], 1)
+        experiment_handler.store_results.assert_called_once()
+
 
 if __name__ == "__main__":
     unittest.main()
@@ -0,0 +1,234 @@
+import json
+import os
+import pickle
+import time
+import unittest
+from unittest.mock import MagicMock, patch
+
+from google.api_core.exceptions import PreconditionFailed
+from PIL import Image
+
+from pixaris.data_loaders.local import LocalDatasetLoader
+from pixaris.orchestration.base import (
+    generate_images_for_shard,
+    merge_shard_results,
+)
+from pixaris.orchestration.kubernetes import (
+    REDUCE_LOCK_TIMEOUT_SECONDS,
+    _reduce_if_last_shard,
+)
+
+
+def fake_generate_single_image(args):
+    """
+    Names every image after its input and the first hyperparameter value.
+    """
+    input_image = args["pillow_images"][0]["pillow_image"]
+    value = args.get("generation_params", [{"value": "none"}])[0]["value"]
+    name = f"{value}-{os.path.basename(input_image.filename)}"
+    if name == "2-doggo.png":
+        raise ValueError("Test")
+    return Image.new("RGB", (8, 8), color="red"), name
+
+
+class TestShardedOrchestration(unittest.TestCase):
+    def setUp(self):
+        self.data_loader = LocalDatasetLoader(
+            project="test_project", dataset="mock", eval_dir_local="test"
+        )
+        self.image_generator = MagicMock()
+        self.image_generator.generate_single_image.side_effect = (
+            fake_generate_single_image
+        )
+        self.args = {
+            "project": "test_project",
+            "dataset": "mock",
+            "experiment_run_name": "testrun",
+            "hyperparameters": [
+                {"node_name": "KSampler", "input": "seed", "value": [1, 2]}
+            ],
+        }
+
+    def generate_shards(self, shard_count):
+        return [
+            generate_images_for_shard(
+                self.data_loader, self.image_generator, self.args, index, shard_count
+            )
+            for index in range(shard_count)
+        ]
+
+    def test_shards_split_dataset_and_grid(self):
+        """
+        Every combination of grid point and image should be generated by exactly one shard.
+        """
+        shard_results = self.generate_shards(3)
+
+        work_items = [
+            (result["grid_index"], result["item_index"])
+            for shard in shard_results
+            for result in shard["results"]
+        ]
+        self.assertEqual(len(work_items), 7)
+        self.assertEqual(len(set(work_items)), 7)
+        self.assertEqual(sum(len(shard["failed"]) for shard in shard_results), 1)
+        self.assertEqual(self.image_generator.generate_single_image.call_count, 8)
+
+    def test_shards_load_only_their_items(self):
+        """
+        Without hyperparameters, a shard should only load its share of the dataset.
+        """
+        del self.args["hyperparameters"]
+        load_dataset = LocalDatasetLoader.load_dataset
+        loaded = []
+
+        def record_load_dataset(loader):
+            items = load_dataset(loader)
+            loaded.append(len(items))
+            return items
+
+        with patch.object(
+            LocalDatasetLoader,
+            "load_dataset",
+            autospec=True,
+            side_effect=record_load_dataset,
+        ):
+            shard_results = self.generate_shards(2)
+
+        self.assertEqual(loaded, [2, 2])
+        self.assertEqual(
+            [
+                [result["item_index"] for result in shard["results"]]
+                for shard in shard_results
+            ],
+            [[0, 2], [1, 3]],
+        )
+
+    def test_shards_load_their_items_at_once(self):
+        """
+        A shard that needs items of several residues should still load the dataset once.
+        """
+        load_dataset = LocalDatasetLoader.load_dataset
+        loaded = []
+
+        def record_load_dataset(loader):
+            items = load_dataset(loader)
+            loaded.append(len(items))
+            return items
+
+        with patch.object(
+            LocalDatasetLoader,
+            "load_dataset",
+            autospec=True,
+            side_effect=record_load_dataset,
+        ):
+            shard_results = self.generate_shards(3)
+
+        # the first shard needs the items 0, 1 and 3, the second 0, 2 and 3, the last 1 and 2
+        self.assertEqual(loaded, [3, 3, 2])
+        self.assertEqual(
+            [
+                sorted({result["item_index"] for result in shard["results"]})
+                for shard in shard_results
+            ],
+            [[0, 1, 3], [0, 2, 3], [1]],  # item 2 of the last shard fails
+        )
+
+    def test_merge_stores_one_run_per_grid_point(self):
+        """
+        The merged runs should be in dataset order and the metrics calculated over all images of a run.
+        """
+        experiment_handler = MagicMock()
+        metric = MagicMock()
+        metric.calculate.side_effect = lambda images: {"count": len(images)}
+
+        merged_runs = merge_shard_results(
+            list(reversed(self.generate_shards(3))),
+            experiment_handler,
+            [metric],
+            self.args,
+        )
+
+        self.assertEqual(list(merged_runs), ["hs-testrun-0", "hs-testrun-1"])
+        self.assertEqual(
+            [name for _, name in merged_runs["hs-testrun-0"]],
+            [
+                "1-"
+                + os.path.basename(item["pillow_images"][0]["pillow_image"].filename)
+                for item in self.data_loader.load_dataset()
+            ],
+        )
+        stored = experiment_handler.store_results.call_args_list
+        self.assertEqual(len(stored), 2)
+        self.assertEqual(stored[0].kwargs["metric_values"], {"count": 4})
+        self.assertEqual(stored[1].kwargs["metric_values"], {"count": 3})
+        self.assertEqual(stored[1].kwargs["args"]["generation_params"][0]["value"], 2)
+
+    def test_merge_requires_all_shards(self):
+        """
+        Merging without all shards would store incomplete runs.
+        """
+        shard_results = self.generate_shards(3)
+        with self.assertRaisesRegex(ValueError, "Expected the results of 3 shards"):
+            merge_shard_results(shard_results[:2], MagicMock(), [], self.args)
+
+    def reduce_bucket(self, shard_count):
+        bucket = MagicMock()
+        bucket.list_blobs.return_value = [
+            MagicMock(download_as_bytes=MagicMock(return_value=pickle.dumps(shard)))
+            for shard in self.generate_shards(shard_count)
+        ]
+        return bucket
+
+    def hold_lock(self, bucket, **lock):
+        bucket.blob.return_value.upload_from_string.side_effect = [
+            PreconditionFailed("exists"),
+            None,
+            None,
+        ]
+        bucket.get_blob.return_value.download_as_bytes.return_value = json.dumps(
+            lock
+        ).encode()
+
+    def test_only_one_shard_reduces(self):
+        """
+        Only the shard that creates the reduce lock should merge the results.
+        """
+        bucket = self.reduce_bucket(2)
+        inputs = {"experiment_handler": MagicMock(), "metrics": [], "args": self.args}
+
+        self.assertTrue(_reduce_if_last_shard(bucket, "prefix", 2, inputs, 0))
+        lock = json.loads(bucket.blob.return_value.upload_from_string.call_args.args[0])
+        self.assertEqual((lock["shard_index"], lock["done"]), (0, True))
+
+        self.hold_lock(bucket, **lock)
+        self.assertFalse(_reduce_if_last_shard(bucket, "prefix", 2, inputs, 1))
+        self.hold_lock(bucket, shard_index=0, created=time.time())
+        self.assertFalse(_reduce_if_last_shard(bucket, "prefix", 2, inputs, 1))
+        self.assertFalse(_reduce_if_last_shard(bucket, "prefix", 3, inputs, 1))
+        self.assertEqual(inputs["experiment_handler"].store_results.call_count, 2)
+
+    def test_crashed_reduce_is_taken_over(self):
+        """
+        A lock left by a crashed merge should be taken over by the retry of its shard or once it is stale.
+        """
+        bucket = self.reduce_bucket(2)
+        inputs = {"experiment_handler": MagicMock(), "metrics": [], "args": self.args}
+
+        self.hold_lock(bucket, shard_index=0, created=time.time())
+        self.assertTrue(_reduce_if_last_shard(bucket, "prefix", 2, inputs, 0))
+        self.assertEqual(
+            bucket.blob.return_value.upload_from_string.call_args_list[1].kwargs,
+            {"if_generation_match": bucket.get_blob.return_value.generation},
+        )
+
+        self.hold_lock(
+            bucket,
+            shard_index=0,
+            created=time.time() - REDUCE_LOCK_TIMEOUT_SECONDS - 1,
+        )
+        self.assertTrue(_reduce_if_last_shard(bucket, "prefix", 2, inputs, 1))
+        self.assertEqual(inputs["experiment_handler"].store_results.call_count, 4)
+
+
+if __name__ == "__main__":
+    unittest.main()